@@ -0,0 +1,82 @@
+# backend/benchmarks/bench_trail_statistics.py
+# 统计引擎的基准测试：随机生成 1 万 ~ 20 万个点的轨迹，
+# 对比 NumPy 向量化引擎与逐个城市计算的纯 Python 实现，并校验两者结果一致。
+# 运行: python -m backend.benchmarks.bench_trail_statistics [点数 ...]
+
+import math
+import random
+import sys
+import time
+from typing import Any, Dict, List
+
+from ..business_logic_layer.trail_statistics import cities_to_columns, compute_trail_statistics
+from ..data_access_layer.trail_aggregates import EARTH_RADIUS_KM, transport_mode_key, visit_month_key
+
+TRANSPORT_MODES = ("plane", "train", "car", "walk", None)
+COUNTRIES = ("中国", "日本", "法国", "意大利", "美国", "澳大利亚")
+
+
+def make_trail(size: int, seed: int = 42) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    return [
+        {
+            "city": f"城市{rng.randrange(size // 4 + 1)}",
+            "country": rng.choice(COUNTRIES),
+            "latitude": rng.uniform(-60, 70),
+            "longitude": rng.uniform(-180, 180),
+            "transport_mode": rng.choice(TRANSPORT_MODES),
+            "visit_date": f"{rng.randint(2000, 2025)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T08:00:00",
+        }
+        for _ in range(size)
+    ]
+
+
+def python_statistics(cities: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """逐个城市计算的纯 Python 实现 (对照组，相当于客户端在完整城市列表上的计算)。"""
+    distances: Dict[str, float] = {}
+    countries: Dict[str, int] = {}
+    months: Dict[str, int] = {}
+    unique_cities = set()
+    for i, city in enumerate(cities):
+        countries[city["country"]] = countries.get(city["country"], 0) + 1
+        unique_cities.add((city["city"], city["country"]))
+        month = visit_month_key(city)
+        if month:
+            months[month] = months.get(month, 0) + 1
+        if i == 0:
+            continue
+        previous = cities[i - 1]
+        lat1, lon1, lat2, lon2 = map(math.radians, (previous["latitude"], previous["longitude"], city["latitude"], city["longitude"]))
+        a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+        mode = transport_mode_key(city)
+        distances[mode] = distances.get(mode, 0.0) + 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+    return {"distances": distances, "countries": countries, "months": months, "unique_city_count": len(unique_cities)}
+
+
+def best_of(func, *args, repeat: int = 5) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main(sizes: List[int]):
+    print(f"{'points':>8} {'numpy engine (ms)':>18} {'pure python (ms)':>17} {'speedup':>8}")
+    for size in sizes:
+        cities = make_trail(size)
+        columns = cities_to_columns(cities)  # /stats 接口直接从 DAO 按列读取
+        stats = compute_trail_statistics(columns)
+        expected = python_statistics(cities)
+        for mode, distance in expected["distances"].items():
+            assert math.isclose(stats["transport_modes"][mode]["distance_km"], distance, rel_tol=1e-6), mode
+        assert stats["countries"] == expected["countries"] and stats["by_month"] == expected["months"]
+        assert stats["unique_city_count"] == expected["unique_city_count"]
+        engine = best_of(compute_trail_statistics, columns)
+        baseline = best_of(python_statistics, cities)
+        print(f"{size:>8} {engine * 1000:>18.2f} {baseline * 1000:>17.2f} {baseline / engine:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [10_000, 50_000, 200_000])
@@ -10,12 +10,23 @@ import asyncio
 import re
 from typing import List, Optional, Dict
 
-from geopy.geocoders import Nominatim
-from geopy.extra.rate_limiter import RateLimiter
+try:
+    import h2  # httpx 的 HTTP/2 支持 (httpx[http2])
+except ImportError:  # 未安装时使用 HTTP/1.1 keep-alive 连接池
+    h2 = None
 
 # 从同级或上级目录导入配置和 schemas
 from ..config import DEEPSEEK_API_KEY, AI_MODEL_ENDPOINT # 假设API端点也在config中
+from ..config import HTTP2_ENABLED, HTTP_KEEPALIVE_EXPIRY_SECONDS, HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE_CONNECTIONS
 from ..presentation_layer.schemas import RecommendationResponseSchema, CityInputSchema
+from ..data_access_layer.recommendation_cache import get_recommendation_cache, recommendation_cache_key
+from ..data_access_layer.geocode_cache import GeocodeCache, get_geocode_cache
+from ..data_access_layer.gazetteer import get_gazetteer
+from .geocoding_pipeline import GeocodingPipeline, get_nominatim_geocoder
+
+# 调用的模型；与提示词版本一起参与推荐缓存的键，修改其中之一后旧的缓存结果自然失效
+AI_MODEL_NAME = "deepseek-v3"
+PROMPT_VERSION = 1
 
 # 预定义的推荐列表，用于没有历史记录时 (与 AI_rmd.py 中一致)
 PREDEFINED_RECOMMENDATIONS_DATA = [
@@ -61,8 +72,31 @@ PREDEFINED_RECOMMENDATIONS_DATA = [
     }
 ]
 
+def warm_geocode_cache(geocode_cache: GeocodeCache, user_dao) -> int:
+    """用预定义推荐和用户轨迹中已保存的城市坐标预热地理编码缓存 (启动时在线程池中执行)，返回写入的条目数。"""
+    written = geocode_cache.warm(PREDEFINED_RECOMMENDATIONS_DATA, source="predefined")
+    written += geocode_cache.warm_from_user_dao(user_dao)
+    print(f"[AI_SERVICE] Geocode cache warmed with {written} entries")
+    return written
+
+def create_http_client() -> httpx.AsyncClient:
+    """
+    推荐服务的 HTTP 客户端：连接池保持 keep-alive 连接，安装了 h2 时使用 HTTP/2，
+    后续请求复用已建立的 TCP/TLS 连接。
+    """
+    return httpx.AsyncClient(
+        http2=HTTP2_ENABLED and h2 is not None,
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY_SECONDS,
+        ),
+        timeout=httpx.Timeout(60.0, connect=10.0),
+    )
+
 class AIRecommendationService:
     def __init__(self):
+        """服务在应用 lifespan 中只创建一次；自己持有 HTTP 连接池，关闭应用时调用 aclose。"""
         # 打印从 config.py 模块导入的实际值
         print(f"[SERVICE_INIT_DEBUG] AI_MODEL_ENDPOINT from config: '{AI_MODEL_ENDPOINT}'")
         print(f"[SERVICE_INIT_DEBUG] DEEPSEEK_API_KEY from config (last 5 chars): '{DEEPSEEK_API_KEY[-5:] if DEEPSEEK_API_KEY else 'None'}'")
@@ -78,8 +112,11 @@ class AIRecommendationService:
             print("[SERVICE_INIT_WARNING] 缺少 AI_MODEL_ENDPOINT，将使用预定义推荐")
             self.use_ai_service = False
 
-        self.geolocator = Nominatim(user_agent="travel_recommender_app_backend") 
-        self.geocode_with_limiter = RateLimiter(self.geolocator.geocode, min_delay_seconds=1)
+        # 大模型接口和 Nominatim 请求共用的连接池
+        self.http_client = create_http_client()
+        self.recommendation_cache = get_recommendation_cache()
+        # 地理编码：离线地名库 -> 地理编码缓存 -> Nominatim (进程共享的限速)
+        self.geocoding = GeocodingPipeline(get_gazetteer(), get_geocode_cache(), get_nominatim_geocoder())
         # self.ai_dao = AIRecommendationDAO() # 如果有DAO
 
     async def get_recommendations(self, visited_cities: List[CityInputSchema]) -> List[RecommendationResponseSchema]:
@@ -92,7 +129,16 @@ class AIRecommendationService:
         if not visited_cities or not self.use_ai_service:
             print("[AI_SERVICE] 使用预定义推荐")
             return [RecommendationResponseSchema(**rec) for rec in PREDEFINED_RECOMMENDATIONS_DATA]
-        
+
+        # 同一组已访问城市 (与顺序无关) 命中缓存时不调用 AI 服务和地理编码
+        cache_key = recommendation_cache_key(
+            ((city.city, city.country) for city in visited_cities), variant=f"{AI_MODEL_NAME}:{PROMPT_VERSION}"
+        )
+        cached = self.recommendation_cache.get(cache_key)
+        if cached is not None:
+            print(f"[AI_SERVICE] 推荐缓存命中 ({len(visited_cities)} 个已访问城市)")
+            return [RecommendationResponseSchema(**rec) for rec in cached]
+
         try:
             cities_prompt = "\n".join([f"- {city.city}, {city.country}" for city in visited_cities])
             prompt = self._build_prompt(cities_prompt)
@@ -102,7 +148,7 @@ class AIRecommendationService:
                 "Authorization": f"Bearer {DEEPSEEK_API_KEY}"
             }
             request_payload = {
-                "model": "deepseek-v3",
+                "model": AI_MODEL_NAME,
                 "messages": [
                     {"role": "system", "content": "You are a travel recommendation expert that outputs JSON only."},
                     {"role": "user", "content": prompt}
@@ -110,13 +156,12 @@ class AIRecommendationService:
                 "stream": False
             }
             
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    AI_MODEL_ENDPOINT,
-                    headers=request_headers,
-                    json=request_payload,
-                    timeout=60.0
-                )
+            response = await self.http_client.post(
+                AI_MODEL_ENDPOINT,
+                headers=request_headers,
+                json=request_payload,
+                timeout=60.0
+            )
             
             response.raise_for_status()
             
@@ -124,29 +169,39 @@ class AIRecommendationService:
             recommendations_from_ai = self._parse_ai_response(result)
             
             recommendations_with_coords = []
+            geocode_failed = False
+            recommendations = []
             for rec_data in recommendations_from_ai:
                 if not isinstance(rec_data, dict):
                     print(f"Skipping non-dict item from AI: {rec_data}")
                     continue
-                try:
-                    location_query = f'{rec_data.get("city", "")}, {rec_data.get("country", "")}'
-                    location = await asyncio.to_thread(self.geocode_with_limiter, location_query, timeout=15)
-                    if location:
-                        rec_data["latitude"] = location.latitude
-                        rec_data["longitude"] = location.longitude
-                    else:
-                        rec_data["latitude"] = None
-                        rec_data["longitude"] = None
-                        print(f"地理编码未找到: {location_query}")
-                except Exception as geo_e:
-                    print(f"地理编码错误 for {rec_data.get('city')}: {geo_e}")
+                recommendations.append(rec_data)
+            # 所有推荐城市一起地理编码：命中离线地名库或缓存的立即返回，只有未命中的请求 Nominatim
+            geocode_results = await self.geocoding.resolve_many(
+                [(rec_data.get("city", ""), rec_data.get("country", "")) for rec_data in recommendations],
+                client=self.http_client,
+            )
+            for rec_data, geocoded in zip(recommendations, geocode_results):
+                location_query = f'{rec_data.get("city", "")}, {rec_data.get("country", "")}'
+                if isinstance(geocoded, Exception):
+                    print(f"地理编码错误 for {rec_data.get('city')}: {geocoded}")
+                    geocode_failed = True
                     rec_data["latitude"] = None
                     rec_data["longitude"] = None
+                elif geocoded:
+                    rec_data["latitude"], rec_data["longitude"] = geocoded
+                else:
+                    rec_data["latitude"] = None
+                    rec_data["longitude"] = None
+                    print(f"地理编码未找到: {location_query}")
                 
                 try:
                     recommendations_with_coords.append(RecommendationResponseSchema(**rec_data))
                 except Exception as pydantic_e:
                     print(f"Pydantic 模型转换错误 for {rec_data}: {pydantic_e}")
+            # 只缓存 AI 成功返回且地理编码没有出错的结果；失败时回退的预定义推荐不缓存，下次请求会重试
+            if recommendations_with_coords and not geocode_failed:
+                await asyncio.to_thread(self.recommendation_cache.put, cache_key, [rec.dict() for rec in recommendations_with_coords])
             return recommendations_with_coords
 
         except httpx.HTTPStatusError as e:
@@ -182,6 +237,10 @@ class AIRecommendationService:
             print("[AI_SERVICE] AI服务发生未知错误，回退到预定义推荐")
             return [RecommendationResponseSchema(**rec) for rec in PREDEFINED_RECOMMENDATIONS_DATA]
 
+    async def aclose(self):
+        """关闭 HTTP 连接池 (应用关闭时调用)。"""
+        await self.http_client.aclose()
+
     def _build_prompt(self, cities_prompt: str) -> str:
         return f"""
         你是一位资深旅行推荐专家（Travel Recommendation Expert）。
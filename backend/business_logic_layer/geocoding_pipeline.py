@@ -0,0 +1,167 @@
+# backend/business_logic_layer/geocoding_pipeline.py
+# 推荐结果的地理编码流水线 (原生 asyncio，不为每个地点占用一个线程)：
+# 1. 先用离线地名库 (内存中) 和地理编码缓存 (一次批量查询) 解析所有地点，命中的立即得到结果；
+# 2. 都未命中的地点才请求 Nominatim，同一地点只请求一次。请求受进程共享的令牌桶限速和并发上限约束，
+#    总耗时取决于未命中的地点数，而不是推荐结果数。
+
+import asyncio
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import httpx
+
+from ..config import (GEOCODE_BURST, GEOCODE_MAX_CONCURRENCY, GEOCODE_RATE_PER_SECOND, GEOCODE_TIMEOUT_SECONDS,
+                      NOMINATIM_URL, NOMINATIM_USER_AGENT)
+from ..data_access_layer.gazetteer import Gazetteer
+from ..data_access_layer.geocode_cache import GeocodeCache, normalize_geocode_query
+
+Coordinates = Tuple[float, float]
+# 每个地点的结果：坐标、None (查不到) 或请求出错时的异常
+GeocodeResult = Union[Optional[Coordinates], Exception]
+
+
+class TokenBucket:
+    """
+    令牌桶限速：每秒补充 rate 个令牌，最多积累 capacity 个。
+    acquire 先预约一个令牌 (令牌数可以为负，表示前面还有排队的请求)，再等待到该令牌可用；
+    预约不需要 await，用线程锁保护即可，不绑定某个事件循环。
+    """
+
+    def __init__(self, rate: float, capacity: int = 1):
+        self.rate = max(rate, 1e-6)
+        self.capacity = max(1, capacity)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.throttled = 0  # 需要等待令牌的次数
+
+    def reserve(self) -> float:
+        """预约一个令牌，返回需要等待的秒数。"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            delay = max(0.0, -self._tokens / self.rate)
+            if delay > 0:
+                self.throttled += 1
+            return delay
+
+    async def acquire(self):
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class NominatimGeocoder:
+    """通过 httpx 请求 Nominatim 搜索接口；限速器在进程内共享，所有请求一起受限。"""
+
+    def __init__(self, limiter: TokenBucket, url: str = NOMINATIM_URL, user_agent: str = NOMINATIM_USER_AGENT,
+                 timeout: float = GEOCODE_TIMEOUT_SECONDS):
+        self.limiter = limiter
+        self.url = url
+        self.user_agent = user_agent
+        self.timeout = timeout
+        self.requests = 0
+        self.errors = 0
+
+    async def geocode(self, client: httpx.AsyncClient, query: str) -> Optional[Coordinates]:
+        """查询一个地点，查不到时返回 None；HTTP 错误或网络错误时抛出异常。"""
+        await self.limiter.acquire()
+        self.requests += 1
+        try:
+            response = await client.get(
+                self.url,
+                params={"q": query, "format": "jsonv2", "limit": 1},
+                headers={"User-Agent": self.user_agent},
+                timeout=self.timeout,
+            )
+            response.raise_for_status()
+            results = response.json()
+        except Exception:
+            self.errors += 1
+            raise
+        if not results:
+            return None
+        return float(results[0]["lat"]), float(results[0]["lon"])
+
+    def stats(self) -> Dict[str, Any]:
+        return {"requests": self.requests, "errors": self.errors, "throttled": self.limiter.throttled,
+                "rate_per_second": self.limiter.rate}
+
+
+class GeocodingPipeline:
+    def __init__(self, gazetteer: Gazetteer, geocode_cache: GeocodeCache, geocoder: NominatimGeocoder,
+                 max_concurrency: int = GEOCODE_MAX_CONCURRENCY):
+        self.gazetteer = gazetteer
+        self.geocode_cache = geocode_cache
+        self.geocoder = geocoder
+        self.max_concurrency = max(1, max_concurrency)
+
+    async def resolve_many(self, places: Sequence[Tuple[str, str]],
+                           client: Optional[httpx.AsyncClient] = None) -> List[GeocodeResult]:
+        """
+        解析 [(城市, 国家)]，结果与输入一一对应。
+        在线查询的结果 (包括查不到) 写入地理编码缓存，出错的地点不写缓存，结果中是对应的异常。
+        client 为 None 且需要在线查询时临时创建一个 httpx.AsyncClient。
+        """
+        results: List[GeocodeResult] = [None] * len(places)
+        pending: Dict[str, List[int]] = {}  # 规范化查询 -> 对应的结果位置
+        for index, (city, country) in enumerate(places):
+            place = self.gazetteer.resolve(city, country)
+            if place is not None:
+                results[index] = (place["latitude"], place["longitude"])
+            else:
+                pending.setdefault(normalize_geocode_query(city, country), []).append(index)
+        if pending:
+            cached = await asyncio.to_thread(self.geocode_cache.get_many, list(pending))
+            for query, entry in cached.items():
+                coordinates = None if entry["latitude"] is None else (entry["latitude"], entry["longitude"])
+                for index in pending.pop(query):
+                    results[index] = coordinates
+        if not pending:
+            return results
+
+        print(f"[AI_SERVICE] 在线地理编码 {len(pending)} 个地点 (共 {len(places)} 个)")
+        if client is None:
+            async with httpx.AsyncClient() as own_client:
+                outcomes = await self._fetch(own_client, places, pending)
+        else:
+            outcomes = await self._fetch(client, places, pending)
+        resolved = []
+        for (query, indices), outcome in zip(pending.items(), outcomes):
+            if isinstance(outcome, BaseException) and not isinstance(outcome, Exception):
+                raise outcome  # 取消等不是请求错误，继续向上传递
+            for index in indices:
+                results[index] = outcome
+            if not isinstance(outcome, Exception):
+                resolved.append((query, *(outcome or (None, None))))
+        await asyncio.to_thread(self.geocode_cache.put_many, resolved)
+        return results
+
+    async def _fetch(self, client: httpx.AsyncClient, places: Sequence[Tuple[str, str]],
+                     pending: Dict[str, List[int]]) -> List[Any]:
+        """并发请求未命中的地点 (同时最多 max_concurrency 个，速率由共享的令牌桶决定)。"""
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def fetch(index: int) -> Optional[Coordinates]:
+            city, country = places[index]
+            async with semaphore:
+                return await self.geocoder.geocode(client, f"{city}, {country}")
+
+        return await asyncio.gather(*(fetch(indices[0]) for indices in pending.values()), return_exceptions=True)
+
+
+_nominatim_geocoder: Optional[NominatimGeocoder] = None
+_nominatim_geocoder_lock = threading.Lock()
+
+
+def get_nominatim_geocoder() -> NominatimGeocoder:
+    """进程内共享的 Nominatim 客户端 (令牌桶需要跨请求共享，限速才有效)。"""
+    global _nominatim_geocoder
+    if _nominatim_geocoder is None:
+        with _nominatim_geocoder_lock:
+            if _nominatim_geocoder is None:
+                _nominatim_geocoder = NominatimGeocoder(TokenBucket(GEOCODE_RATE_PER_SECOND, GEOCODE_BURST))
+    return _nominatim_geocoder
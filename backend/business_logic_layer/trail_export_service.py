@@ -0,0 +1,171 @@
+# backend/business_logic_layer/trail_export_service.py
+# 流式导出用户的完整轨迹存档 (ZIP 或 NDJSON)
+# 导出内容由生成器边生成边发送：城市元数据写成 GeoJSON，博客为文本文件，照片为原始二进制文件。
+# 照片从照片存储中分块读取，任何时候内存中最多只有一张照片的一个块 (旧的内嵌 base64 照片为一张)。
+
+import base64
+import json
+import mimetypes
+import re
+import time
+import zipfile
+from typing import Any, Dict, Iterator, List, Optional
+
+from ..data_access_layer.photo_blob_store import PhotoBlobStore, decode_photo_data
+from ..data_access_layer.trail_ops import CITY_LIST_FIELDS
+
+EXPORT_FORMATS = ("zip", "ndjson")
+# 导出时读取的城市字段 (包含照片引用和博客正文)
+EXPORT_CITY_FIELDS = tuple(field for field in CITY_LIST_FIELDS if field != "photo_count")
+# 读取照片文件的块大小；是 3 的倍数，分块 base64 编码后直接拼接仍是合法的 base64
+EXPORT_CHUNK_SIZE = 3 * 16 * 1024
+_UNSAFE_NAME_CHARS = re.compile(r'[\\/:*?"<>|\s]+')
+
+
+class _StreamSink:
+    """
+    ZipFile 的输出目标：只支持 write，不支持 seek/tell，
+    zipfile 会改用数据描述符 (data descriptor) 格式，写入的字节由生成器随时取走发送。
+    """
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        if data:
+            self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> Iterator[bytes]:
+        if self._chunks:
+            data = b"".join(self._chunks)
+            self._chunks.clear()
+            yield data
+
+
+def _photo_extension(content_type: Optional[str]) -> str:
+    if content_type == "image/jpeg":
+        return ".jpg"
+    return mimetypes.guess_extension(content_type or "") or ".bin"
+
+
+def _photo_file_name(photo: Dict[str, Any]) -> str:
+    """照片在存档中的文件名：按内容哈希 (ref) 命名，同一张照片只导出一次。"""
+    return f"photos/{photo.get('ref') or photo.get('id')}{_photo_extension(photo.get('content_type'))}"
+
+
+def _blog_file_name(city: Dict[str, Any]) -> str:
+    safe_name = _UNSAFE_NAME_CHARS.sub("_", city.get("city") or "")[:50]
+    return f"blogs/{city['index'] + 1:04d}-{safe_name}.txt"
+
+
+def _iter_photo_bytes(photo_store: PhotoBlobStore, photo: Dict[str, Any]) -> Iterator[bytes]:
+    """按块读取一张照片；照片文件缺失或数据无效时不产出任何内容。"""
+    ref = photo.get("ref")
+    if ref:
+        try:
+            with open(photo_store.path_for(ref), "rb") as f:
+                while True:
+                    chunk = f.read(EXPORT_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    yield chunk
+        except (OSError, ValueError) as e:
+            print(f"[EXPORT] Skipping photo {ref}: {e}")
+        return
+    if photo.get("data"):  # 尚未迁移到照片存储的旧数据
+        try:
+            yield decode_photo_data(photo["data"])[0]
+        except ValueError as e:
+            print(f"[EXPORT] Skipping embedded photo {photo.get('id')}: {e}")
+
+
+def _unique_photos(cities: List[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    seen = set()
+    for city in cities:
+        for photo in city.get("photos") or []:
+            name = _photo_file_name(photo)
+            if name not in seen:
+                seen.add(name)
+                yield photo
+
+
+def _city_feature(city: Dict[str, Any], include_blog: bool) -> Dict[str, Any]:
+    """城市 -> GeoJSON Point Feature (坐标顺序为 [经度, 纬度])；可以再通过导入接口导入。"""
+    properties = {field: city.get(field) for field in ("id", "index", "city", "country", "transport_mode", "visit_date")}
+    if include_blog:
+        properties["blog"] = city.get("blog")
+    elif city.get("blog"):
+        properties["blog_file"] = _blog_file_name(city)
+    properties["photos"] = [
+        {"id": photo.get("id"), "ref": photo.get("ref"), "content_type": photo.get("content_type"),
+         "size": photo.get("size"), "file": _photo_file_name(photo)}
+        for photo in city.get("photos") or []
+    ]
+    return {
+        "type": "Feature",
+        "geometry": {"type": "Point", "coordinates": [city.get("longitude"), city.get("latitude")]},
+        "properties": properties,
+    }
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, default=str)
+
+
+def _export_metadata(username: str, version: Optional[int], cities: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {"username": username, "version": version, "exported_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()), "city_count": len(cities)}
+
+
+def iter_zip_archive(username: str, version: Optional[int], cities: List[Dict[str, Any]], photo_store: PhotoBlobStore) -> Iterator[bytes]:
+    """
+    ZIP 存档：trail.geojson (FeatureCollection，每个城市一个点)、blogs/*.txt、photos/<ref>.<ext>。
+    文本压缩存储，照片本身已压缩，原样存储 (ZIP_STORED)。
+    """
+    sink = _StreamSink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        with archive.open("trail.geojson", "w") as member:
+            header = dict(type="FeatureCollection", **_export_metadata(username, version, cities))
+            member.write(_dumps(header)[:-1].encode("utf-8") + b', "features": [\n')
+            for i, city in enumerate(cities):
+                member.write(((",\n" if i else "") + _dumps(_city_feature(city, include_blog=False))).encode("utf-8"))
+                yield from sink.drain()
+            member.write(b"\n]}\n")
+        yield from sink.drain()
+
+        for city in cities:
+            if city.get("blog"):
+                archive.writestr(_blog_file_name(city), city["blog"])
+                yield from sink.drain()
+
+        for photo in _unique_photos(cities):
+            info = zipfile.ZipInfo(_photo_file_name(photo), date_time=time.localtime()[:6])
+            info.compress_type = zipfile.ZIP_STORED
+            info.file_size = photo.get("size") or 0
+            with archive.open(info, "w") as member:
+                for chunk in _iter_photo_bytes(photo_store, photo):
+                    member.write(chunk)
+                    yield from sink.drain()
+            yield from sink.drain()
+    # 关闭时写入中央目录
+    yield from sink.drain()
+
+
+def iter_ndjson_archive(username: str, version: Optional[int], cities: List[Dict[str, Any]], photo_store: PhotoBlobStore) -> Iterator[bytes]:
+    """
+    NDJSON 存档，每行一个 JSON 对象：
+    第一行 {"type": "TrailExport", ...} 为元数据；随后每个城市一个 GeoJSON Feature (含博客正文)；
+    最后每张照片一行 {"type": "Photo", "ref", "content_type", "file", "data": base64}，data 分块编码输出。
+    """
+    yield (_dumps(dict(type="TrailExport", **_export_metadata(username, version, cities))) + "\n").encode("utf-8")
+    for city in cities:
+        yield (_dumps(_city_feature(city, include_blog=True)) + "\n").encode("utf-8")
+    for photo in _unique_photos(cities):
+        header = {"type": "Photo", "ref": photo.get("ref"), "content_type": photo.get("content_type"), "file": _photo_file_name(photo)}
+        yield _dumps(header)[:-1].encode("utf-8") + b', "data": "'
+        for chunk in _iter_photo_bytes(photo_store, photo):
+            yield base64.b64encode(chunk)
+        yield b'"}\n'
@@ -0,0 +1,188 @@
+# backend/business_logic_layer/trail_geometry.py
+# 按缩放级别简化的轨迹折线 (地图只需要画线，不需要完整的城市列表)
+# 在球面上做 Douglas-Peucker：误差是点到两端点之间大圆弧的距离 (km)。
+# Douglas-Peucker 每次都在误差最大的点处切分，切分顺序与容差无关，
+# 因此对每个用户版本只完整计算一次，记录每个点的"重要度" (被保留所需的最大容差)，
+# 任意容差的简化结果就是重要度大于容差的点，不同缩放级别共用同一份缓存。
+
+import asyncio
+import math
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from ..config import TRAIL_GEOMETRY_CACHE_MAX_ENTRIES
+from ..data_access_layer.async_user_dao import AsyncUserDAO
+from ..data_access_layer.dao_factory import get_async_user_dao
+from ..data_access_layer.lru_cache import LRUCache
+from ..data_access_layer.trail_aggregates import EARTH_RADIUS_KM
+from .trail_statistics import float_column
+
+GEOMETRY_FORMATS = ("polyline", "f32")
+# 编码折线 (Google Encoded Polyline) 的坐标精度：小数点后 5 位，约 1 m
+POLYLINE_PRECISION = 5
+# 缩放级别 0 时一个像素对应的地面距离 (km)：赤道周长 / 256 像素；每放大一级减半
+_ZOOM0_KM_PER_PIXEL = 2 * math.pi * EARTH_RADIUS_KM / 256
+# 每个缓存条目保留的已编码结果数 (常用的几个缩放级别)
+_MAX_ENCODED_PER_ENTRY = 16
+
+
+def zoom_tolerance_km(zoom: float, pixels: float = 1.0) -> float:
+    """缩放级别 -> 简化容差 (km)：偏差小于 pixels 个像素的点在该级别下看不出来。"""
+    return _ZOOM0_KM_PER_PIXEL / (2 ** zoom) * pixels
+
+
+def _unit_vectors(latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+    lat, lon = np.radians(latitudes), np.radians(longitudes)
+    return np.column_stack((np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)))
+
+
+def _angle(p: np.ndarray, q: np.ndarray) -> np.ndarray:
+    """单位向量之间的夹角 (弧度)；atan2 形式在夹角很小时也精确。"""
+    return np.arctan2(np.linalg.norm(np.cross(p, q), axis=-1), np.sum(p * q, axis=-1))
+
+
+def segment_distance_km(points: np.ndarray, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    各点 (单位向量) 到大圆弧 a -> b 的最短距离 (km)：投影落在弧内时为垂直距离，否则为到较近端点的距离。
+    a / b 可以是单个端点，也可以与 points 逐行对应 (每个点各自的弧)。
+    """
+    to_a = _angle(points, a)
+    normal = np.cross(a, b)
+    length = np.linalg.norm(normal, axis=-1, keepdims=True)
+    degenerate = length[..., 0] < 1e-12  # 两端点重合 (或正好相对)，退化为到端点的距离
+    normal = normal / np.where(length < 1e-12, 1.0, length)
+    within = (np.sum(np.cross(a, points) * normal, axis=-1) >= 0) & (np.sum(np.cross(points, b) * normal, axis=-1) >= 0)
+    cross_track = np.abs(np.arcsin(np.clip(np.sum(points * normal, axis=-1), -1.0, 1.0)))
+    distances = np.where(within, cross_track, np.minimum(to_a, _angle(points, b)))
+    return EARTH_RADIUS_KM * np.where(degenerate, to_a, distances)
+
+
+def douglas_peucker_importance(latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+    """
+    每个点的重要度 (km)：容差小于它时 Douglas-Peucker 会保留该点；两个端点为无穷大。
+    子区间的重要度不超过父切分点，保证"重要度 > 容差"的点集与按该容差直接简化的结果一致。
+    同一层的所有待切分区间一起向量化计算 (逐个区间调用 NumPy 的开销在长轨迹上远大于计算本身)。
+    """
+    count = len(latitudes)
+    importance = np.zeros(count)
+    if count == 0:
+        return importance
+    importance[0] = importance[-1] = np.inf
+    points = _unit_vectors(latitudes, longitudes)
+    firsts, lasts, parents = np.array([0]), np.array([count - 1]), np.array([np.inf])
+    while True:
+        pending = lasts - firsts >= 2
+        firsts, lasts, parents = firsts[pending], lasts[pending], parents[pending]
+        if not len(firsts):
+            return importance
+        # 所有区间的内部点拼成一个数组，range_ids 记录每个点属于哪个区间
+        sizes = lasts - firsts - 1
+        offsets = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+        range_ids = np.repeat(np.arange(len(sizes)), sizes)
+        indices = firsts[range_ids] + 1 + np.arange(len(range_ids)) - offsets[range_ids]
+        distances = segment_distance_km(points[indices], points[firsts][range_ids], points[lasts][range_ids])
+        # 每个区间中误差最大的点 (相同时取第一个，与逐个区间 argmax 一致)
+        maxima = np.maximum.reduceat(distances, offsets)
+        candidates = np.flatnonzero(distances == maxima[range_ids])
+        _, first_candidates = np.unique(range_ids[candidates], return_index=True)
+        splits = indices[candidates[first_candidates]]
+        values = np.minimum(maxima, parents)
+        importance[splits] = values
+        firsts, lasts, parents = (
+            np.concatenate((firsts, splits)), np.concatenate((splits, lasts)), np.concatenate((values, values))
+        )
+
+
+def encode_polyline(latitudes: np.ndarray, longitudes: np.ndarray, precision: int = POLYLINE_PRECISION) -> str:
+    """Google Encoded Polyline：坐标按精度取整后对前一个点做差分，zigzag 后每 5 位一个可打印字符。"""
+    scale = 10 ** precision
+    coordinates = np.column_stack((np.round(latitudes * scale), np.round(longitudes * scale))).astype(np.int64)
+    deltas = np.diff(coordinates, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel()
+    chars = []
+    for value in ((deltas << 1) ^ (deltas >> 63)).tolist():
+        while value >= 0x20:
+            chars.append(chr((0x20 | (value & 0x1F)) + 63))
+            value >>= 5
+        chars.append(chr(value + 63))
+    return "".join(chars)
+
+
+def encode_float32(latitudes: np.ndarray, longitudes: np.ndarray) -> bytes:
+    """小端 Float32 数组 [经度, 纬度, 经度, 纬度, ...]，可直接传给 Cesium.Cartesian3.fromDegreesArray。"""
+    return np.column_stack((longitudes, latitudes)).astype("<f4").tobytes()
+
+
+class TrailGeometryService:
+    def __init__(self, user_dao: AsyncUserDAO, max_entries: int = TRAIL_GEOMETRY_CACHE_MAX_ENTRIES):
+        self.user_dao = user_dao
+        # username -> {"version", "indices", "latitudes", "longitudes", "importance", "encoded"}
+        self._cache = LRUCache(max_entries=max_entries)
+
+    async def _load(self, username: str, version: int) -> Optional[Dict[str, Any]]:
+        """读取 (或从缓存取) 该用户某版本的轨迹和各点重要度；用户不存在时返回 None。"""
+        entry = self._cache.get(username, is_valid=lambda cached: cached["version"] == version)
+        if entry is not None:
+            return entry
+        for _ in range(3):
+            columns = await self.user_dao.list_city_columns(username, ("latitude", "longitude"))
+            if columns is None:
+                return None
+            # 读取前后版本一致，说明坐标就是该版本的数据
+            current = await self.user_dao.get_user_version(username)
+            if current is None:
+                return None
+            stable, version = current == version, current
+            if stable:
+                break
+        latitudes, longitudes = float_column(columns["latitude"]), float_column(columns["longitude"])
+        indices = np.flatnonzero(np.isfinite(latitudes) & np.isfinite(longitudes))  # 缺少坐标的城市不画
+        latitudes, longitudes = latitudes[indices], longitudes[indices]
+        importance = await asyncio.to_thread(douglas_peucker_importance, latitudes, longitudes)
+        entry = {"version": version, "indices": indices, "latitudes": latitudes, "longitudes": longitudes,
+                 "importance": importance, "encoded": {}}
+        if stable:  # 数据一直在变化时不缓存，下次请求重新读取
+            self._cache.put(username, entry)
+        return entry
+
+    async def get_geometry(self, username: str, version: int, tolerance_km: float, geometry_format: str) -> Optional[Dict[str, Any]]:
+        """
+        按容差简化后的轨迹，返回 {"version", "tolerance_km", "original_count", "point_count", "indices", "data"}；
+        data 为编码折线字符串 (polyline) 或 Float32 字节串 (f32)，indices 是保留的点在城市列表中的位置。
+        同一版本、容差和格式的结果直接从缓存返回。
+        """
+        entry = await self._load(username, version)
+        if entry is None:
+            return None
+        key = (geometry_format, tolerance_km)
+        result = entry["encoded"].get(key)
+        if result is None:
+            keep = entry["importance"] > tolerance_km if tolerance_km > 0 else slice(None)
+            latitudes, longitudes = entry["latitudes"][keep], entry["longitudes"][keep]
+            encode = encode_polyline if geometry_format == "polyline" else encode_float32
+            result = {
+                "version": entry["version"],
+                "tolerance_km": tolerance_km,
+                "original_count": len(entry["indices"]),
+                "point_count": len(latitudes),
+                "indices": entry["indices"][keep].tolist(),
+                "data": await asyncio.to_thread(encode, latitudes, longitudes),
+            }
+            if len(entry["encoded"]) >= _MAX_ENCODED_PER_ENTRY:
+                entry["encoded"].clear()
+            entry["encoded"][key] = result
+        return result
+
+    def get_cache_stats(self) -> Dict[str, Any]:
+        return self._cache.stats()
+
+
+_trail_geometry_service: Optional[TrailGeometryService] = None
+
+
+def get_trail_geometry_service() -> TrailGeometryService:
+    """进程内共享的轨迹几何服务 (缓存需要跨请求复用)。"""
+    global _trail_geometry_service
+    if _trail_geometry_service is None:
+        _trail_geometry_service = TrailGeometryService(get_async_user_dao())
+    return _trail_geometry_service
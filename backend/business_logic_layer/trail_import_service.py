@@ -0,0 +1,459 @@
+# backend/business_logic_layer/trail_import_service.py
+# 流式批量导入轨迹 (GPX / GeoJSON / NDJSON)
+# 请求体按块到达，由增量解析器逐条产出城市记录，每条用 CityCreateSchema 校验，
+# 攒够 IMPORT_BATCH_SIZE 条后一次写入 DAO (JSON 存储一条日志记录 / SQLite 一个事务)。
+# 内存占用只与单条记录和一批的大小有关，与上传文件的大小无关。
+
+import codecs
+import json
+import time
+import uuid
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+from pydantic import ValidationError
+
+from ..config import IMPORT_BATCH_SIZE, IMPORT_JOBS_MAX_ENTRIES
+from ..data_access_layer.async_user_dao import AsyncUserDAO
+from ..data_access_layer.dao_factory import get_async_user_dao
+from ..presentation_layer.schemas import CityCreateSchema
+
+IMPORT_FORMATS = ("gpx", "geojson", "ndjson")
+_CONTENT_TYPE_FORMATS = {
+    "application/gpx+xml": "gpx",
+    "application/xml": "gpx",
+    "text/xml": "gpx",
+    "application/geo+json": "geojson",
+    "application/x-ndjson": "ndjson",
+    "application/ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+    "application/x-jsonlines": "ndjson",
+}
+# 单条记录 (一行 NDJSON / 一个 GeoJSON feature) 的大小上限，防止异常输入把整个文件攒进内存
+MAX_RECORD_CHARS = 1024 * 1024
+# 导入结果中最多返回多少条被拒绝记录的错误信息 (拒绝总数另行统计)
+MAX_REPORTED_ERRORS = 20
+# GPX / GeoJSON 中没有国家信息时使用的默认值
+UNKNOWN_COUNTRY = "未知"
+_GPX_POINT_TAGS = ("wpt", "trkpt", "rtept")
+_GPX_CONTAINER_TAGS = ("trkseg", "trk", "rte")
+
+
+class ImportFormatError(ValueError):
+    """输入无法继续解析 (格式未知、XML/JSON 语法错误、单条记录过大)，整个导入中止。"""
+
+
+class ImportJobConflictError(Exception):
+    """客户端指定的 job_id 对应的导入仍在进行中。"""
+
+
+class _RejectedRecord:
+    """解析阶段就能确定无效的单条记录 (如 NDJSON 中无法解析的一行)，计入拒绝数，导入继续。"""
+
+    def __init__(self, message: str):
+        self.message = message
+
+
+# --- 增量解析器：feed(块) 和 close() 都返回本次能解析出的记录 ---
+
+class _NdjsonParser:
+    """每行一个 JSON 对象：城市字典或 GeoJSON Feature。"""
+
+    def __init__(self):
+        self._decoder = codecs.getincrementaldecoder("utf-8-sig")()
+        self._buffer = ""
+
+    def feed(self, chunk: bytes) -> Iterator[Any]:
+        self._buffer += self._decoder.decode(chunk)
+        *lines, self._buffer = self._buffer.split("\n")
+        if len(self._buffer) > MAX_RECORD_CHARS:
+            raise ImportFormatError("NDJSON 单行过大")
+        for line in lines:
+            yield from self._parse_line(line)
+
+    def close(self) -> Iterator[Any]:
+        line, self._buffer = self._buffer + self._decoder.decode(b"", final=True), ""
+        yield from self._parse_line(line)
+
+    @staticmethod
+    def _parse_line(line: str) -> Iterator[Any]:
+        line = line.strip()
+        if not line:
+            return
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as e:
+            yield _RejectedRecord(f"JSON 解析失败: {e.msg}")
+
+
+class _GeoJsonParser:
+    """
+    FeatureCollection 对象：逐个解析顶层的键，features 数组中的元素每解析出一个就产出一个，
+    缓冲区中只保留尚未解析完的部分。
+    """
+
+    def __init__(self):
+        self._decoder = codecs.getincrementaldecoder("utf-8-sig")()
+        self._json = json.JSONDecoder()
+        self._buffer = ""
+        self._state = "start"  # start -> key -> colon -> value / features -> ... -> done
+        self._key: Optional[str] = None
+
+    def feed(self, chunk: bytes) -> Iterator[Any]:
+        self._buffer += self._decoder.decode(chunk)
+        return self._drain(final=False)
+
+    def close(self) -> Iterator[Any]:
+        self._buffer += self._decoder.decode(b"", final=True)
+        yield from self._drain(final=True)
+        if self._state != "done":
+            raise ImportFormatError("GeoJSON 不完整")
+
+    def _decode_value(self, buffer: str, pos: int, final: bool):
+        """解析 pos 处的一个 JSON 值；数据还不完整时返回 None，等待下一块。"""
+        try:
+            value, end = self._json.raw_decode(buffer, pos)
+        except json.JSONDecodeError as e:
+            if final:
+                raise ImportFormatError(f"GeoJSON 解析失败: {e.msg}")
+            if len(buffer) - pos > MAX_RECORD_CHARS:
+                raise ImportFormatError("GeoJSON 单个 feature 过大")
+            return None
+        # 值后面还没有出现分隔符时，末尾的数字等可能只收到了一半
+        if not final and _skip_whitespace(buffer, end) >= len(buffer):
+            return None
+        return value, end
+
+    def _drain(self, final: bool) -> Iterator[Any]:
+        buffer, pos = self._buffer, 0
+        try:
+            while True:
+                pos = _skip_whitespace(buffer, pos)
+                if pos >= len(buffer):
+                    break
+                char = buffer[pos]
+                if self._state == "start":
+                    if char != "{":
+                        raise ImportFormatError("GeoJSON 顶层必须是 FeatureCollection 对象")
+                    self._state, pos = "key", pos + 1
+                elif self._state == "done":
+                    raise ImportFormatError("GeoJSON 结尾有多余内容")
+                elif self._state in ("key", "features") and char == ",":
+                    pos += 1
+                elif self._state == "key" and char == "}":
+                    self._state, pos = "done", pos + 1
+                elif self._state == "features" and char == "]":
+                    self._state, pos = "key", pos + 1
+                elif self._state == "colon":
+                    if char != ":":
+                        raise ImportFormatError("GeoJSON 解析失败: 缺少冒号")
+                    self._state, pos = "value", pos + 1
+                elif self._state == "value" and self._key == "features":
+                    if char != "[":
+                        raise ImportFormatError("GeoJSON 的 features 必须是数组")
+                    self._state, pos = "features", pos + 1
+                else:
+                    # 顶层的键、其他键的值 (整体解析后丢弃) 或 features 数组中的一个 feature
+                    decoded = self._decode_value(buffer, pos, final)
+                    if decoded is None:
+                        break
+                    value, pos = decoded
+                    if self._state == "key":
+                        if not isinstance(value, str):
+                            raise ImportFormatError("GeoJSON 解析失败: 键必须是字符串")
+                        self._key, self._state = value, "colon"
+                    elif self._state == "value":
+                        if self._key == "type" and value != "FeatureCollection":
+                            raise ImportFormatError("GeoJSON 顶层必须是 FeatureCollection (单个 Feature 请用 NDJSON 导入)")
+                        self._state = "key"
+                    else:
+                        yield value
+        finally:
+            self._buffer = buffer[pos:]
+
+
+class _GpxParser:
+    """
+    GPX (XML)：用 XMLPullParser 增量解析 wpt / trkpt / rtept 点，
+    每处理完一个点 (以及一个 trkseg / trk / rte) 就把它从父元素中删除，已解析的树不会随文件增长。
+    """
+
+    def __init__(self):
+        self._parser = ET.XMLPullParser(events=("start", "end"))
+        self._stack: List[ET.Element] = []
+
+    def feed(self, chunk: bytes) -> Iterator[Any]:
+        try:
+            self._parser.feed(chunk)
+        except ET.ParseError as e:
+            raise ImportFormatError(f"GPX 解析失败: {e}")
+        return self._drain()
+
+    def close(self) -> Iterator[Any]:
+        try:
+            self._parser.close()
+        except ET.ParseError as e:
+            raise ImportFormatError(f"GPX 解析失败: {e}")
+        return self._drain()
+
+    def _drain(self) -> Iterator[Any]:
+        try:
+            events = list(self._parser.read_events())  # 只包含本块解析出的事件
+        except ET.ParseError as e:
+            raise ImportFormatError(f"GPX 解析失败: {e}")
+        for event, element in events:
+            if event == "start":
+                self._stack.append(element)
+                continue
+            self._stack.pop()
+            tag = _local_name(element.tag)
+            if tag in _GPX_POINT_TAGS:
+                yield self._point_record(element)
+            if (tag in _GPX_POINT_TAGS or tag in _GPX_CONTAINER_TAGS) and self._stack:
+                self._stack[-1].remove(element)
+
+    @staticmethod
+    def _point_record(element: ET.Element) -> Dict[str, Any]:
+        children = {_local_name(child.tag): (child.text or "").strip() for child in element}
+        record: Dict[str, Any] = {
+            "city": children.get("name"),
+            "country": UNKNOWN_COUNTRY,
+            "latitude": element.get("lat"),
+            "longitude": element.get("lon"),
+        }
+        if children.get("type"):
+            record["transport_mode"] = children["type"]
+        if children.get("time"):
+            record["visit_date"] = children["time"]
+        if children.get("desc"):
+            record["blog"] = children["desc"]
+        return record
+
+
+def _skip_whitespace(text: str, pos: int) -> int:
+    while pos < len(text) and text[pos] in " \t\r\n":
+        pos += 1
+    return pos
+
+
+def _local_name(tag: str) -> str:
+    """去掉 XML 命名空间：{http://www.topografix.com/GPX/1/1}trkpt -> trkpt"""
+    return tag.rsplit("}", 1)[-1]
+
+
+def _create_parser(import_format: str):
+    return {"gpx": _GpxParser, "geojson": _GeoJsonParser, "ndjson": _NdjsonParser}[import_format]()
+
+
+def resolve_import_format(explicit_format: Optional[str], content_type: Optional[str]) -> Optional[str]:
+    """优先使用查询参数 format，其次按 Content-Type 判断；都无法确定时返回 None (由首块内容判断)。"""
+    if explicit_format:
+        explicit_format = explicit_format.lower()
+        if explicit_format not in IMPORT_FORMATS:
+            raise ImportFormatError(f"不支持的导入格式: {explicit_format} (可选: {', '.join(IMPORT_FORMATS)})")
+        return explicit_format
+    media_type = (content_type or "").split(";")[0].strip().lower()
+    return _CONTENT_TYPE_FORMATS.get(media_type)
+
+
+def sniff_import_format(first_chunk: bytes) -> str:
+    head = first_chunk[:4096].decode("utf-8", errors="ignore").lstrip("\ufeff \t\r\n")
+    if head.startswith("<"):
+        return "gpx"
+    if head.startswith("{"):
+        return "geojson" if '"FeatureCollection"' in head or '"features"' in head.split("\n", 1)[0] else "ndjson"
+    raise ImportFormatError("无法识别导入格式，请通过 format 参数或 Content-Type 指定")
+
+
+# --- 记录 -> 城市 ---
+
+def _feature_cities(feature: Dict[str, Any]) -> Iterator[Any]:
+    """GeoJSON Feature：Point 产出一个城市，MultiPoint / LineString 的每个顶点各产出一个。"""
+    properties = feature.get("properties") or {}
+    geometry = feature.get("geometry") or {}
+    geometry_type = geometry.get("type")
+    coordinates = geometry.get("coordinates")
+    if geometry_type == "Point":
+        points = [coordinates]
+    elif geometry_type in ("MultiPoint", "LineString"):
+        points = coordinates or []
+    else:
+        yield _RejectedRecord(f"不支持的几何类型: {geometry_type}")
+        return
+    for point in points:
+        if not isinstance(point, list) or len(point) < 2:
+            yield _RejectedRecord("坐标格式无效")
+            continue
+        record = {
+            "city": properties.get("city") or properties.get("name"),
+            "country": properties.get("country") or UNKNOWN_COUNTRY,
+            "longitude": point[0],  # GeoJSON 坐标顺序为 [经度, 纬度]
+            "latitude": point[1],
+        }
+        for field in ("transport_mode", "visit_date", "blog"):
+            if properties.get(field) is not None:
+                record[field] = properties[field]
+        if "visit_date" not in record and properties.get("time"):
+            record["visit_date"] = properties["time"]
+        yield record
+
+
+def _expand_record(raw: Any) -> Iterator[Any]:
+    if isinstance(raw, dict) and raw.get("type") == "Feature":
+        yield from _feature_cities(raw)
+    else:
+        yield raw
+
+
+def _coordinate_label(record: Dict[str, Any]) -> Optional[str]:
+    """没有地名的轨迹点用坐标作为名称。"""
+    try:
+        return f"{float(record['latitude']):.4f}, {float(record['longitude']):.4f}"
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def _validate_city(raw: Any, label_missing_names: bool) -> Dict[str, Any]:
+    """用 CityCreateSchema 校验一条记录，返回可写入 DAO 的城市字典；无效时抛出 ValueError。"""
+    if isinstance(raw, _RejectedRecord):
+        raise ValueError(raw.message)
+    if not isinstance(raw, dict):
+        raise ValueError("记录必须是 JSON 对象")
+    if label_missing_names and not raw.get("city"):
+        raw = dict(raw, city=_coordinate_label(raw))
+    try:
+        city = CityCreateSchema.parse_obj(raw).dict()
+    except ValidationError as e:
+        raise ValueError("; ".join(f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in e.errors()))
+    if not (-90 <= city["latitude"] <= 90 and -180 <= city["longitude"] <= 180):
+        raise ValueError("经纬度超出范围")
+    visit_date = raw.get("visit_date")
+    if visit_date:
+        try:
+            city["visit_date"] = datetime.fromisoformat(str(visit_date)).isoformat()
+        except ValueError:
+            raise ValueError(f"visit_date 不是有效的 ISO 8601 时间: {visit_date}")
+    city["blog"] = raw["blog"] if isinstance(raw.get("blog"), str) else ""
+    city["photos"] = []
+    return city
+
+
+# --- 导入任务与进度 ---
+
+class ImportJobRegistry:
+    """导入任务的进度记录 (进程内，最多保留 max_entries 个，最旧的先淘汰)。只在事件循环线程中读写。"""
+
+    def __init__(self, max_entries: int = IMPORT_JOBS_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def create(self, username: str, import_format: Optional[str], job_id: Optional[str] = None) -> Dict[str, Any]:
+        job_id = job_id or uuid.uuid4().hex
+        existing = self._jobs.get(job_id)
+        if existing is not None and existing["status"] == "running":
+            raise ImportJobConflictError(f"导入任务 '{job_id}' 正在进行中")
+        job = {
+            "job_id": job_id,
+            "username": username,
+            "format": import_format,
+            "status": "running",
+            "bytes_received": 0,
+            "imported": 0,
+            "rejected": 0,
+            "batches": 0,
+            "errors": [],
+            "error": None,
+            "started_at": time.time(),
+            "finished_at": None,
+        }
+        self._jobs[job_id] = job
+        self._jobs.move_to_end(job_id)
+        while len(self._jobs) > self.max_entries:
+            self._jobs.popitem(last=False)
+        return job
+
+    def get(self, username: str, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self._jobs.get(job_id)
+        if job is None or job["username"] != username:
+            return None
+        return dict(job, errors=list(job["errors"]))
+
+
+class TrailImportService:
+    def __init__(self, user_dao: AsyncUserDAO, jobs: ImportJobRegistry, batch_size: int = IMPORT_BATCH_SIZE):
+        self.user_dao = user_dao
+        self.jobs = jobs
+        self.batch_size = max(1, batch_size)
+
+    async def import_stream(self, username: str, chunks: AsyncIterator[bytes], import_format: Optional[str] = None,
+                            job_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        从字节块流中导入城市，追加到用户轨迹末尾，返回任务结果 (导入数、拒绝数、前若干条错误)。
+        无效记录被跳过并计数；输入无法解析时抛出 ImportFormatError，此前已写入的批次会保留。
+        用户不存在 (或导入过程中被删除) 时抛出 LookupError。
+        """
+        job = self.jobs.create(username, import_format, job_id)
+        parser = None
+        batch: List[Dict[str, Any]] = []
+        record_number = 0
+
+        async def handle(records: Iterator[Any]):
+            nonlocal record_number
+            for raw in records:
+                for candidate in _expand_record(raw):
+                    record_number += 1
+                    try:
+                        batch.append(_validate_city(candidate, label_missing_names=job["format"] == "gpx" or raw is not candidate))
+                    except ValueError as e:
+                        job["rejected"] += 1
+                        if len(job["errors"]) < MAX_REPORTED_ERRORS:
+                            job["errors"].append({"record": record_number, "error": str(e)})
+                    if len(batch) >= self.batch_size:
+                        await self._flush(username, job, batch)
+
+        try:
+            async for chunk in chunks:
+                if not chunk:
+                    continue
+                job["bytes_received"] += len(chunk)
+                if parser is None:
+                    job["format"] = job["format"] or sniff_import_format(chunk)
+                    parser = _create_parser(job["format"])
+                await handle(parser.feed(chunk))
+            if parser is not None:
+                await handle(parser.close())
+            await self._flush(username, job, batch)
+            job["status"] = "completed"
+        except UnicodeDecodeError as e:
+            job["status"], job["error"] = "failed", f"输入不是有效的 UTF-8: {e.reason}"
+            raise ImportFormatError(job["error"])
+        except Exception as e:
+            job["status"], job["error"] = "failed", str(e)
+            raise
+        finally:
+            job["finished_at"] = time.time()
+        print(f"[IMPORT] {username}: {job['imported']} cities imported, {job['rejected']} rejected ({job['format']}, {job['bytes_received']} bytes)")
+        return dict(job, errors=list(job["errors"]))
+
+    async def _flush(self, username: str, job: Dict[str, Any], batch: List[Dict[str, Any]]):
+        if not batch:
+            return
+        added = await self.user_dao.add_cities(username, list(batch))
+        if added is None:
+            raise LookupError("用户不存在")
+        job["imported"] += len(added)
+        job["batches"] += 1
+        batch.clear()
+
+
+_trail_import_service: Optional[TrailImportService] = None
+
+
+def get_trail_import_service() -> TrailImportService:
+    """进程内共享的导入服务 (进度记录需要在上传请求和查询请求之间共享)。"""
+    global _trail_import_service
+    if _trail_import_service is None:
+        _trail_import_service = TrailImportService(get_async_user_dao(), ImportJobRegistry())
+    return _trail_import_service
@@ -0,0 +1,130 @@
+# backend/business_logic_layer/trail_statistics.py
+# 旅行统计引擎 (NumPy 向量化)
+# 对整条轨迹的经纬度数组一次性计算相邻城市间的大圆距离 (haversine)，
+# 再按交通方式、国家、访问年月分组统计，供统计页面一次请求取得全部数据。
+
+import re
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from ..data_access_layer.trail_aggregates import EARTH_RADIUS_KM, UNKNOWN_TRANSPORT_MODE
+
+# 统计需要的城市字段 (不读取博客和照片)
+STATS_CITY_FIELDS = ("city", "country", "latitude", "longitude", "transport_mode", "visit_date")
+_MONTH_PATTERN = re.compile(r"^\d{4}-\d{2}$")
+
+
+def haversine_km(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """两组点之间的大圆距离 (km)，参数为角度制的数组 (或标量)，逐元素计算。"""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(value, dtype=np.float64)) for value in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def cities_to_columns(cities: List[Dict[str, Any]], fields: Sequence[str] = STATS_CITY_FIELDS) -> Dict[str, List[Any]]:
+    """城市字典列表 -> 按字段的列 (DAO 的 list_city_columns 直接返回这种结构)。"""
+    return {field: [city.get(field) for city in cities] for field in fields}
+
+
+def float_column(values: Sequence[Any]) -> np.ndarray:
+    """坐标列 -> float64 数组；None 转为 NaN，个别无法转换的值 (如字符串) 逐个处理。"""
+    try:
+        return np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        column = np.full(len(values), np.nan)
+        for i, value in enumerate(values):
+            try:
+                column[i] = float(value)
+            except (TypeError, ValueError):
+                pass
+        return column
+
+
+def _factorize(values: Sequence[Any]) -> Tuple[List[Any], np.ndarray]:
+    """分类列 -> (分组名列表, 每个元素的分组编号)。用字典编号，比对字符串数组排序 (np.unique) 快得多。"""
+    index = {label: i for i, label in enumerate(dict.fromkeys(values))}
+    return list(index), np.fromiter(map(index.__getitem__, values), dtype=np.intp, count=len(values))
+
+
+def _group_counts(values: Sequence[Any]) -> Dict[Any, int]:
+    labels, codes = _factorize(values)
+    return dict(zip(labels, np.bincount(codes, minlength=len(labels)).tolist()))
+
+
+def compute_trail_statistics(columns: Dict[str, Sequence[Any]]) -> Dict[str, Any]:
+    """
+    columns 为按轨迹顺序排列的城市字段列 (见 STATS_CITY_FIELDS / cities_to_columns)。按轨迹顺序统计：
+    - 第 i 段路程 (城市 i-1 -> 城市 i) 计入到达城市 i 的交通方式；缺少经纬度的段不计距离；
+    - 国家 / 城市按访问次数计数 (同一城市多次访问只算一个城市)；
+    - 按 visit_date 的年份和月份计数。
+    """
+    count = len(columns["latitude"])
+    latitudes = float_column(columns["latitude"])
+    longitudes = float_column(columns["longitude"])
+
+    mode_labels, mode_codes = _factorize(columns["transport_mode"])
+    visits = np.bincount(mode_codes, minlength=len(mode_labels))
+    distances = np.zeros(len(mode_labels))
+    segment_counts = np.zeros(len(mode_labels), dtype=np.int64)
+    if count > 1:
+        segments = haversine_km(latitudes[:-1], longitudes[:-1], latitudes[1:], longitudes[1:])
+        valid = np.isfinite(segments)
+        arriving_modes = mode_codes[1:][valid]
+        distances = np.bincount(arriving_modes, weights=segments[valid], minlength=len(mode_labels))
+        segment_counts = np.bincount(arriving_modes, minlength=len(mode_labels))
+    mode_stats: Dict[str, Dict[str, Any]] = {}
+    for label, city_count, segment_count, distance in zip(mode_labels, visits.tolist(), segment_counts.tolist(), distances.tolist()):
+        # None 和空字符串都归入 unknown
+        stats = mode_stats.setdefault(label or UNKNOWN_TRANSPORT_MODE, {"cities": 0, "segments": 0, "distance_km": 0.0})
+        stats["cities"] += city_count
+        stats["segments"] += segment_count
+        stats["distance_km"] += distance
+
+    countries = {country: visits for country, visits in _group_counts(columns["country"]).items() if country}
+    city_pairs = set(zip(columns["city"], columns["country"]))
+    unique_cities = len(city_pairs) - sum(1 for city, _ in city_pairs if not city)
+    # visit_date 截取前 7 个字符 ("YYYY-MM") 后分组，再校验分组名，无效日期 (包括 None) 被丢弃
+    month_column = np.array(columns["visit_date"], dtype="U7").tolist() if count else []
+    months = {month: visits for month, visits in sorted(_group_counts(month_column).items()) if _MONTH_PATTERN.match(month)}
+    years: Dict[str, int] = {}
+    for month, visits in months.items():
+        years[month[:4]] = years.get(month[:4], 0) + visits
+
+    return {
+        "city_count": count,
+        "unique_city_count": unique_cities,
+        "country_count": len(countries),
+        "total_distance_km": round(sum(stats["distance_km"] for stats in mode_stats.values()), 3),
+        "countries": dict(sorted(countries.items(), key=lambda item: (-item[1], item[0]))),
+        "transport_modes": {
+            mode: dict(stats, distance_km=round(stats["distance_km"], 3)) for mode, stats in sorted(mode_stats.items())
+        },
+        "by_year": years,
+        "by_month": months,
+        "first_visit_month": min(months) if months else None,
+        "last_visit_month": max(months) if months else None,
+    }
+
+
+def diff_trail_statistics(stored: Dict[str, Any], computed: Dict[str, Any], tolerance_km: float = 0.01) -> Dict[str, Any]:
+    """
+    比较增量维护的统计结果与从城市重新计算的结果，返回不一致的字段 {字段: {"stored", "computed"}}。
+    距离是浮点累加，允许 tolerance_km 以内的误差。
+    """
+    differences: Dict[str, Any] = {}
+    for field, expected in computed.items():
+        actual = stored.get(field)
+        if field == "total_distance_km":
+            same = actual is not None and abs(actual - expected) <= tolerance_km
+        elif field == "transport_modes":
+            same = (actual or {}).keys() == expected.keys() and all(
+                actual[mode]["cities"] == stats["cities"] and actual[mode]["segments"] == stats["segments"]
+                and abs(actual[mode]["distance_km"] - stats["distance_km"]) <= tolerance_km
+                for mode, stats in expected.items()
+            )
+        else:
+            same = actual == expected
+        if not same:
+            differences[field] = {"stored": actual, "computed": expected}
+    return differences
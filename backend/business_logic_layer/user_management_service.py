@@ -9,7 +9,8 @@ import base64
 from typing import Optional, Dict
 
 # 从上级目录导入 DAO 和 schemas
-from ..data_access_layer.user_management_dao import UserManagementDAO
+from ..data_access_layer.dao_factory import get_user_dao
+from ..data_access_layer.errors import DuplicateEmailError
 # from ..data_access_layer.models import User # 如果 User 是 ORM 模型
 from ..presentation_layer.schemas import UserCreateSchema, UserUpdateSchema, UserResponseSchema, TokenSchema
 # 假设密码哈希和验证的函数 (后续应替换为更安全的库如 passlib)
@@ -28,7 +29,7 @@ def get_password_hash(password: str) -> str:
 
 class UserManagementService:
     def __init__(self):
-        self.user_dao = UserManagementDAO() 
+        self.user_dao = get_user_dao() # 按 DATABASE_URI 选择 JSON 或 SQLite 存储
 
     def create_user(self, user_create_data: UserCreateSchema) -> UserResponseSchema:
         """
@@ -41,9 +42,10 @@ class UserManagementService:
         if existing_user_by_username:
             raise ValueError(f"用户名 '{user_create_data.username}' 已存在。")
         
+        # 提前检查只为尽早返回；并发注册同一邮箱时由 DAO 在写入时原子地拒绝 (同样抛出 DuplicateEmailError)
         existing_user_by_email = self.user_dao.find_user_by_email(user_create_data.email)
         if existing_user_by_email:
-            raise ValueError(f"邮箱 '{user_create_data.email}' 已被使用。")
+            raise DuplicateEmailError(user_create_data.email)
 
         # 密码哈希 (当前为占位符，实际应使用类似 passlib 的库)
         hashed_password = get_password_hash(user_create_data.password)
@@ -58,8 +60,8 @@ class UserManagementService:
         }
         
         # DAO 层应该处理实际的保存逻辑，并可能返回保存后的用户数据（包含ID等）
-        # 这里假设 DAO 的 save_user 接受一个字典并返回一个字典
-        saved_user_dict = self.user_dao.save_user(user_data_to_save) 
+        # 这里假设 DAO 的 save_user 接受一个字典并返回一个字典；overwrite=False 防止并发注册同名用户互相覆盖
+        saved_user_dict = self.user_dao.save_user(user_data_to_save, overwrite=False) 
         
         return UserResponseSchema(**saved_user_dict)
 
@@ -3,12 +3,68 @@
 
 import os
 
-# 数据库配置 (示例，后续根据实际选择的数据库进行修改)
+# 数据库配置：sqlite:///路径 使用 SQLite 存储 (相对路径以项目根目录为基准)；json:// 使用分片 JSON 文件存储
+# 默认为 SQLite：首次启动时一次性导入已有的 JSON 用户数据 (见 SQLiteUserDAO._import_json_store_once)；设置为 json:// 可继续使用 JSON 存储
 DATABASE_URI = os.environ.get("DATABASE_URI", "sqlite:///./backend/data_access_layer/default_travel_trails.db") # 更具体的默认路径
 
+# JSON 分片存储目录 (每个用户一个记录文件 + manifest.json)，为空时使用 data_access_layer/users_data
+USERS_DATA_DIR = os.environ.get("USERS_DATA_DIR")
+# 进程内用户记录缓存的最大条目数 (LRU 淘汰)
+USER_CACHE_MAX_ENTRIES = int(os.environ.get("USER_CACHE_MAX_ENTRIES", 256))
+# 用户追加日志达到多少条变更后，由后台线程压缩进新的快照
+JOURNAL_COMPACT_THRESHOLD = int(os.environ.get("JOURNAL_COMPACT_THRESHOLD", 64))
+# 照片存储目录 (按内容哈希存放的照片文件)，为空时使用 data_access_layer/photo_blobs
+PHOTO_STORE_DIR = os.environ.get("PHOTO_STORE_DIR")
+# 单张照片上传的大小上限 (字节)，超过时返回 413
+MAX_PHOTO_UPLOAD_BYTES = int(os.environ.get("MAX_PHOTO_UPLOAD_BYTES", 20 * 1024 * 1024))
+# 生成缩略图/中等尺寸照片的进程池大小 (图片解码是 CPU 密集型，放在独立进程中执行)
+PHOTO_VARIANT_WORKERS = int(os.environ.get("PHOTO_VARIANT_WORKERS", min(4, os.cpu_count() or 1)))
+# 清理未被任何用户引用的照片 (及其缩略图)：检查间隔 (只在有照片/城市/用户被删除后才扫描)；
+# 修改时间在宽限期内的照片不删除 (上传后尚未写入用户记录)
+PHOTO_GC_INTERVAL_SECONDS = float(os.environ.get("PHOTO_GC_INTERVAL_SECONDS", 600))
+PHOTO_GC_GRACE_SECONDS = float(os.environ.get("PHOTO_GC_GRACE_SECONDS", 3600))
+# 执行文件/数据库 I/O 的线程池大小 (asyncio 默认执行器)，决定可同时进行的存储操作数
+IO_THREAD_POOL_SIZE = int(os.environ.get("IO_THREAD_POOL_SIZE", 32))
+# 批量导入轨迹时每批写入的城市数 (每批一次写入/一个事务)
+IMPORT_BATCH_SIZE = int(os.environ.get("IMPORT_BATCH_SIZE", 500))
+# 导入进度记录在内存中保留的任务数
+IMPORT_JOBS_MAX_ENTRIES = int(os.environ.get("IMPORT_JOBS_MAX_ENTRIES", 100))
+# 空间索引查询 (视野内城市 / 附近城市) 单次返回的城市数上限
+GEO_QUERY_MAX_RESULTS = int(os.environ.get("GEO_QUERY_MAX_RESULTS", 5000))
+# 简化轨迹几何 (地图折线) 缓存的用户数，每个用户只缓存最新版本
+TRAIL_GEOMETRY_CACHE_MAX_ENTRIES = int(os.environ.get("TRAIL_GEOMETRY_CACHE_MAX_ENTRIES", 256))
+
 # AI 服务相关的配置
 AI_MODEL_ENDPOINT = os.environ.get("AI_MODEL_ENDPOINT", "https://chat.zju.edu.cn/api/ai/v1/chat/completions") # 默认使用浙大端点
 DEEPSEEK_API_KEY = os.environ.get("DEEPSEEK_API_KEY")
+# AI 推荐结果缓存：同一组已访问城市在有效期内直接返回上次的推荐
+RECOMMENDATION_CACHE_TTL_SECONDS = float(os.environ.get("RECOMMENDATION_CACHE_TTL_SECONDS", 24 * 3600))
+RECOMMENDATION_CACHE_MAX_ENTRIES = int(os.environ.get("RECOMMENDATION_CACHE_MAX_ENTRIES", 1024))
+# 推荐缓存的持久化文件 (JSON)，为空时只缓存在内存中
+RECOMMENDATION_CACHE_FILE = os.environ.get("RECOMMENDATION_CACHE_FILE")
+# 地理编码缓存 (SQLite) 的路径，为空时使用 data_access_layer/geocode_cache.db
+GEOCODE_CACHE_PATH = os.environ.get("GEOCODE_CACHE_PATH")
+# 地理编码结果的有效期；查不到的地点 (负缓存) 有效期较短，之后会重新查询
+GEOCODE_CACHE_TTL_SECONDS = float(os.environ.get("GEOCODE_CACHE_TTL_SECONDS", 90 * 24 * 3600))
+GEOCODE_NEGATIVE_TTL_SECONDS = float(os.environ.get("GEOCODE_NEGATIVE_TTL_SECONDS", 24 * 3600))
+# 离线地名库目录 (cities.csv / countries.csv)，默认使用 data_access_layer/gazetteer_data 中随代码分发的数据
+GAZETTEER_DIR = os.environ.get("GAZETTEER_DIR")
+# 在线地理编码 (Nominatim)：服务地址、User-Agent (使用政策要求标识应用)、单次请求超时
+NOMINATIM_URL = os.environ.get("NOMINATIM_URL", "https://nominatim.openstreetmap.org/search")
+NOMINATIM_USER_AGENT = os.environ.get("NOMINATIM_USER_AGENT", "travel_recommender_app_backend")
+GEOCODE_TIMEOUT_SECONDS = float(os.environ.get("GEOCODE_TIMEOUT_SECONDS", 15))
+# 在线地理编码的令牌桶限速 (整个进程共享，公共 Nominatim 要求每秒最多 1 次) 和同时进行的请求数上限
+GEOCODE_RATE_PER_SECOND = float(os.environ.get("GEOCODE_RATE_PER_SECOND", 1.0))
+GEOCODE_BURST = int(os.environ.get("GEOCODE_BURST", 1))
+GEOCODE_MAX_CONCURRENCY = int(os.environ.get("GEOCODE_MAX_CONCURRENCY", 2))
+# 推荐服务共享的 HTTP 连接池 (大模型接口和 Nominatim)：最大连接数、保持空闲的 keep-alive 连接数及其保留时间
+HTTP_MAX_CONNECTIONS = int(os.environ.get("HTTP_MAX_CONNECTIONS", 20))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get("HTTP_MAX_KEEPALIVE_CONNECTIONS", 10))
+HTTP_KEEPALIVE_EXPIRY_SECONDS = float(os.environ.get("HTTP_KEEPALIVE_EXPIRY_SECONDS", 60))
+# 安装了 h2 时是否使用 HTTP/2 (同一连接上多路复用并发请求)
+HTTP2_ENABLED = os.environ.get("HTTP2_ENABLED", "true").lower() in ["true", "1", "t"]
+# 是否开放 /internal/cache-stats (各缓存和索引的内部统计，仅用于调优)，默认关闭
+CACHE_STATS_ENDPOINT_ENABLED = os.environ.get("CACHE_STATS_ENDPOINT_ENABLED", "false").lower() in ["true", "1", "t"]
 
 # JWT 或其他认证相关的配置
 SECRET_KEY = os.environ.get("SECRET_KEY", "a_very_secret_key_for_dev_please_change_this")
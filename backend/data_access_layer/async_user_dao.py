@@ -0,0 +1,71 @@
+# backend/data_access_layer/async_user_dao.py
+# 用户 DAO 的异步接口：把同步 DAO (JSON 文件或 SQLite) 的调用放到线程池执行，
+# 路由中 await 使用，文件/数据库 I/O 不再阻塞事件循环。
+
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple
+
+from .trail_ops import DEFAULT_CITY_LIST_FIELDS, ItemKey
+
+
+class AsyncUserDAO:
+    def __init__(self, dao):
+        self.dao = dao  # 底层同步 DAO，供需要批量同步操作的场景直接在线程中使用
+
+    async def list_usernames(self) -> List[str]:
+        return await asyncio.to_thread(self.dao.list_usernames)
+
+    async def find_user_by_username(self, username: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.dao.find_user_by_username, username)
+
+    async def find_user_by_email(self, email: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.dao.find_user_by_email, email)
+
+    async def save_user(self, user_data_to_save: Dict[str, Any], overwrite: bool = True) -> Dict[str, Any]:
+        return await asyncio.to_thread(self.dao.save_user, user_data_to_save, overwrite)
+
+    async def update_user(self, username: str, update_data: Dict[str, Any], expected_version: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.dao.update_user, username, update_data, expected_version)
+
+    async def delete_user(self, username: str) -> bool:
+        return await asyncio.to_thread(self.dao.delete_user, username)
+
+    async def user_has_photo(self, username: str, ref: str) -> bool:
+        return await asyncio.to_thread(self.dao.user_has_photo, username, ref)
+
+    async def get_user_version(self, username: str) -> Optional[int]:
+        return await asyncio.to_thread(self.dao.get_user_version, username)
+
+    async def list_cities(self, username: str, offset: int = 0, limit: Optional[int] = None,
+                          fields: Tuple[str, ...] = DEFAULT_CITY_LIST_FIELDS) -> Optional[Tuple[List[Dict[str, Any]], int]]:
+        return await asyncio.to_thread(self.dao.list_cities, username, offset, limit, fields)
+
+    async def get_trail_stats(self, username: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.dao.get_trail_stats, username)
+
+    async def rebuild_trail_stats(self, username: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.dao.rebuild_trail_stats, username)
+
+    async def list_city_columns(self, username: str, fields: Tuple[str, ...]) -> Optional[Dict[str, List[Any]]]:
+        return await asyncio.to_thread(self.dao.list_city_columns, username, fields)
+
+    async def get_city(self, username: str, city_key: ItemKey) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.dao.get_city, username, city_key)
+
+    async def add_city(self, username: str, city_data: Dict[str, Any], expected_version: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.dao.add_city, username, city_data, expected_version)
+
+    async def add_cities(self, username: str, cities: List[Dict[str, Any]], expected_version: Optional[int] = None) -> Optional[List[Dict[str, Any]]]:
+        return await asyncio.to_thread(self.dao.add_cities, username, cities, expected_version)
+
+    async def remove_city(self, username: str, city_key: ItemKey, expected_version: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.dao.remove_city, username, city_key, expected_version)
+
+    async def update_city_blog(self, username: str, city_key: ItemKey, blog: Optional[str], expected_version: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.dao.update_city_blog, username, city_key, blog, expected_version)
+
+    async def add_photo(self, username: str, city_key: ItemKey, photo: Dict[str, Any], expected_version: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.dao.add_photo, username, city_key, photo, expected_version)
+
+    async def remove_photo(self, username: str, city_key: ItemKey, photo_key: ItemKey, expected_version: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.dao.remove_photo, username, city_key, photo_key, expected_version)
@@ -0,0 +1,53 @@
+# backend/data_access_layer/dao_factory.py
+# 根据 config.DATABASE_URI 选择用户存储后端，并在进程内复用同一个 DAO 实例
+#   sqlite:///相对或绝对路径  -> SQLiteUserManagementDAO (相对路径以项目根目录为基准)
+#   json://                   -> 基于分片 JSON 文件的 UserManagementDAO (目录见 USERS_DATA_DIR)
+
+import os
+import threading
+from typing import Union
+
+from ..config import DATABASE_URI
+from .user_management_dao import UserManagementDAO
+from .sqlite_user_dao import SQLiteUserManagementDAO
+from .async_user_dao import AsyncUserDAO
+
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_user_dao = None
+_async_user_dao = None
+_user_dao_lock = threading.Lock()
+
+
+def sqlite_path_from_uri(uri: str) -> str:
+    """sqlite:///./a/b.db -> <项目根目录>/a/b.db；sqlite:////abs/b.db -> /abs/b.db"""
+    path = uri[len("sqlite:///"):]
+    if not os.path.isabs(path):
+        path = os.path.join(_PROJECT_ROOT, path)
+    return os.path.normpath(path)
+
+
+def create_user_dao(uri: str = DATABASE_URI) -> Union[UserManagementDAO, SQLiteUserManagementDAO]:
+    if uri.startswith("sqlite:///"):
+        return SQLiteUserManagementDAO(sqlite_path_from_uri(uri))
+    if uri.startswith("json://"):
+        return UserManagementDAO()
+    raise ValueError(f"Unsupported DATABASE_URI: {uri}")
+
+
+def get_user_dao() -> Union[UserManagementDAO, SQLiteUserManagementDAO]:
+    """进程内共享的用户 DAO (首次调用时按 DATABASE_URI 创建)。"""
+    global _user_dao
+    if _user_dao is None:
+        with _user_dao_lock:
+            if _user_dao is None:
+                _user_dao = create_user_dao()
+    return _user_dao
+
+
+def get_async_user_dao() -> AsyncUserDAO:
+    """同一个 DAO 的异步包装，供 async 路由 await 使用。"""
+    global _async_user_dao
+    if _async_user_dao is None:
+        _async_user_dao = AsyncUserDAO(get_user_dao())
+    return _async_user_dao
@@ -0,0 +1,28 @@
+# backend/data_access_layer/errors.py
+# 数据访问层抛出的异常 (JSON 与 SQLite 两种存储后端共用)
+
+
+class VersionConflictError(Exception):
+    """乐观并发控制：调用方基于的记录版本已过期 (其他请求先一步修改了该用户)。"""
+
+    def __init__(self, username: str, expected_version: int, current_version: int):
+        self.username = username
+        self.expected_version = expected_version
+        self.current_version = current_version
+        super().__init__(f"用户 '{username}' 的数据已被修改 (期望版本 {expected_version}，当前版本 {current_version})")
+
+
+class PhotoTooLargeError(ValueError):
+    """上传的照片超过 MAX_PHOTO_UPLOAD_BYTES。"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        super().__init__(f"照片大小超过上限 ({max_bytes // (1024 * 1024)} MB)")
+
+
+class DuplicateEmailError(ValueError):
+    """邮箱已被其他用户使用 (两种存储后端都在写入时原子地检查)。"""
+
+    def __init__(self, email: str):
+        self.email = email
+        super().__init__(f"邮箱 '{email}' 已被使用。")
@@ -0,0 +1,167 @@
+# backend/data_access_layer/gazetteer.py
+# 离线地名库：常见旅游城市的中英文名称、国家和经纬度 (gazetteer_data/*.csv，随代码分发)。
+# 推荐服务先在这里解析城市坐标，查不到才请求 Nominatim；同一个索引也用于添加城市时的自动补全。
+# 索引是按规范化名称排序的数组 (名称 + 城市编号)，精确查找和前缀查找都用二分，不需要 trie 的大量小对象。
+
+import csv
+import os
+import re
+import threading
+import unicodedata
+from array import array
+from bisect import bisect_left
+from typing import Any, Dict, FrozenSet, List, Optional, Set, Tuple
+
+from ..config import GAZETTEER_DIR
+from .recommendation_cache import normalize_place_name
+
+_DAO_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_GAZETTEER_DIR = GAZETTEER_DIR or os.path.join(_DAO_DIR, "gazetteer_data")
+# 名称中忽略的标点 (Xi'an / Xian、St. Petersburg / St Petersburg、Washington D.C. / DC)
+_IGNORED_PUNCTUATION = re.compile(r"[.'’·\-]")
+_CJK = re.compile(r"[㐀-鿿豈-﫿]")
+# 前缀查询最多检查的索引条目数 (单个字符的前缀可能匹配很多名称)
+_MAX_PREFIX_SCAN = 5000
+
+
+def gazetteer_key(name: Optional[str]) -> str:
+    """
+    索引和查询使用的名称键：在 normalize_place_name 基础上去掉变音符号 (São Paulo -> sao paulo)、
+    忽略常见标点，中文名称去掉末尾的"市" (北京市 -> 北京)。
+    """
+    key = normalize_place_name(name)
+    key = "".join(ch for ch in unicodedata.normalize("NFD", key) if not unicodedata.combining(ch))
+    key = " ".join(_IGNORED_PUNCTUATION.sub(" ", key).split())
+    if len(key) >= 3 and key.endswith("市") and _CJK.match(key):
+        key = key[:-1]
+    return unicodedata.normalize("NFC", key)
+
+
+def _split_aliases(value: Optional[str]) -> List[str]:
+    return [alias for alias in (value or "").split("|") if alias.strip()]
+
+
+class Gazetteer:
+    def __init__(self, data_dir: str = DEFAULT_GAZETTEER_DIR):
+        self.data_dir = data_dir
+        # code -> (name_en, name_zh)；国家名称、别名和代码的规范化键 -> codes
+        # (一个名称可以对应多个代码，例如"中国"也匹配香港、澳门、台湾的城市)
+        self._countries: Dict[str, Tuple[str, str]] = {}
+        self._country_codes: Dict[str, Set[str]] = {}
+        # 城市编号 -> (name_en, name_zh, country_code, latitude, longitude)，编号即数据文件中的顺序 (越靠前越常用)
+        self._cities: List[Tuple[str, str, str, float, float]] = []
+        # 排序后的名称键，与 _city_ids 一一对应 (同一城市的中英文名和别名各占一项)
+        self._keys: List[str] = []
+        self._city_ids = array("I")
+        self._load()
+
+    def _load(self):
+        with open(os.path.join(self.data_dir, "countries.csv"), "r", encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f):
+                code = row["code"].strip().upper()
+                self._countries[code] = (row["name_en"], row["name_zh"])
+                for name in (code, row["name_en"], row["name_zh"], *_split_aliases(row.get("aliases"))):
+                    self._country_codes.setdefault(gazetteer_key(name), set()).add(code)
+        entries = []
+        with open(os.path.join(self.data_dir, "cities.csv"), "r", encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f):
+                try:
+                    city = (row["name_en"], row["name_zh"], row["country_code"].strip().upper(),
+                            float(row["latitude"]), float(row["longitude"]))
+                except (KeyError, TypeError, ValueError):
+                    print(f"[GAZETTEER] Skipping malformed row: {row}")
+                    continue
+                city_id = len(self._cities)
+                self._cities.append(city)
+                keys = {gazetteer_key(name) for name in (city[0], city[1], *_split_aliases(row.get("aliases")))}
+                entries.extend((key, city_id) for key in keys if key)
+        entries.sort()
+        self._keys = [key for key, _ in entries]
+        self._city_ids = array("I", (city_id for _, city_id in entries))
+        print(f"[GAZETTEER] Loaded {len(self._cities)} cities ({len(self._keys)} names) from {self.data_dir}")
+
+    def country_codes(self, country: Optional[str]) -> FrozenSet[str]:
+        """国家名称 (中文、英文、别名) 或 ISO 代码 -> 匹配的 ISO 代码；不认识时为空集合。"""
+        return frozenset(self._country_codes.get(gazetteer_key(country), ()))
+
+    def _exact_ids(self, key: str) -> List[int]:
+        start = bisect_left(self._keys, key)
+        end = start
+        while end < len(self._keys) and self._keys[end] == key:
+            end += 1
+        return sorted(self._city_ids[start:end])
+
+    def resolve(self, city: Optional[str], country: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        按名称精确查找城市；给出国家时只匹配该国的同名城市 (国家不认识时视为查不到，交给在线地理编码)。
+        没有国家时返回数据文件中最靠前 (最常用) 的同名城市。
+        """
+        city_ids = self._exact_ids(gazetteer_key(city))
+        if not city_ids:
+            return None
+        if country and gazetteer_key(country):
+            codes = self.country_codes(country)
+            city_ids = [city_id for city_id in city_ids if self._cities[city_id][2] in codes]
+            if not city_ids:
+                return None
+        return self._to_dict(city_ids[0], prefer_zh=bool(_CJK.search(city or "")))
+
+    def autocomplete(self, prefix: Optional[str], limit: int = 10, country: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        名称以 prefix 开头的城市：名称完全相同的排在前面，其余按数据文件中的顺序。
+        输入中文时返回中文名称，否则返回英文名称。
+        """
+        key = gazetteer_key(prefix)
+        if not key or limit <= 0:
+            return []
+        codes = self.country_codes(country) if country else None
+        if codes is not None and not codes:
+            return []
+        exact, partial = [], set()
+        start = bisect_left(self._keys, key)
+        for position in range(start, min(start + _MAX_PREFIX_SCAN, len(self._keys))):
+            name = self._keys[position]
+            if not name.startswith(key):
+                break
+            city_id = self._city_ids[position]
+            if codes is not None and self._cities[city_id][2] not in codes:
+                continue
+            if name == key:
+                exact.append(city_id)
+            else:
+                partial.add(city_id)
+        ordered = sorted(set(exact)) + sorted(partial.difference(exact))
+        prefer_zh = bool(_CJK.search(prefix or ""))
+        return [self._to_dict(city_id, prefer_zh) for city_id in ordered[:limit]]
+
+    def _to_dict(self, city_id: int, prefer_zh: bool) -> Dict[str, Any]:
+        name_en, name_zh, code, latitude, longitude = self._cities[city_id]
+        country_en, country_zh = self._countries.get(code, (code, code))
+        return {
+            "city": name_zh if prefer_zh else name_en,
+            "country": country_zh if prefer_zh else country_en,
+            "city_en": name_en,
+            "city_zh": name_zh,
+            "country_en": country_en,
+            "country_zh": country_zh,
+            "country_code": code,
+            "latitude": latitude,
+            "longitude": longitude,
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {"cities": len(self._cities), "names": len(self._keys), "countries": len(self._countries)}
+
+
+_gazetteer: Optional[Gazetteer] = None
+_gazetteer_lock = threading.Lock()
+
+
+def get_gazetteer() -> Gazetteer:
+    """进程内共享的离线地名库 (第一次使用时加载数据文件)。"""
+    global _gazetteer
+    if _gazetteer is None:
+        with _gazetteer_lock:
+            if _gazetteer is None:
+                _gazetteer = Gazetteer()
+    return _gazetteer
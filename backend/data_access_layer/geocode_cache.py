@@ -0,0 +1,195 @@
+# backend/data_access_layer/geocode_cache.py
+# 持久化的地理编码缓存 (SQLite)："城市, 国家" -> 经纬度。
+# 键是规范化后的查询 (大小写、全半角、空白不影响命中)，所有用户共享，重启后仍然有效。
+# 查不到的地点也会缓存 (负缓存)，有效期较短，避免对同一个无效地名反复请求 Nominatim。
+# 缓存由两部分数据预热：预定义推荐的坐标、用户轨迹中已保存的城市坐标 (见 warm_from_user_dao)。
+
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from ..config import GEOCODE_CACHE_PATH, GEOCODE_CACHE_TTL_SECONDS, GEOCODE_NEGATIVE_TTL_SECONDS
+from .models import configure_connection
+from .recommendation_cache import normalize_place_name
+from .trail_ops import TRAIL_CITIES_ADDED, TRAIL_REPLACED
+
+_DAO_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_GEOCODE_CACHE_PATH = GEOCODE_CACHE_PATH or os.path.join(_DAO_DIR, "geocode_cache.db")
+# 预热时读取的城市字段
+_WARM_CITY_FIELDS = ("city", "country", "latitude", "longitude")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS geocodes (
+    query TEXT PRIMARY KEY,   -- normalize_geocode_query 的结果
+    latitude REAL,            -- 为 NULL 表示查不到 (负缓存)
+    longitude REAL,
+    source TEXT NOT NULL,     -- nominatim / predefined / user
+    expires_at REAL NOT NULL  -- time.time() 时间
+)
+"""
+# 新数据覆盖已有条目的条件：已有条目是负缓存或已过期 (预热时不覆盖有效的地理编码结果)
+_UPSERT_IF_STALE = """
+INSERT INTO geocodes (query, latitude, longitude, source, expires_at) VALUES (?, ?, ?, ?, ?)
+ON CONFLICT(query) DO UPDATE SET
+    latitude = excluded.latitude, longitude = excluded.longitude, source = excluded.source, expires_at = excluded.expires_at
+WHERE geocodes.latitude IS NULL OR geocodes.expires_at <= ?
+"""
+
+
+def normalize_geocode_query(city: Optional[str], country: Optional[str]) -> str:
+    return f"{normalize_place_name(city)}, {normalize_place_name(country)}"
+
+
+def _valid_coordinates(latitude: Any, longitude: Any) -> Optional[Tuple[float, float]]:
+    try:
+        latitude, longitude = float(latitude), float(longitude)
+    except (TypeError, ValueError):
+        return None
+    if -90.0 <= latitude <= 90.0 and -180.0 <= longitude <= 180.0:
+        return latitude, longitude
+    return None
+
+
+class GeocodeCache:
+    def __init__(self, db_path: str = DEFAULT_GEOCODE_CACHE_PATH, ttl_seconds: float = GEOCODE_CACHE_TTL_SECONDS,
+                 negative_ttl_seconds: float = GEOCODE_NEGATIVE_TTL_SECONDS):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self._local = threading.local()
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._conn().execute(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        """每个线程一个连接，自动提交 (每次写入都是单条语句或 executemany)。"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, isolation_level=None)
+            configure_connection(conn)
+            self._local.conn = conn
+        return conn
+
+    def get(self, city: Optional[str], country: Optional[str]) -> Optional[Dict[str, Any]]:
+        """
+        未缓存或已过期时返回 None；命中时返回 {"latitude", "longitude", "source"}，
+        负缓存命中时经纬度为 None (调用方不应再请求地理编码服务)。
+        """
+        row = self._conn().execute(
+            "SELECT latitude, longitude, source FROM geocodes WHERE query = ? AND expires_at > ?",
+            (normalize_geocode_query(city, country), time.time()),
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        if row[0] is None:
+            self.negative_hits += 1
+        else:
+            self.hits += 1
+        return {"latitude": row[0], "longitude": row[1], "source": row[2]}
+
+    def get_many(self, queries: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        批量读取 (参数为 normalize_geocode_query 的结果)，返回 {query: 与 get 相同的结果}，未命中的查询不在结果中。
+        一次 SQL 查询完成，供推荐服务在一次线程切换内查完所有地点。
+        """
+        queries = list(dict.fromkeys(queries))
+        found = {}
+        now = time.time()
+        for start in range(0, len(queries), 500):  # 避免超过 SQLite 的参数个数上限
+            chunk = queries[start:start + 500]
+            rows = self._conn().execute(
+                f"SELECT query, latitude, longitude, source FROM geocodes WHERE query IN ({', '.join('?' * len(chunk))}) AND expires_at > ?",
+                (*chunk, now),
+            ).fetchall()
+            for query, latitude, longitude, source in rows:
+                found[query] = {"latitude": latitude, "longitude": longitude, "source": source}
+        negative = sum(1 for entry in found.values() if entry["latitude"] is None)
+        self.negative_hits += negative
+        self.hits += len(found) - negative
+        self.misses += len(queries) - len(found)
+        return found
+
+    def put(self, city: Optional[str], country: Optional[str], latitude: Optional[float], longitude: Optional[float],
+            source: str = "nominatim"):
+        """保存地理编码结果；latitude/longitude 为 None 表示查不到，使用较短的负缓存有效期。"""
+        self.put_many([(normalize_geocode_query(city, country), latitude, longitude)], source=source)
+
+    def put_many(self, results: Iterable[Tuple[str, Optional[float], Optional[float]]], source: str = "nominatim"):
+        """批量保存 [(normalize_geocode_query 的结果, latitude, longitude)]，规则与 put 相同。"""
+        now = time.time()
+        rows = []
+        for query, latitude, longitude in results:
+            missing = latitude is None or longitude is None
+            ttl = self.negative_ttl_seconds if missing else self.ttl_seconds
+            rows.append((query, None if missing else latitude, None if missing else longitude, source, now + ttl))
+        if rows:
+            self._conn().executemany(
+                "INSERT OR REPLACE INTO geocodes (query, latitude, longitude, source, expires_at) VALUES (?, ?, ?, ?, ?)", rows
+            )
+
+    def warm(self, places: Iterable[Dict[str, Any]], source: str) -> int:
+        """
+        用已知坐标的地点 ({"city", "country", "latitude", "longitude"}) 预热，返回写入的条目数。
+        不覆盖仍然有效的地理编码结果，只填补缺失、负缓存或已过期的条目。
+        """
+        now = time.time()
+        rows = {}
+        for place in places:
+            coordinates = _valid_coordinates(place.get("latitude"), place.get("longitude"))
+            if coordinates is None or not place.get("city"):
+                continue
+            rows.setdefault(normalize_geocode_query(place.get("city"), place.get("country")), coordinates)
+        if not rows:
+            return 0
+        conn = self._conn()
+        before = conn.total_changes
+        conn.executemany(
+            _UPSERT_IF_STALE,
+            [(query, latitude, longitude, source, now + self.ttl_seconds, now) for query, (latitude, longitude) in rows.items()],
+        )
+        return conn.total_changes - before
+
+    def warm_from_user_dao(self, user_dao) -> int:
+        """用所有用户轨迹中已保存的城市坐标预热 (按列读取，不加载博客和照片)。"""
+        written = 0
+        for username in user_dao.list_usernames():
+            columns = user_dao.list_city_columns(username, _WARM_CITY_FIELDS)
+            if columns:
+                written += self.warm((dict(zip(_WARM_CITY_FIELDS, values)) for values in zip(*columns.values())), source="user")
+        return written
+
+    def on_trail_change(self, event: str, username: str, cities):
+        """DAO 轨迹变更通知的监听者：用户新增城市的坐标也用于预热。"""
+        if event in (TRAIL_CITIES_ADDED, TRAIL_REPLACED):
+            self.warm(cities, source="user")
+
+    def purge_expired(self) -> int:
+        return self._conn().execute("DELETE FROM geocodes WHERE expires_at <= ?", (time.time(),)).rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        total, negative = self._conn().execute(
+            "SELECT COUNT(*), COUNT(*) - COUNT(latitude) FROM geocodes WHERE expires_at > ?", (time.time(),)
+        ).fetchone()
+        return {"entries": total, "negative_entries": negative, "hits": self.hits,
+                "negative_hits": self.negative_hits, "misses": self.misses}
+
+
+_geocode_cache: Optional[GeocodeCache] = None
+_geocode_cache_lock = threading.Lock()
+
+
+def get_geocode_cache() -> GeocodeCache:
+    """进程内共享的地理编码缓存。"""
+    global _geocode_cache
+    if _geocode_cache is None:
+        with _geocode_cache_lock:
+            if _geocode_cache is None:
+                _geocode_cache = GeocodeCache()
+    return _geocode_cache
@@ -0,0 +1,96 @@
+# backend/data_access_layer/lru_cache.py
+# 简单的线程安全 LRU 缓存，带命中/未命中计数，供 DAO 等缓存解析后的数据
+# 可选 TTL：条目超过有效期后在读取时丢弃 (计为 miss)，适合缓存外部服务的结果
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+
+class LRUCache:
+    def __init__(self, max_entries: int = 256, ttl_seconds: Optional[float] = None):
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._expires_at: Dict[Hashable, float] = {}  # 只包含有有效期的条目 (time.monotonic 时间)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _expired(self, key: Hashable, now: float) -> bool:
+        expires_at = self._expires_at.get(key)
+        return expires_at is not None and expires_at <= now
+
+    def _discard(self, key: Hashable):
+        del self._entries[key]
+        self._expires_at.pop(key, None)
+
+    def get(self, key: Hashable, default: Any = None, is_valid: Optional[Callable[[Any], bool]] = None) -> Any:
+        """
+        读取并把条目标记为最近使用；不存在时计一次 miss。
+        is_valid 返回 False 的条目 (例如对应文件已被修改) 和已过期的条目会被丢弃并计为 miss。
+        """
+        with self._lock:
+            if key in self._entries:
+                value = self._entries[key]
+                if self._expired(key, time.monotonic()):
+                    self.expirations += 1
+                elif is_valid is None or is_valid(value):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self._discard(key)
+            self.misses += 1
+            return default
+
+    def put(self, key: Hashable, value: Any, ttl_seconds: Optional[float] = None):
+        """ttl_seconds 不传时使用缓存的默认有效期 (默认 None 表示不过期)。"""
+        ttl_seconds = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            if ttl_seconds is None:
+                self._expires_at.pop(key, None)
+            else:
+                self._expires_at[key] = time.monotonic() + ttl_seconds
+            while len(self._entries) > self.max_entries:
+                oldest, _ = self._entries.popitem(last=False)
+                self._expires_at.pop(oldest, None)
+                self.evictions += 1
+
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._expires_at.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._expires_at.clear()
+
+    def items(self) -> List[Tuple[Hashable, Any, Optional[float]]]:
+        """未过期条目的快照 [(key, value, 剩余有效期秒数或 None)]，从最久未使用到最近使用 (用于持久化)。"""
+        with self._lock:
+            now = time.monotonic()
+            return [
+                (key, value, self._expires_at[key] - now if key in self._expires_at else None)
+                for key, value in self._entries.items()
+                if not self._expired(key, now)
+            ]
+
+    def stats(self) -> Dict[str, Optional[float]]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_ratio": (self.hits / lookups) if lookups else None,
+            }
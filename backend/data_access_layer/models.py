@@ -1,60 +1,114 @@
 # backend/data_access_layer/models.py
-# 此处定义数据库模型，例如使用 SQLAlchemy
+# SQLite 存储后端的表结构定义 (用户 / 城市 / 照片)
+# 使用标准库 sqlite3，不依赖 SQLAlchemy；表结构通过 PRAGMA user_version 做版本化迁移。
 
-# from sqlalchemy import create_engine, Column, Integer, String, ForeignKey, DateTime
-# from sqlalchemy.orm import sessionmaker, relationship
-# from sqlalchemy.ext.declarative import declarative_base
-# from datetime import datetime
-# import sys
-# sys.path.append("..") # 为了能找到 config
-# from config import DATABASE_URI
+import sqlite3
+from typing import Dict, List
 
-# Base = declarative_base()
+# 每个版本对应一组 DDL；init_db 会从数据库当前版本开始依次执行，之后的改动只需追加新版本
+SCHEMA_MIGRATIONS: Dict[int, List[str]] = {
+    1: [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY,
+            username TEXT NOT NULL,
+            email TEXT,
+            password TEXT,
+            disabled INTEGER NOT NULL DEFAULT 0,
+            age INTEGER,
+            version INTEGER NOT NULL DEFAULT 0,
+            extra TEXT -- 其他字段的 JSON，保证与 JSON 存储的字典记录兼容
+        )
+        """,
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_users_username ON users(username)",
+        "CREATE INDEX IF NOT EXISTS idx_users_email ON users(email)",
+        """
+        CREATE TABLE IF NOT EXISTS cities (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            position INTEGER NOT NULL, -- 只增不减，列表顺序按 position 排序，删除时无需重排
+            city TEXT NOT NULL,
+            country TEXT NOT NULL,
+            latitude REAL NOT NULL,
+            longitude REAL NOT NULL,
+            transport_mode TEXT,
+            blog TEXT,
+            visit_date TEXT,
+            extra TEXT
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_cities_user_position ON cities(user_id, position)",
+        """
+        CREATE TABLE IF NOT EXISTS photos (
+            id INTEGER PRIMARY KEY,
+            city_id INTEGER NOT NULL REFERENCES cities(id) ON DELETE CASCADE,
+            position INTEGER NOT NULL,
+            data TEXT,
+            extra TEXT
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_photos_city_position ON photos(city_id, position)",
+    ],
+    # 照片改为内容寻址存储：只保存引用，data 列仅保留给尚未迁移的旧照片
+    2: [
+        "ALTER TABLE photos ADD COLUMN ref TEXT",
+        "ALTER TABLE photos ADD COLUMN content_type TEXT",
+        "ALTER TABLE photos ADD COLUMN size INTEGER",
+        "CREATE INDEX IF NOT EXISTS idx_photos_ref ON photos(ref)",
+    ],
+    # 城市和照片的稳定 id (对外暴露，按 id 定位不受并发删除导致的位置变化影响)；旧数据随机生成
+    3: [
+        "ALTER TABLE cities ADD COLUMN public_id TEXT",
+        "UPDATE cities SET public_id = lower(hex(randomblob(16))) WHERE public_id IS NULL",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_cities_public_id ON cities(public_id)",
+        "ALTER TABLE photos ADD COLUMN public_id TEXT",
+        "UPDATE photos SET public_id = lower(hex(randomblob(16))) WHERE public_id IS NULL",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_photos_public_id ON photos(public_id)",
+    ],
+    # 增量维护的旅行统计聚合值 (JSON，见 trail_aggregates.py)；为 NULL 时在第一次读取/写入时从城市计算
+    4: [
+        "ALTER TABLE users ADD COLUMN trail_stats TEXT",
+    ],
+    # 邮箱唯一：旧数据中重复的邮箱只保留最早注册的用户 (按邮箱查找本来也只会找到它)，其余清空
+    5: [
+        """
+        UPDATE users SET email = NULL
+        WHERE email IS NOT NULL AND id NOT IN (SELECT MIN(id) FROM users WHERE email IS NOT NULL GROUP BY email)
+        """,
+        "DROP INDEX IF EXISTS idx_users_email",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_users_email ON users(email)",
+    ],
+    # 存储级别的标记 (如 JSON 存储是否已导入)；已有用户的库在旧版本中已经导入过 (旧版本只在空库时导入)
+    6: [
+        "CREATE TABLE IF NOT EXISTS store_meta (key TEXT PRIMARY KEY, value TEXT)",
+        "INSERT OR IGNORE INTO store_meta (key, value) SELECT 'json_store_imported', datetime('now') WHERE EXISTS (SELECT 1 FROM users)",
+    ],
+}
 
-# # 示例：用户模型
-# class User(Base):
-#     __tablename__ = 'users'
-#     id = Column(Integer, primary_key=True)
-#     username = Column(String(50), unique=True, nullable=False)
-#     email = Column(String(120), unique=True, nullable=False)
-#     password_hash = Column(String(128))
-#     created_at = Column(DateTime, default=datetime.utcnow)
-#
-#     # 如果有用户画像或偏好等，可以在此定义关联
-#     # preferences = relationship("UserPreference", back_populates="user")
-#
-#     def to_dict(self):
-#         return {c.name: getattr(self, c.name) for c in self.__table__.columns}
+SCHEMA_VERSION = max(SCHEMA_MIGRATIONS)
 
-# # 示例：AI 推荐可能需要的数据模型（例如用户行为日志、物品特征等）
-# class UserActivity(Base):
-#     __tablename__ = 'user_activity'
-#     id = Column(Integer, primary_key=True)
-#     user_id = Column(Integer, ForeignKey('users.id'))
-#     item_id = Column(String(100))
-#     activity_type = Column(String(50)) # e.g., 'view', 'click', 'purchase', 'feedback'
-#     timestamp = Column(DateTime, default=datetime.utcnow)
-#
-#     # user = relationship("User")
 
-# class ItemFeature(Base):
-#     __tablename__ = 'item_features'
-#     id = Column(Integer, primary_key=True)
-#     item_id = Column(String(100), unique=True)
-#     # ... 其他特征字段 ...
+def configure_connection(conn: sqlite3.Connection):
+    """WAL 模式下读写可以并发；busy_timeout 让并发写入排队而不是立即报错。"""
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA foreign_keys=ON")
+    conn.execute("PRAGMA busy_timeout=5000")
 
-# engine = create_engine(DATABASE_URI)
-# SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-# def init_db():
-#     Base.metadata.create_all(bind=engine)
-
-# def get_db():
-#     db = SessionLocal()
-#     try:
-#         yield db
-#     finally:
-#         db.close()
-
-# 占位符，因为目前没有实际的数据库引擎
-print("Database models would be defined here.") 
\ No newline at end of file
+def init_db(conn: sqlite3.Connection):
+    """创建或升级表结构到 SCHEMA_VERSION。"""
+    current_version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for version in sorted(SCHEMA_MIGRATIONS):
+        if version <= current_version:
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for statement in SCHEMA_MIGRATIONS[version]:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        print(f"[DB] Schema migrated to version {version}")
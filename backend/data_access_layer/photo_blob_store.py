@@ -0,0 +1,269 @@
+# backend/data_access_layer/photo_blob_store.py
+# 内容寻址的照片存储：照片按 SHA-256 存为独立文件，用户记录中只保留引用 (ref)。
+# 相同内容的照片只存一份；旧的内嵌 base64 照片可通过 migrate_embedded_photos 迁移。
+
+import base64
+import binascii
+import hashlib
+import os
+import re
+import tempfile
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from ..config import PHOTO_STORE_DIR
+from .errors import PhotoTooLargeError, VersionConflictError
+
+_DAO_DIR = os.path.dirname(os.path.abspath(__file__))
+PHOTO_BLOBS_DIR = PHOTO_STORE_DIR or os.path.join(_DAO_DIR, "photo_blobs")
+# 迁移完成后写入的标记文件，之后启动时不再扫描全部用户
+_MIGRATION_MARKER = ".embedded_photos_migrated"
+# 迁移单个用户时遇到并发修改的最多尝试次数
+_MIGRATION_MAX_ATTEMPTS = 5
+
+_REF_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+_DATA_URI_PATTERN = re.compile(r"^data:(?P<content_type>[\w/+.-]+)?(?:;[\w=.-]+)*;base64,", re.IGNORECASE)
+
+# 常见图片格式的文件头
+_MAGIC_NUMBERS = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"BM", "image/bmp"),
+)
+
+DEFAULT_CONTENT_TYPE = "application/octet-stream"
+# 流式上传时每次读取/写入的块大小
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+def is_valid_ref(ref: str) -> bool:
+    return bool(_REF_PATTERN.match(ref or ""))
+
+
+def sniff_content_type(head: bytes) -> str:
+    """根据文件头判断图片类型。"""
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head[4:12] in (b"ftypheic", b"ftypheix", b"ftypmif1"):
+        return "image/heic"
+    for magic, content_type in _MAGIC_NUMBERS:
+        if head.startswith(magic):
+            return content_type
+    return DEFAULT_CONTENT_TYPE
+
+
+def decode_photo_data(data: str) -> Tuple[bytes, Optional[str]]:
+    """
+    解码前端提交的照片：支持 data URI (data:image/png;base64,...) 或纯 base64。
+    返回 (二进制内容, data URI 中声明的类型)。无法解码时抛出 ValueError。
+    """
+    declared_type = None
+    match = _DATA_URI_PATTERN.match(data)
+    if match:
+        declared_type = match.group("content_type")
+        data = data[match.end():]
+    try:
+        return base64.b64decode(data, validate=True), declared_type
+    except (binascii.Error, ValueError):
+        raise ValueError("照片数据不是有效的 base64 编码")
+
+
+class PhotoBlobWriter:
+    """
+    分块写入一张照片：边写边计算 SHA-256，写完后按哈希原子地移动到最终位置。
+    内存中只保留当前块；超过 max_bytes 时抛出 PhotoTooLargeError 并丢弃已写入的临时文件。
+    """
+
+    def __init__(self, store: "PhotoBlobStore", max_bytes: Optional[int] = None):
+        self._store = store
+        self._max_bytes = max_bytes
+        self._hash = hashlib.sha256()
+        self._head = b""
+        self.size = 0
+        fd, self._tmp_path = tempfile.mkstemp(prefix=".upload-", suffix=".tmp", dir=store.root)
+        self._file = os.fdopen(fd, "wb")
+
+    def write(self, chunk: bytes):
+        self.size += len(chunk)
+        if self._max_bytes is not None and self.size > self._max_bytes:
+            self.abort()
+            raise PhotoTooLargeError(self._max_bytes)
+        if len(self._head) < 16:
+            self._head += chunk[:16 - len(self._head)]
+        self._hash.update(chunk)
+        self._file.write(chunk)
+
+    def commit(self, content_type: Optional[str] = None) -> Dict[str, Any]:
+        """完成写入并返回引用记录 {"ref", "content_type", "size"}；内容已存在时丢弃临时文件直接复用。"""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        ref = self._hash.hexdigest()
+        path = self._store.path_for(ref)
+        if self._store.touch(ref):
+            os.remove(self._tmp_path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(self._tmp_path, path)
+        sniffed = sniff_content_type(self._head)
+        return {
+            "ref": ref,
+            "content_type": sniffed if sniffed != DEFAULT_CONTENT_TYPE else (content_type or DEFAULT_CONTENT_TYPE),
+            "size": self.size,
+        }
+
+    def abort(self):
+        if not self._file.closed:
+            self._file.close()
+        try:
+            os.remove(self._tmp_path)
+        except FileNotFoundError:
+            pass
+
+
+class PhotoBlobStore:
+    def __init__(self, root: str = PHOTO_BLOBS_DIR):
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+
+    def path_for(self, ref: str) -> str:
+        """ref -> 文件路径，按前两位分目录，避免单个目录下文件过多。"""
+        if not is_valid_ref(ref):
+            raise ValueError(f"Invalid photo ref: {ref}")
+        return os.path.join(self.root, ref[:2], ref)
+
+    def exists(self, ref: str) -> bool:
+        return is_valid_ref(ref) and os.path.exists(self.path_for(ref))
+
+    def touch(self, ref: str) -> bool:
+        """
+        照片已存在时更新其修改时间并返回 True。重新上传已有内容时调用：
+        清理未引用照片时只删除修改时间早于宽限期的文件，刚上传、还没写入用户记录的照片不会被误删。
+        """
+        try:
+            os.utime(self.path_for(ref))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def iter_blobs(self) -> Iterator[Tuple[str, str]]:
+        """存储中的所有照片 (ref, 文件路径)；跳过临时文件和 variants 等其他目录。"""
+        for prefix in os.listdir(self.root):
+            directory = os.path.join(self.root, prefix)
+            if len(prefix) != 2 or not os.path.isdir(directory):
+                continue
+            for name in os.listdir(directory):
+                if is_valid_ref(name) and name.startswith(prefix):
+                    yield name, os.path.join(directory, name)
+
+    def delete(self, ref: str) -> bool:
+        try:
+            os.remove(self.path_for(ref))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def content_type(self, ref: str) -> str:
+        with open(self.path_for(ref), "rb") as f:
+            return sniff_content_type(f.read(16))
+
+    def put_bytes(self, data: bytes, content_type: Optional[str] = None) -> Dict[str, Any]:
+        """存入照片并返回引用记录 {"ref", "content_type", "size"}；内容已存在时直接复用。"""
+        ref = hashlib.sha256(data).hexdigest()
+        path = self.path_for(ref)
+        if not self.touch(ref):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(prefix=".put-", suffix=".tmp", dir=os.path.dirname(path))
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        sniffed = sniff_content_type(data[:16])
+        return {
+            "ref": ref,
+            "content_type": sniffed if sniffed != DEFAULT_CONTENT_TYPE else (content_type or DEFAULT_CONTENT_TYPE),
+            "size": len(data),
+        }
+
+    def put_base64(self, data: str, max_bytes: Optional[int] = None) -> Dict[str, Any]:
+        # base64 每 4 个字符对应 3 个字节，解码前即可拒绝明显超限的数据 (预留 data URI 前缀的长度)
+        if max_bytes is not None and (len(data) - 256) * 3 // 4 > max_bytes:
+            raise PhotoTooLargeError(max_bytes)
+        content, declared_type = decode_photo_data(data)
+        if max_bytes is not None and len(content) > max_bytes:
+            raise PhotoTooLargeError(max_bytes)
+        return self.put_bytes(content, declared_type)
+
+    def open_writer(self, max_bytes: Optional[int] = None) -> PhotoBlobWriter:
+        """流式写入一张照片 (multipart 上传使用)，见 PhotoBlobWriter。"""
+        return PhotoBlobWriter(self, max_bytes)
+
+
+_photo_blob_store: Optional[PhotoBlobStore] = None
+
+
+def get_photo_blob_store() -> PhotoBlobStore:
+    """进程内共享的照片存储实例。"""
+    global _photo_blob_store
+    if _photo_blob_store is None:
+        _photo_blob_store = PhotoBlobStore()
+    return _photo_blob_store
+
+
+def _migrate_user_photos(user_dao, blob_store: PhotoBlobStore, username: str) -> int:
+    """
+    迁移一个用户的内嵌照片，返回迁移的照片数。写回时带上读取时的版本号：
+    期间用户记录被其他请求修改 (VersionConflictError) 时重新读取再迁移，不会覆盖并发写入。
+    """
+    for attempt in range(_MIGRATION_MAX_ATTEMPTS):
+        user = user_dao.find_user_by_username(username)
+        if not user or not user.get("travel_trails"):
+            return 0
+        migrated = 0
+        for trail in user["travel_trails"]:
+            for city in trail.get("cities") or []:
+                for index, photo in enumerate(city.get("photos") or []):
+                    if not isinstance(photo, dict) or photo.get("ref") or not photo.get("data"):
+                        continue
+                    try:
+                        city["photos"][index] = dict(blob_store.put_base64(photo["data"]), **({"id": photo["id"]} if photo.get("id") else {}))
+                    except ValueError as e:
+                        print(f"[PHOTO_STORE] Skipping undecodable photo of {username}/{city.get('city')}: {e}")
+                        continue
+                    migrated += 1
+        if not migrated:
+            return 0
+        try:
+            user_dao.update_user(username, {"travel_trails": user["travel_trails"]}, expected_version=user.get("_version"))
+            return migrated
+        except VersionConflictError:
+            if attempt == _MIGRATION_MAX_ATTEMPTS - 1:
+                raise
+    return 0
+
+
+def migrate_embedded_photos(user_dao, blob_store: Optional[PhotoBlobStore] = None) -> int:
+    """
+    把用户记录中内嵌的 base64 照片移入照片存储，记录中只留引用。
+    可重复执行；全部用户处理完后写入标记文件，之后直接跳过。返回迁移的照片数。
+    """
+    blob_store = blob_store or get_photo_blob_store()
+    marker_path = os.path.join(blob_store.root, _MIGRATION_MARKER)
+    if os.path.exists(marker_path):
+        return 0
+    migrated = 0
+    for username in user_dao.list_usernames():
+        migrated += _migrate_user_photos(user_dao, blob_store, username)
+    with open(marker_path, "w", encoding="utf-8") as f:
+        f.write(str(migrated))
+    if migrated:
+        print(f"[PHOTO_STORE] Migrated {migrated} embedded photos into {blob_store.root}")
+    return migrated
+
+
+if __name__ == "__main__":
+    # python -m backend.data_access_layer.photo_blob_store  手动执行迁移
+    from .dao_factory import get_user_dao
+    print(f"Migrated {migrate_embedded_photos(get_user_dao())} photos")
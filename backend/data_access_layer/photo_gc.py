@@ -0,0 +1,113 @@
+# backend/data_access_layer/photo_gc.py
+# 清理不再被引用的照片。照片按内容哈希共享存储 (photo_blob_store.py)，同一文件可能被多个城市或用户引用，
+# 删除照片/城市/用户时不能直接删除文件。这里用标记-清除：收集所有用户轨迹中的引用，
+# 删除不在其中、且修改时间早于宽限期的照片文件，以及原图已不存在的缩略图。
+# DAO 的轨迹变更通知只做标记；后台任务定期检查标记，有删除发生时才执行一次清理。
+
+import asyncio
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from ..config import PHOTO_GC_GRACE_SECONDS, PHOTO_GC_INTERVAL_SECONDS
+from .dao_factory import get_user_dao
+from .photo_blob_store import PhotoBlobStore, get_photo_blob_store
+from .photo_variants import PhotoVariantService, get_photo_variant_service
+from .trail_ops import TRAIL_CITY_REMOVED, TRAIL_PHOTO_REMOVED, TRAIL_REPLACED, TRAIL_USER_DELETED
+
+# 可能使照片不再被引用的事件
+_RELEASING_EVENTS = (TRAIL_CITY_REMOVED, TRAIL_PHOTO_REMOVED, TRAIL_REPLACED, TRAIL_USER_DELETED)
+
+
+def _modified_before(path: str, cutoff: float) -> bool:
+    try:
+        return os.stat(path).st_mtime < cutoff
+    except FileNotFoundError:
+        return False
+
+
+class PhotoGarbageCollector:
+    def __init__(self, user_dao, blob_store: Optional[PhotoBlobStore] = None,
+                 variant_service: Optional[PhotoVariantService] = None, grace_seconds: float = PHOTO_GC_GRACE_SECONDS):
+        self.user_dao = user_dao
+        self.blob_store = blob_store or get_photo_blob_store()
+        self.variant_service = variant_service or get_photo_variant_service()
+        self.grace_seconds = grace_seconds
+        self._pending = threading.Event()
+        self._pending.set()  # 启动后的第一次检查清理一次 (包括之前遗留的照片)
+        self._lock = threading.Lock()
+        self.runs = 0
+        self.deleted_blobs = 0
+        self.deleted_variants = 0
+
+    def on_trail_change(self, event: str, username: str, cities):
+        """DAO 轨迹变更通知的监听者：删除照片、城市、用户或替换轨迹后标记需要清理。"""
+        if event in _RELEASING_EVENTS:
+            self._pending.set()
+
+    @property
+    def pending(self) -> bool:
+        return self._pending.is_set()
+
+    def collect(self) -> Dict[str, int]:
+        """执行一次标记-清除，返回 {"blobs", "variants"} 删除的文件数。"""
+        with self._lock:
+            self._pending.clear()  # 清理期间发生的删除会重新标记，由下一次清理处理
+            cutoff = time.time() - self.grace_seconds
+            referenced = self.user_dao.list_photo_refs()
+            blobs = 0
+            for ref, path in list(self.blob_store.iter_blobs()):
+                # 重新上传已有内容时会更新修改时间 (PhotoBlobStore.touch)，尚未写入用户记录的照片不会被删除
+                if ref not in referenced and _modified_before(path, cutoff) and self.blob_store.delete(ref):
+                    blobs += 1
+            variants = 0
+            for ref, path in list(self.variant_service.iter_variant_refs()):
+                if ref not in referenced and not self.blob_store.exists(ref):
+                    try:
+                        os.remove(path)
+                        variants += 1
+                    except FileNotFoundError:
+                        pass
+            self.runs += 1
+            self.deleted_blobs += blobs
+            self.deleted_variants += variants
+        if blobs or variants:
+            print(f"[PHOTO_STORE] Removed {blobs} unreferenced photos and {variants} variants")
+        return {"blobs": blobs, "variants": variants}
+
+    async def run_periodically(self, interval_seconds: float = PHOTO_GC_INTERVAL_SECONDS):
+        """后台任务 (由应用 lifespan 启动和取消)：每隔 interval_seconds 检查一次标记。"""
+        while True:
+            await asyncio.sleep(interval_seconds)
+            if not self.pending:
+                continue
+            try:
+                await asyncio.to_thread(self.collect)
+            except Exception as e:
+                print(f"[PHOTO_STORE] Photo cleanup failed: {e}")
+                self._pending.set()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"pending": self.pending, "runs": self.runs, "deleted_blobs": self.deleted_blobs,
+                "deleted_variants": self.deleted_variants}
+
+
+_photo_garbage_collector: Optional[PhotoGarbageCollector] = None
+_photo_garbage_collector_lock = threading.Lock()
+
+
+def get_photo_garbage_collector() -> PhotoGarbageCollector:
+    """进程内共享的照片清理器 (监听共享的用户 DAO)。"""
+    global _photo_garbage_collector
+    if _photo_garbage_collector is None:
+        with _photo_garbage_collector_lock:
+            if _photo_garbage_collector is None:
+                _photo_garbage_collector = PhotoGarbageCollector(get_user_dao())
+                get_user_dao().add_listener(_photo_garbage_collector.on_trail_change)
+    return _photo_garbage_collector
+
+
+if __name__ == "__main__":
+    # python -m backend.data_access_layer.photo_gc  手动清理一次
+    print(f"Removed {get_photo_garbage_collector().collect()}")
@@ -0,0 +1,138 @@
+# backend/data_access_layer/photo_variants.py
+# 照片的缩略图 / 中等尺寸版本：上传后在进程池中预先生成，缓存在照片存储目录的 variants/ 下。
+# 图片解码和缩放是 CPU 密集型操作，放在独立进程中执行，不占用 GIL 和事件循环。
+# 依赖 Pillow (requirements.txt)；未安装时服务创建时打印一次警告，不生成缩略图，接口直接返回原图。
+
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Dict, Iterator, Optional, Tuple
+
+from ..config import PHOTO_VARIANT_WORKERS
+from .photo_blob_store import PhotoBlobStore, get_photo_blob_store
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow 未安装
+    Image = None
+    ImageOps = None
+
+# 尺寸名称 -> 最长边像素
+VARIANT_SIZES: Dict[str, int] = {
+    "thumb": 256,
+    "medium": 1024,
+}
+VARIANT_CONTENT_TYPE = "image/jpeg"
+_VARIANT_QUALITY = 82
+
+
+def _render_variant(src_path: str, dst_path: str, max_edge: int) -> str:
+    """在工作进程中执行：按最长边等比缩小并保存为 JPEG (先写临时文件再原子替换)。"""
+    with Image.open(src_path) as image:
+        image.draft("RGB", (max_edge, max_edge))  # JPEG 解码时直接按缩小的尺寸解码，减少内存和 CPU
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_edge, max_edge))
+        if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+        os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+        tmp_path = f"{dst_path}.{os.getpid()}.tmp"
+        image.save(tmp_path, "JPEG", quality=_VARIANT_QUALITY, optimize=True, progressive=True)
+    os.replace(tmp_path, dst_path)
+    return dst_path
+
+
+class PhotoVariantService:
+    def __init__(self, blob_store: Optional[PhotoBlobStore] = None, max_workers: int = PHOTO_VARIANT_WORKERS):
+        self.blob_store = blob_store or get_photo_blob_store()
+        self.root = os.path.join(self.blob_store.root, "variants")
+        self._max_workers = max(1, max_workers)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        # 正在生成的 (ref, size) -> Future，同一张照片的同一尺寸只生成一次
+        self._pending: Dict[Tuple[str, str], Future] = {}
+        if Image is None:
+            print("[PHOTO_VARIANTS] WARNING: Pillow 未安装，不生成缩略图，?size=thumb|medium 将返回原图 (pip install Pillow)")
+
+    @property
+    def enabled(self) -> bool:
+        return Image is not None
+
+    def path_for(self, ref: str, size: str) -> str:
+        self.blob_store.path_for(ref)  # 校验 ref 格式
+        return os.path.join(self.root, size, ref[:2], f"{ref}.jpg")
+
+    def iter_variant_refs(self) -> Iterator[Tuple[str, str]]:
+        """已生成的所有尺寸版本 (ref, 文件路径)。"""
+        for size in VARIANT_SIZES:
+            size_dir = os.path.join(self.root, size)
+            if not os.path.isdir(size_dir):
+                continue
+            for prefix in os.listdir(size_dir):
+                directory = os.path.join(size_dir, prefix)
+                if not os.path.isdir(directory):
+                    continue
+                for name in os.listdir(directory):
+                    if name.endswith(".jpg"):
+                        yield name[:-len(".jpg")], os.path.join(directory, name)
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn：服务进程中有多个线程，fork 出的子进程可能继承被持有的锁
+            self._pool = ProcessPoolExecutor(max_workers=self._max_workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    def _submit(self, ref: str, size: str) -> Future:
+        key = (ref, size)
+        future = self._pending.get(key)
+        if future is None:
+            future = self._executor().submit(
+                _render_variant, self.blob_store.path_for(ref), self.path_for(ref, size), VARIANT_SIZES[size]
+            )
+            self._pending[key] = future
+            future.add_done_callback(lambda _: self._pending.pop(key, None))
+        return future
+
+    def schedule(self, ref: str):
+        """上传后调用：把所有尺寸的生成任务放入进程池，不等待结果。"""
+        if not self.enabled:
+            return
+        for size in VARIANT_SIZES:
+            if not os.path.exists(self.path_for(ref, size)):
+                self._submit(ref, size)
+
+    async def get_variant_path(self, ref: str, size: str) -> Optional[str]:
+        """
+        返回指定尺寸版本的文件路径；尚未生成时在进程池中生成并等待。
+        Pillow 未安装或图片无法解码时返回 None，调用方应回退到原图。
+        """
+        path = self.path_for(ref, size)
+        if os.path.exists(path):
+            return path
+        if not self.enabled:
+            return None
+        try:
+            return await asyncio.wrap_future(self._submit(ref, size))
+        except Exception as e:
+            print(f"[PHOTO_VARIANTS] Failed to render {size} variant of {ref}: {e}")
+            return None
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+
+_photo_variant_service: Optional[PhotoVariantService] = None
+
+
+def get_photo_variant_service() -> PhotoVariantService:
+    """进程内共享的缩略图服务 (进程池在第一次使用时创建)。"""
+    global _photo_variant_service
+    if _photo_variant_service is None:
+        _photo_variant_service = PhotoVariantService()
+    return _photo_variant_service
@@ -0,0 +1,114 @@
+# backend/data_access_layer/recommendation_cache.py
+# AI 推荐结果缓存：同一组已访问城市 (与顺序、大小写、重复无关) 在有效期内直接返回上次的推荐，
+# 不再调用大模型和地理编码。键是规范化后的 (城市, 国家) 集合的哈希。
+# 缓存在内存中 (LRU + TTL)；配置了 RECOMMENDATION_CACHE_FILE 时写入磁盘，重启后继续使用未过期的条目。
+
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import unicodedata
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from ..config import RECOMMENDATION_CACHE_FILE, RECOMMENDATION_CACHE_MAX_ENTRIES, RECOMMENDATION_CACHE_TTL_SECONDS
+from .lru_cache import LRUCache
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_place_name(name: Optional[str]) -> str:
+    """NFKC 规范化 (全角/半角统一)、忽略大小写、合并空白。"""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", name or "")).strip().casefold()
+
+
+def recommendation_cache_key(visited: Iterable[Tuple[Optional[str], Optional[str]]], variant: str = "") -> str:
+    """
+    已访问城市集合的规范哈希：(城市, 国家) 规范化后去重、排序，再做 SHA-256。
+    variant 用于区分会影响结果的其他因素 (如模型和提示词版本)。
+    """
+    places = sorted({(normalize_place_name(city), normalize_place_name(country)) for city, country in visited})
+    canonical = json.dumps([variant, places], ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class RecommendationCache:
+    def __init__(self, max_entries: int = RECOMMENDATION_CACHE_MAX_ENTRIES, ttl_seconds: float = RECOMMENDATION_CACHE_TTL_SECONDS,
+                 path: Optional[str] = RECOMMENDATION_CACHE_FILE):
+        self.path = path
+        self._cache = LRUCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self._save_lock = threading.Lock()
+        if path:
+            self._load()
+
+    def get(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        return self._cache.get(key)
+
+    def put(self, key: str, recommendations: List[Dict[str, Any]]):
+        """写入缓存；配置了文件时同步写盘 (在线程池中调用)。"""
+        self._cache.put(key, recommendations)
+        if self.path:
+            self._save()
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(self._cache.stats(), persistent=bool(self.path))
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"[AI_CACHE] Ignoring unreadable recommendation cache {self.path}: {e}")
+            return
+        now = time.time()
+        loaded = 0
+        for entry in data.get("entries", []) if isinstance(data, dict) else []:
+            try:
+                remaining = None if entry["expires_at"] is None else entry["expires_at"] - now
+                if remaining is None or remaining > 0:
+                    self._cache.put(entry["key"], entry["recommendations"], ttl_seconds=remaining)
+                    loaded += 1
+            except (KeyError, TypeError):
+                continue
+        print(f"[AI_CACHE] Loaded {loaded} cached recommendation sets from {self.path}")
+
+    def _save(self):
+        """整体写入临时文件后原子替换 (条目数有上限，文件很小)；磁盘上记录绝对过期时间。"""
+        now = time.time()
+        entries = [
+            {"key": key, "expires_at": None if remaining is None else now + remaining, "recommendations": value}
+            for key, value, remaining in self._cache.items()
+        ]
+        directory = os.path.dirname(self.path)
+        with self._save_lock:
+            tmp_path = None
+            try:
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                # 临时文件名唯一 (多个进程共用同一个缓存文件时也不会互相覆盖)
+                fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(self.path)}.", suffix=".tmp", dir=directory or ".")
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump({"entries": entries}, f, ensure_ascii=False)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                print(f"[AI_CACHE] Failed to persist recommendation cache to {self.path}: {e}")
+                if tmp_path is not None and os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+
+_recommendation_cache: Optional[RecommendationCache] = None
+_recommendation_cache_lock = threading.Lock()
+
+
+def get_recommendation_cache() -> RecommendationCache:
+    """进程内共享的推荐缓存 (推荐服务和内部统计接口共用，测试中可替换为新的实例)。"""
+    global _recommendation_cache
+    if _recommendation_cache is None:
+        with _recommendation_cache_lock:
+            if _recommendation_cache is None:
+                _recommendation_cache = RecommendationCache()
+    return _recommendation_cache
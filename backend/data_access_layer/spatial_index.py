@@ -0,0 +1,305 @@
+# backend/data_access_layer/spatial_index.py
+# 所有用户已访问城市的进程内空间索引 (geohash)，用于地图视野 (bbox) 查询和半径查询。
+# 每个城市按坐标编码为 geohash 字符串，键 (geohash, username, city_id) 保存在有序列表中：
+# 同一 geohash 前缀的城市在列表中是连续的一段，查询时把范围覆盖为若干前缀单元格，
+# 对每个单元格二分查找出对应的一段，再按精确坐标过滤。
+# 索引在第一次查询时从 DAO 全量构建，之后由 DAO 的轨迹变更通知增量维护 (见 trail_ops.TrailChangeNotifier)；
+# 只维护本进程内的写入，多进程部署时其他进程的写入要到重建索引后才可见。
+
+import math
+import threading
+import time
+from bisect import bisect_left, insort
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .dao_factory import get_user_dao
+from .trail_aggregates import EARTH_RADIUS_KM
+from .trail_ops import TRAIL_CITIES_ADDED, TRAIL_CITY_REMOVED, TRAIL_REPLACED, TRAIL_USER_DELETED
+
+# 索引中 geohash 的长度 (9 位约 5m x 5m)
+GEOHASH_PRECISION = 9
+# 一次查询最多覆盖的单元格数；范围越大用越短的前缀 (越大的单元格)
+MAX_COVER_CELLS = 64
+# 一次变更的城市超过这个数量时整体重排，而不是逐个二分插入/删除
+_BULK_UPDATE_THRESHOLD = 64
+# 构建索引时读取的城市字段
+INDEX_CITY_FIELDS = ("city", "country", "latitude", "longitude")
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+BBox = Tuple[float, float, float, float]  # (west, south, east, north)，角度制
+
+
+def _spread_bits(value: int) -> int:
+    """把 32 位整数的每一位隔一位展开 (Morton 编码)，bit k -> bit 2k。"""
+    value &= 0xFFFFFFFF
+    value = (value | (value << 16)) & 0x0000FFFF0000FFFF
+    value = (value | (value << 8)) & 0x00FF00FF00FF00FF
+    value = (value | (value << 4)) & 0x0F0F0F0F0F0F0F0F
+    value = (value | (value << 2)) & 0x3333333333333333
+    return (value | (value << 1)) & 0x5555555555555555
+
+
+def geohash_encode(latitude: float, longitude: float, precision: int = GEOHASH_PRECISION) -> str:
+    """
+    标准 geohash 编码 (precision <= 12)：经度、纬度二分位从经度开始交替，每 5 位一个 base32 字符。
+    把经纬度量化为整数后按位交错，与逐位二分的结果相同，但不需要逐位循环。
+    """
+    bits = 5 * precision
+    lon_bits, lat_bits = (bits + 1) // 2, bits // 2
+    lon_code = min((1 << lon_bits) - 1, max(0, int((longitude + 180.0) / 360.0 * (1 << lon_bits))))
+    lat_code = min((1 << lat_bits) - 1, max(0, int((latitude + 90.0) / 180.0 * (1 << lat_bits))))
+    if bits % 2:  # 经度多一位，最高位是经度
+        code = _spread_bits(lon_code) | (_spread_bits(lat_code) << 1)
+    else:
+        code = (_spread_bits(lon_code) << 1) | _spread_bits(lat_code)
+    return "".join(_BASE32[(code >> shift) & 31] for shift in range(bits - 5, -1, -5))
+
+
+def _cell_size(precision: int) -> Tuple[float, float]:
+    """给定长度的 geohash 单元格大小 (经度跨度, 纬度跨度)。"""
+    bits = 5 * precision
+    return 360.0 / (1 << ((bits + 1) // 2)), 180.0 / (1 << (bits // 2))
+
+
+def _grid_range(low: float, high: float, origin: float, step: float, cells: int) -> range:
+    first = min(cells - 1, max(0, int((low - origin) // step)))
+    last = min(cells - 1, max(0, int((high - origin) // step)))
+    return range(first, last + 1)
+
+
+def cover_bbox(bbox: BBox, max_cells: int = MAX_COVER_CELLS) -> List[str]:
+    """用不超过 max_cells 个 geohash 单元格覆盖 bbox (west <= east)，返回单元格前缀。"""
+    west, south, east, north = bbox
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        cell_width, cell_height = _cell_size(precision)
+        columns = _grid_range(west, east, -180.0, cell_width, round(360.0 / cell_width))
+        rows = _grid_range(south, north, -90.0, cell_height, round(180.0 / cell_height))
+        if len(columns) * len(rows) <= max_cells or precision == 1:
+            return sorted({
+                geohash_encode(-90.0 + (row + 0.5) * cell_height, -180.0 + (column + 0.5) * cell_width, precision)
+                for row in rows for column in columns
+            })
+    return []
+
+
+def split_bbox(west: float, south: float, east: float, north: float) -> List[BBox]:
+    """west > east 表示跨越 180° 经线的范围，拆成两个不跨越的范围。"""
+    if west <= east:
+        return [(west, south, east, north)]
+    return [(west, south, 180.0, north), (-180.0, south, east, north)]
+
+
+def radius_bboxes(latitude: float, longitude: float, radius_km: float) -> List[BBox]:
+    """包含以 (latitude, longitude) 为圆心、radius_km 为半径的球面圆的范围 (跨越 180° 经线时为两个)。"""
+    angular = radius_km / EARTH_RADIUS_KM
+    delta_lat = math.degrees(angular)
+    south, north = latitude - delta_lat, latitude + delta_lat
+    if south <= -90.0 or north >= 90.0 or angular >= math.pi / 2:  # 圆包含极点：经度不受限制
+        return [(-180.0, max(-90.0, south), 180.0, min(90.0, north))]
+    delta_lon = math.degrees(math.asin(min(1.0, math.sin(angular) / math.cos(math.radians(latitude)))))
+    west, east = longitude - delta_lon, longitude + delta_lon
+    if east - west >= 360.0:
+        return [(-180.0, south, 180.0, north)]
+    if west < -180.0:
+        return split_bbox(west + 360.0, south, east, north)
+    if east > 180.0:
+        return split_bbox(west, south, east - 360.0, north)
+    return [(west, south, east, north)]
+
+
+def distance_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(1.0, a)))
+
+
+def _coordinates(city: Dict[str, Any]) -> Optional[Tuple[float, float]]:
+    try:
+        latitude, longitude = float(city.get("latitude")), float(city.get("longitude"))
+    except (TypeError, ValueError):
+        return None
+    if not (-90.0 <= latitude <= 90.0 and -180.0 <= longitude <= 180.0):
+        return None
+    return latitude, longitude
+
+
+class SpatialIndex:
+    """
+    线程安全的 geohash 索引。全局有一个有序键列表，每个用户另有一个 (用于只查询某个用户的城市)；
+    城市的坐标和名称保存在 (username, city_id) -> 点 的字典中。
+    """
+
+    def __init__(self, user_dao):
+        self._user_dao = user_dao
+        self._lock = threading.RLock()
+        self._build_lock = threading.Lock()
+        self._built = False
+        self._keys: List[Tuple[str, str, str]] = []  # (geohash, username, city_id)，有序
+        self._keys_unsorted = False  # 批量追加后延迟到下一次使用时再排序 (构建索引时只排序一次)
+        self._user_keys: Dict[str, List[Tuple[str, str]]] = {}  # username -> [(geohash, city_id)]，有序
+        self._points: Dict[Tuple[str, str], Dict[str, Any]] = {}
+
+    # --- 维护 ---
+
+    def on_trail_change(self, event: str, username: str, cities: List[Dict[str, Any]]):
+        """DAO 轨迹变更通知的监听者。即使索引尚未构建也立即应用 (见 ensure_built 中的说明)。"""
+        with self._lock:
+            if event == TRAIL_CITIES_ADDED:
+                self._add_cities(username, cities)
+            elif event == TRAIL_CITY_REMOVED:
+                for city in cities:
+                    self._remove_city(username, city.get("id"))
+            elif event in (TRAIL_REPLACED, TRAIL_USER_DELETED):
+                self._replace_user(username, cities)
+
+    def _sorted_keys(self) -> List[Tuple[str, str, str]]:
+        if self._keys_unsorted:
+            self._keys.sort()
+            self._keys_unsorted = False
+        return self._keys
+
+    def _remove_city(self, username: str, city_id: Optional[str]):
+        point = self._points.pop((username, city_id), None)
+        if point is None:
+            return
+        key = (point["geohash"], username, city_id)
+        keys = self._sorted_keys()
+        del keys[bisect_left(keys, key)]
+        user_keys = self._user_keys[username]
+        del user_keys[bisect_left(user_keys, key[::2])]
+        if not user_keys:
+            del self._user_keys[username]
+
+    def _add_cities(self, username: str, cities: List[Dict[str, Any]]):
+        points: Dict[str, Dict[str, Any]] = {}
+        for city in cities:
+            coordinates = _coordinates(city)
+            if not city.get("id") or coordinates is None:  # 没有坐标的城市不进入索引
+                continue
+            self._remove_city(username, city["id"])  # 重复通知时替换旧的点
+            points[city["id"]] = {
+                "username": username,
+                "id": city["id"],
+                "city": city.get("city"),
+                "country": city.get("country"),
+                "latitude": coordinates[0],
+                "longitude": coordinates[1],
+                "geohash": geohash_encode(*coordinates),
+            }
+        if not points:
+            return
+        points = list(points.values())
+        user_keys = self._user_keys.setdefault(username, [])
+        for point in points:
+            self._points[(username, point["id"])] = point
+        if len(points) > _BULK_UPDATE_THRESHOLD:
+            self._keys.extend((point["geohash"], username, point["id"]) for point in points)
+            self._keys_unsorted = True
+            user_keys.extend((point["geohash"], point["id"]) for point in points)
+            user_keys.sort()
+        else:
+            keys = self._sorted_keys()
+            for point in points:
+                insort(keys, (point["geohash"], username, point["id"]))
+                insort(user_keys, (point["geohash"], point["id"]))
+
+    def _replace_user(self, username: str, cities: List[Dict[str, Any]]):
+        user_keys = self._user_keys.pop(username, [])
+        if len(user_keys) > _BULK_UPDATE_THRESHOLD:
+            self._keys = [key for key in self._keys if key[1] != username]
+        elif user_keys:
+            keys = self._sorted_keys()
+            for geohash, city_id in user_keys:
+                del keys[bisect_left(keys, (geohash, username, city_id))]
+        for _, city_id in user_keys:
+            self._points.pop((username, city_id), None)
+        self._add_cities(username, cities)
+
+    def ensure_built(self):
+        """
+        第一次查询时从 DAO 全量构建。每个用户的读取和写入索引都在索引锁内完成：
+        在读取之前提交的变更已包含在读取结果中，之后提交的变更通知会等待锁并在其后应用，
+        因此构建过程中的并发写入不会丢失。
+        """
+        if self._built:
+            return
+        with self._build_lock:
+            if self._built:
+                return
+            started = time.perf_counter()
+            for username in self._user_dao.list_usernames():
+                with self._lock:
+                    result = self._user_dao.list_cities(username, 0, None, INDEX_CITY_FIELDS)
+                    self._replace_user(username, result[0] if result else [])
+            self._built = True
+            print(f"[GEO] Spatial index built: {len(self._points)} cities in {time.perf_counter() - started:.2f}s")
+
+    # --- 查询 ---
+
+    def _scan(self, bbox: BBox, username: Optional[str]) -> Iterator[Dict[str, Any]]:
+        """bbox (不跨越 180° 经线) 内的点：逐个覆盖单元格二分定位，再按坐标精确过滤。"""
+        west, south, east, north = bbox
+        if username is None:
+            keys, city_id_at = self._sorted_keys(), 2
+        else:
+            keys, city_id_at = self._user_keys.get(username, []), 1
+        for prefix in cover_bbox(bbox):
+            i = bisect_left(keys, (prefix,))
+            while i < len(keys) and keys[i][0].startswith(prefix):
+                key = keys[i]
+                point = self._points[(key[1] if username is None else username, key[city_id_at])]
+                if south <= point["latitude"] <= north and west <= point["longitude"] <= east:
+                    yield point
+                i += 1
+
+    @staticmethod
+    def _public(point: Dict[str, Any], **extra) -> Dict[str, Any]:
+        return dict({field: point[field] for field in ("username", "id", "city", "country", "latitude", "longitude")}, **extra)
+
+    def query_bbox(self, west: float, south: float, east: float, north: float, username: Optional[str] = None,
+                   limit: Optional[int] = None) -> Tuple[List[Dict[str, Any]], int]:
+        """范围内的城市 (west > east 表示跨越 180° 经线)，返回 (最多 limit 个城市, 范围内城市总数)。"""
+        self.ensure_built()
+        with self._lock:
+            matches = [point for bbox in split_bbox(west, south, east, north) for point in self._scan(bbox, username)]
+            return [self._public(point) for point in matches[:limit]], len(matches)
+
+    def query_radius(self, latitude: float, longitude: float, radius_km: float, username: Optional[str] = None,
+                     limit: Optional[int] = None) -> Tuple[List[Dict[str, Any]], int]:
+        """距离 (latitude, longitude) radius_km 以内的城市，按距离从近到远，返回 (最多 limit 个城市, 总数)。"""
+        self.ensure_built()
+        with self._lock:
+            matches = []
+            for bbox in radius_bboxes(latitude, longitude, radius_km):
+                for point in self._scan(bbox, username):
+                    distance = distance_km(latitude, longitude, point["latitude"], point["longitude"])
+                    if distance <= radius_km:
+                        matches.append((distance, point))
+            matches.sort(key=lambda match: match[0])
+            return [self._public(point, distance_km=round(distance, 3)) for distance, point in matches[:limit]], len(matches)
+
+    def nearby_visited(self, latitude: float, longitude: float, radius_km: float, limit: int = 10,
+                       username: Optional[str] = None) -> List[Dict[str, Any]]:
+        """附近已访问过的城市 (供推荐等服务使用)，只返回列表。"""
+        return self.query_radius(latitude, longitude, radius_km, username=username, limit=limit)[0]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"built": self._built, "cities": len(self._points), "users": len(self._user_keys)}
+
+
+_spatial_index: Optional[SpatialIndex] = None
+_spatial_index_lock = threading.Lock()
+
+
+def get_spatial_index() -> SpatialIndex:
+    """进程内共享的空间索引，创建时注册为 DAO 的轨迹变更监听者 (构建推迟到第一次查询)。"""
+    global _spatial_index
+    if _spatial_index is None:
+        with _spatial_index_lock:
+            if _spatial_index is None:
+                user_dao = get_user_dao()
+                index = SpatialIndex(user_dao)
+                user_dao.add_listener(index.on_trail_change)
+                _spatial_index = index
+    return _spatial_index
@@ -0,0 +1,640 @@
+# backend/data_access_layer/sqlite_user_dao.py
+# 基于 SQLite 的用户 / 城市 / 照片存储，与 JSON 版 UserManagementDAO 接口一致，可通过 DATABASE_URI 切换
+
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Optional, Dict, List, Any, Iterator, Set, Tuple
+
+from .models import configure_connection, init_db
+from .errors import DuplicateEmailError, VersionConflictError
+from .trail_ops import (
+    DEFAULT_CITY_LIST_FIELDS, TRAIL_CITIES_ADDED, TRAIL_CITY_REMOVED, TRAIL_PHOTO_REMOVED, TRAIL_REPLACED,
+    TRAIL_USER_DELETED, ItemKey, TrailChangeNotifier, new_id, trail_cities,
+)
+from .trail_aggregates import (
+    AGGREGATE_CITY_FIELDS, add_city_to_aggregates, build_trail_aggregates, remove_city_from_aggregates,
+    summarize_trail_aggregates,
+)
+
+# users / cities / photos 表中有独立列的字段，其余字段放入 extra (JSON)；城市/照片的 id 存在 public_id 列
+USER_COLUMNS = ("email", "password", "disabled", "age")
+CITY_COLUMNS = ("city", "country", "latitude", "longitude", "transport_mode", "blog", "visit_date")
+PHOTO_COLUMNS = ("ref", "content_type", "size", "data")
+# store_meta 中记录 JSON 存储已导入的键
+JSON_IMPORT_MARKER = "json_store_imported"
+# WHERE ... IN (...) 查询每批的参数个数 (SQLite 对单条语句的参数个数有上限)
+_IN_QUERY_BATCH_SIZE = 500
+
+
+def _split_extra(data: Dict[str, Any], columns: tuple, skip: tuple = ()) -> Dict[str, Any]:
+    return {k: v for k, v in data.items() if k not in columns and k not in skip}
+
+
+def _dump_extra(extra: Dict[str, Any]) -> Optional[str]:
+    return json.dumps(extra, ensure_ascii=False, default=str) if extra else None
+
+
+def _load_extra(value: Optional[str]) -> Dict[str, Any]:
+    return json.loads(value) if value else {}
+
+
+def _to_db_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+class SQLiteUserManagementDAO(TrailChangeNotifier):
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._local = threading.local()
+        # 提交与发出通知之间持有，保证通知顺序与提交顺序一致 (见 _write_transaction)
+        self._notify_lock = threading.Lock()
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        init_db(self._conn())
+        self._import_json_store_once()
+        self._backfill_trail_stats()
+
+    # --- 连接与事务 ---
+
+    def _conn(self) -> sqlite3.Connection:
+        """每个线程一个连接 (sqlite3 连接不能跨线程共享)。"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None：由我们自己显式 BEGIN/COMMIT
+            conn = sqlite3.connect(self.db_path, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            configure_connection(conn)
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _write_transaction(self) -> Iterator[sqlite3.Connection]:
+        """
+        BEGIN IMMEDIATE 一开始就拿写锁，避免读后升级写锁时的死锁。
+        事务内登记的轨迹变更通知 (_notify_after_commit) 在提交后发出：提交前先取得通知锁，
+        写锁保证提交是串行的，因此监听者收到通知的顺序与提交顺序一致。回滚时丢弃。
+        """
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        pending = self._local.pending_notifications = []
+        try:
+            yield conn
+            self._notify_lock.acquire()
+            try:
+                conn.execute("COMMIT")
+            except BaseException:
+                self._notify_lock.release()
+                raise
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            self._local.pending_notifications = None
+        try:
+            for event, username, cities in pending:
+                self._notify(event, username, cities)
+        finally:
+            self._notify_lock.release()
+
+    def _notify_after_commit(self, event: str, username: str, cities: List[Dict[str, Any]]):
+        """在写事务内登记轨迹变更通知，由 _write_transaction 在提交后按顺序发出。"""
+        self._local.pending_notifications.append((event, username, cities))
+
+    @contextmanager
+    def _unique_email(self, email: Optional[str]) -> Iterator[None]:
+        """idx_users_email 是唯一索引：写入重复的邮箱时转换为 DuplicateEmailError。"""
+        try:
+            yield
+        except sqlite3.IntegrityError as e:
+            if "users.email" in str(e):
+                raise DuplicateEmailError(email) from e
+            raise
+
+    @contextmanager
+    def _read_transaction(self) -> Iterator[sqlite3.Connection]:
+        """
+        需要多条查询的读取放在一个读事务里：WAL 模式下整个事务读到同一个快照，不会混入中途提交的写入。
+        已经在事务中 (如写事务内整理返回值) 时直接复用。
+        """
+        conn = self._conn()
+        if conn.in_transaction:
+            yield conn
+            return
+        conn.execute("BEGIN")
+        try:
+            yield conn
+        finally:
+            conn.execute("COMMIT")
+
+    def _import_json_store_once(self):
+        """
+        首次启动时从 JSON 存储 (分片目录或旧的 users.json) 导入全部用户，只导入一次：
+        完成标记与导入的用户在同一个事务内写入 store_meta，中途失败时整体回滚，下次启动重新导入。
+        数据库中已存在的用户名跳过；邮箱已被使用时导入的用户不带邮箱。
+        """
+        if self._conn().execute("SELECT 1 FROM store_meta WHERE key = ?", (JSON_IMPORT_MARKER,)).fetchone():
+            return
+        from .user_management_dao import UserManagementDAO
+        json_dao = UserManagementDAO()
+        imported = 0
+        with self._write_transaction() as conn:
+            if conn.execute("SELECT 1 FROM store_meta WHERE key = ?", (JSON_IMPORT_MARKER,)).fetchone():
+                return  # 其他进程已经导入
+            for username in json_dao.list_usernames():
+                user_data = json_dao.find_user_by_username(username)
+                if not user_data or self._user_row(conn, username) is not None:
+                    continue
+                email = user_data.get("email")
+                if email is not None and conn.execute("SELECT 1 FROM users WHERE email = ?", (email,)).fetchone():
+                    print(f"[DAO] Email {email} of {username} is already in use, importing without email")
+                    user_data["email"] = None
+                self._insert_user(conn, user_data)
+                imported += 1
+            conn.execute("INSERT INTO store_meta (key, value) VALUES (?, ?)", (JSON_IMPORT_MARKER, datetime.now().isoformat()))
+        if imported:
+            print(f"[DAO] Imported {imported} users from the JSON store into {self.db_path}")
+
+    # --- 行 <-> 字典 ---
+
+    def _photo_to_dict(self, row: sqlite3.Row) -> Dict[str, Any]:
+        photo = _load_extra(row["extra"])
+        photo["id"] = row["public_id"]
+        for column in PHOTO_COLUMNS:
+            if row[column] is not None:
+                photo[column] = row[column]
+        return photo
+
+    def _city_to_dict(self, conn: sqlite3.Connection, row: sqlite3.Row, photo_rows: Optional[List[sqlite3.Row]] = None) -> Dict[str, Any]:
+        city = _load_extra(row["extra"])
+        city["id"] = row["public_id"]
+        for column in CITY_COLUMNS:
+            city[column] = row[column]
+        if photo_rows is None:
+            photo_rows = conn.execute(
+                "SELECT * FROM photos WHERE city_id = ? ORDER BY position", (row["id"],)
+            ).fetchall()
+        city["photos"] = [self._photo_to_dict(photo_row) for photo_row in photo_rows]
+        return city
+
+    def _user_to_dict(self, conn: sqlite3.Connection, row: sqlite3.Row) -> Dict[str, Any]:
+        user = _load_extra(row["extra"])
+        user.update({
+            "username": row["username"],
+            "email": row["email"],
+            "password": row["password"],
+            "disabled": bool(row["disabled"]),
+            "age": row["age"],
+            "_version": row["version"],
+        })
+        city_rows = conn.execute(
+            "SELECT * FROM cities WHERE user_id = ? ORDER BY position", (row["id"],)
+        ).fetchall()
+        # 一次查询取出该用户全部照片，避免每个城市一次查询
+        photos_by_city: Dict[int, List[sqlite3.Row]] = {city_row["id"]: [] for city_row in city_rows}
+        for photo_row in conn.execute(
+            "SELECT photos.* FROM photos JOIN cities ON photos.city_id = cities.id "
+            "WHERE cities.user_id = ? ORDER BY photos.city_id, photos.position", (row["id"],)
+        ):
+            photos_by_city[photo_row["city_id"]].append(photo_row)
+        cities = [self._city_to_dict(conn, city_row, photos_by_city[city_row["id"]]) for city_row in city_rows]
+        user["travel_trails"] = [{"cities": cities}] if cities else []
+        return user
+
+    def _user_row(self, conn: sqlite3.Connection, username: str) -> Optional[sqlite3.Row]:
+        return conn.execute("SELECT * FROM users WHERE username = ?", (username,)).fetchone()
+
+    def _user_row_for_update(self, conn: sqlite3.Connection, username: str, expected_version: Optional[int]) -> Optional[sqlite3.Row]:
+        """写事务内读取用户行；expected_version 不为 None 且与当前版本不一致时抛出 VersionConflictError。"""
+        row = self._user_row(conn, username)
+        if row is not None and expected_version is not None and row["version"] != expected_version:
+            raise VersionConflictError(username, expected_version, row["version"])
+        return row
+
+    def _city_row(self, conn: sqlite3.Connection, user_id: int, city_key: ItemKey) -> sqlite3.Row:
+        """按位置 (int) 或 id (str，走 idx_cities_public_id 索引) 找到城市行。"""
+        if isinstance(city_key, str):
+            row = conn.execute(
+                "SELECT * FROM cities WHERE public_id = ? AND user_id = ?", (city_key, user_id)
+            ).fetchone()
+            if row is None:
+                raise IndexError("城市不存在")
+            return row
+        row = None
+        if city_key >= 0:
+            row = conn.execute(
+                "SELECT * FROM cities WHERE user_id = ? ORDER BY position LIMIT 1 OFFSET ?",
+                (user_id, city_key),
+            ).fetchone()
+        if row is None:
+            raise IndexError("城市索引无效")
+        return row
+
+    def _photo_row(self, conn: sqlite3.Connection, city_id: int, photo_key: ItemKey) -> sqlite3.Row:
+        if isinstance(photo_key, str):
+            row = conn.execute(
+                "SELECT id FROM photos WHERE public_id = ? AND city_id = ?", (photo_key, city_id)
+            ).fetchone()
+            if row is None:
+                raise IndexError("照片不存在")
+            return row
+        row = None
+        if photo_key >= 0:
+            row = conn.execute(
+                "SELECT id FROM photos WHERE city_id = ? ORDER BY position LIMIT 1 OFFSET ?",
+                (city_id, photo_key),
+            ).fetchone()
+        if row is None:
+            raise IndexError("照片索引无效")
+        return row
+
+    # --- 写入辅助 ---
+
+    def _insert_photo(self, conn: sqlite3.Connection, city_id: int, photo: Dict[str, Any]):
+        if not photo.get("id"):
+            photo["id"] = new_id()
+        conn.execute(
+            "INSERT INTO photos (city_id, position, public_id, ref, content_type, size, data, extra) "
+            "VALUES (?, (SELECT COALESCE(MAX(position), 0) + 1 FROM photos WHERE city_id = ?), ?, ?, ?, ?, ?, ?)",
+            (
+                city_id, city_id, photo["id"],
+                *(photo.get(column) for column in PHOTO_COLUMNS),
+                _dump_extra(_split_extra(photo, PHOTO_COLUMNS, skip=("id",))),
+            ),
+        )
+
+    def _insert_city(self, conn: sqlite3.Connection, user_id: int, city: Dict[str, Any]) -> int:
+        """插入城市及其照片；没有 id 的城市/照片生成新 id 并写回字典 (调用方返回和通知监听者时需要)。"""
+        if not city.get("id"):
+            city["id"] = new_id()
+        cursor = conn.execute(
+            "INSERT INTO cities (user_id, position, public_id, city, country, latitude, longitude, transport_mode, blog, visit_date, extra) "
+            "VALUES (?, (SELECT COALESCE(MAX(position), 0) + 1 FROM cities WHERE user_id = ?), ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                user_id, user_id, city["id"],
+                *(_to_db_value(city.get(column)) for column in CITY_COLUMNS),
+                _dump_extra(_split_extra(city, CITY_COLUMNS, skip=("photos", "id", "_version"))),
+            ),
+        )
+        city_id = cursor.lastrowid
+        for photo in city.get("photos") or []:
+            self._insert_photo(conn, city_id, photo)
+        return city_id
+
+    def _replace_cities(self, conn: sqlite3.Connection, user_id: int, travel_trails: Optional[List[Dict[str, Any]]]):
+        conn.execute("DELETE FROM cities WHERE user_id = ?", (user_id,))
+        if travel_trails:
+            for city in travel_trails[0].get("cities") or []:
+                self._insert_city(conn, user_id, city)
+
+    def _insert_user(self, conn: sqlite3.Connection, user_data: Dict[str, Any]) -> int:
+        cursor = conn.execute(
+            "INSERT INTO users (username, email, password, disabled, age, version, extra) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                user_data["username"],
+                user_data.get("email"),
+                user_data.get("password"),
+                int(bool(user_data.get("disabled", False))),
+                user_data.get("age"),
+                user_data.get("_version", 1),
+                _dump_extra(_split_extra(user_data, USER_COLUMNS, skip=("username", "travel_trails", "_version", "trail_stats"))),
+            ),
+        )
+        user_id = cursor.lastrowid
+        self._replace_cities(conn, user_id, user_data.get("travel_trails"))
+        self._store_trail_stats(conn, user_id, self._build_trail_stats(conn, user_id))
+        return user_id
+
+    def _bump_version(self, conn: sqlite3.Connection, user_id: int) -> int:
+        """用户版本号加一并返回新版本 (在写事务内调用，结果不会被其他写入打断)。"""
+        conn.execute("UPDATE users SET version = version + 1 WHERE id = ?", (user_id,))
+        return conn.execute("SELECT version FROM users WHERE id = ?", (user_id,)).fetchone()[0]
+
+    # --- 统计聚合值 (users.trail_stats)，在同一个写事务内随城市增删更新 ---
+
+    def _aggregate_city_rows(self, conn: sqlite3.Connection, where: str, params: tuple) -> List[Dict[str, Any]]:
+        return [dict(row) for row in conn.execute(
+            f"SELECT {', '.join(AGGREGATE_CITY_FIELDS)} FROM cities WHERE {where}", params
+        )]
+
+    def _neighbor_city(self, conn: sqlite3.Connection, user_id: int, position: int, before: bool) -> Optional[Dict[str, Any]]:
+        """位置 position 之前 (before=True) 或之后的第一个城市 (position 只增不减，不一定连续)。"""
+        where = "user_id = ? AND position < ? ORDER BY position DESC" if before else "user_id = ? AND position > ? ORDER BY position"
+        rows = self._aggregate_city_rows(conn, f"{where} LIMIT 1", (user_id, position))
+        return rows[0] if rows else None
+
+    def _last_city(self, conn: sqlite3.Connection, user_id: int) -> Optional[Dict[str, Any]]:
+        rows = self._aggregate_city_rows(conn, "user_id = ? ORDER BY position DESC LIMIT 1", (user_id,))
+        return rows[0] if rows else None
+
+    def _build_trail_stats(self, conn: sqlite3.Connection, user_id: int) -> Dict[str, Any]:
+        """从用户当前的城市计算聚合值。"""
+        return build_trail_aggregates(self._aggregate_city_rows(conn, "user_id = ? ORDER BY position", (user_id,)))
+
+    def _load_trail_stats(self, conn: sqlite3.Connection, user_row: sqlite3.Row) -> Dict[str, Any]:
+        """用户行中的聚合值；为 NULL (启动补算之前由旧版本写入) 时从当前城市计算。"""
+        if user_row["trail_stats"]:
+            return json.loads(user_row["trail_stats"])
+        return self._build_trail_stats(conn, user_row["id"])
+
+    def _backfill_trail_stats(self):
+        """启动时为聚合值为 NULL 的用户 (增加 trail_stats 列之前的数据) 补算并保存，之后读取统计不需要写入。"""
+        if not self._conn().execute("SELECT 1 FROM users WHERE trail_stats IS NULL LIMIT 1").fetchone():
+            return
+        with self._write_transaction() as conn:
+            user_ids = [row["id"] for row in conn.execute("SELECT id FROM users WHERE trail_stats IS NULL")]
+            for user_id in user_ids:
+                self._store_trail_stats(conn, user_id, self._build_trail_stats(conn, user_id))
+        if user_ids:
+            print(f"[DAO] Computed trail stats for {len(user_ids)} users in {self.db_path}")
+
+    def _store_trail_stats(self, conn: sqlite3.Connection, user_id: int, stats: Dict[str, Any]):
+        conn.execute("UPDATE users SET trail_stats = ? WHERE id = ?", (json.dumps(stats, ensure_ascii=False), user_id))
+
+    # --- 对外接口 (与 JSON 版 UserManagementDAO 一致) ---
+
+    def list_usernames(self) -> List[str]:
+        return [row["username"] for row in self._conn().execute("SELECT username FROM users ORDER BY id")]
+
+    def find_user_by_username(self, username: str) -> Optional[Dict[str, Any]]:
+        """通过用户名查找用户。"""
+        with self._read_transaction() as conn:
+            row = self._user_row(conn, username)
+            return self._user_to_dict(conn, row) if row else None
+
+    def find_user_by_email(self, email: str) -> Optional[Dict[str, Any]]:
+        """通过邮箱查找用户 (idx_users_email 索引)。"""
+        with self._read_transaction() as conn:
+            row = conn.execute("SELECT * FROM users WHERE email = ? LIMIT 1", (email,)).fetchone()
+            return self._user_to_dict(conn, row) if row else None
+
+    def save_user(self, user_data_to_save: Dict[str, Any], overwrite: bool = True) -> Dict[str, Any]:
+        """
+        保存新用户或整体覆盖现有用户 (基于 username)。
+        overwrite=False 时用户已存在则抛出 ValueError (注册时使用，检查与写入在同一事务内完成)。
+        """
+        username = user_data_to_save.get("username")
+        if not username:
+            raise ValueError("Username is required to save a user.")
+        with self._unique_email(user_data_to_save.get("email")), self._write_transaction() as conn:
+            row = self._user_row(conn, username)
+            if row is not None and not overwrite:
+                raise ValueError(f"用户名 '{username}' 已存在。")
+            if row is not None:
+                user_data_to_save["_version"] = row["version"] + 1
+                conn.execute("DELETE FROM users WHERE id = ?", (row["id"],))
+            self._insert_user(conn, user_data_to_save)
+            self._notify_after_commit(TRAIL_REPLACED, username, trail_cities(user_data_to_save))
+        return user_data_to_save
+
+    def update_user(self, username: str, update_data: Dict[str, Any], expected_version: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """
+        更新指定用户名的用户信息；travel_trails 会整体替换该用户的城市。
+        username 是主键，与 JSON 存储一致，不会因为 update_data 中的 username 而改变。
+        """
+        with self._unique_email(update_data.get("email")), self._write_transaction() as conn:
+            row = self._user_row_for_update(conn, username, expected_version)
+            if row is None:
+                return None
+            extra = _load_extra(row["extra"])
+            extra.update(_split_extra(update_data, USER_COLUMNS, skip=("username", "travel_trails", "_version", "trail_stats")))
+            values = {column: row[column] for column in USER_COLUMNS}
+            values.update({k: v for k, v in update_data.items() if k in USER_COLUMNS})
+            conn.execute(
+                "UPDATE users SET email = ?, password = ?, disabled = ?, age = ?, extra = ?, version = version + 1 WHERE id = ?",
+                (values["email"], values["password"], int(bool(values["disabled"])), values["age"], _dump_extra(extra), row["id"]),
+            )
+            if "travel_trails" in update_data:
+                self._replace_cities(conn, row["id"], update_data["travel_trails"])
+                # 整体替换轨迹：在同一事务内从新的城市重新计算聚合值
+                self._store_trail_stats(conn, row["id"], self._build_trail_stats(conn, row["id"]))
+            user = self._user_to_dict(conn, self._user_row(conn, username))
+            if "travel_trails" in update_data:
+                self._notify_after_commit(TRAIL_REPLACED, username, trail_cities(user))
+        return user
+
+    def delete_user(self, username: str) -> bool:
+        """通过用户名删除用户 (城市和照片级联删除)。"""
+        with self._write_transaction() as conn:
+            deleted = conn.execute("DELETE FROM users WHERE username = ?", (username,)).rowcount > 0
+            if deleted:
+                self._notify_after_commit(TRAIL_USER_DELETED, username, [])
+        return deleted
+
+    def user_has_photo(self, username: str, ref: str) -> bool:
+        """用户轨迹中是否有引用该内容哈希的照片 (照片接口据此限制只能读取自己轨迹中的照片)。"""
+        row = self._conn().execute(
+            "SELECT 1 FROM photos JOIN cities ON photos.city_id = cities.id JOIN users ON cities.user_id = users.id "
+            "WHERE photos.ref = ? AND users.username = ? LIMIT 1", (ref, username)
+        ).fetchone()
+        return row is not None
+
+    def list_photo_refs(self) -> Set[str]:
+        """所有用户轨迹中引用的照片内容哈希 (清理未引用照片时的标记阶段)。"""
+        return {row[0] for row in self._conn().execute("SELECT DISTINCT ref FROM photos WHERE ref IS NOT NULL")}
+
+    def get_user_version(self, username: str) -> Optional[int]:
+        """只读取用户的版本号 (每次变更加一)，用于 ETag；用户不存在时返回 None。"""
+        row = self._conn().execute("SELECT version FROM users WHERE username = ?", (username,)).fetchone()
+        return row["version"] if row else None
+
+    def list_cities(self, username: str, offset: int = 0, limit: Optional[int] = None,
+                    fields: Tuple[str, ...] = DEFAULT_CITY_LIST_FIELDS) -> Optional[Tuple[List[Dict[str, Any]], int]]:
+        """
+        分页并按字段投影读取用户的城市列表，返回 (当前页, 城市总数)；用户不存在时返回 None。
+        只查询需要的列：不请求 blog/photos 时不会读取博客正文和照片行，photo_count 由子查询统计。
+        """
+        with self._read_transaction() as conn:
+            user_row = conn.execute("SELECT id FROM users WHERE username = ?", (username,)).fetchone()
+            if user_row is None:
+                return None
+            total = conn.execute("SELECT COUNT(*) FROM cities WHERE user_id = ?", (user_row["id"],)).fetchone()[0]
+            select = ["id", "public_id"] + [field for field in fields if field in CITY_COLUMNS]
+            if "photo_count" in fields:
+                select.append("(SELECT COUNT(*) FROM photos WHERE photos.city_id = cities.id) AS photo_count")
+            city_rows = conn.execute(
+                f"SELECT {', '.join(select)} FROM cities WHERE user_id = ? ORDER BY position LIMIT ? OFFSET ?",
+                (user_row["id"], -1 if limit is None else limit, offset),
+            ).fetchall()
+            photos_by_city: Dict[int, List[Dict[str, Any]]] = {}
+            if "photos" in fields and city_rows:
+                # 按批查询，不传 limit (如导出) 时城市数可能超过 SQLite 单条语句的参数个数上限
+                city_ids = [city_row["id"] for city_row in city_rows]
+                for start in range(0, len(city_ids), _IN_QUERY_BATCH_SIZE):
+                    batch = city_ids[start:start + _IN_QUERY_BATCH_SIZE]
+                    for photo_row in conn.execute(
+                        f"SELECT * FROM photos WHERE city_id IN ({', '.join('?' * len(batch))}) ORDER BY city_id, position",
+                        batch,
+                    ):
+                        photos_by_city.setdefault(photo_row["city_id"], []).append(self._photo_to_dict(photo_row))
+            cities = []
+            for i, city_row in enumerate(city_rows):
+                item: Dict[str, Any] = {"index": offset + i, "id": city_row["public_id"]}
+                for field in fields:
+                    if field == "photos":
+                        item["photos"] = photos_by_city.get(city_row["id"], [])
+                    else:
+                        item[field] = city_row[field]
+                cities.append(item)
+            return cities, total
+
+    def get_trail_stats(self, username: str) -> Optional[Dict[str, Any]]:
+        """读取增量维护的统计聚合值并整理成统计结果 (带 "_version")，与城市数量无关；用户不存在时返回 None。"""
+        with self._read_transaction() as conn:
+            row = conn.execute("SELECT id, version, trail_stats FROM users WHERE username = ?", (username,)).fetchone()
+            if row is None:
+                return None
+            # 只读：聚合值缺失时在同一快照内从城市计算，不在读路径上写入 (补算见 _backfill_trail_stats)
+            return dict(summarize_trail_aggregates(self._load_trail_stats(conn, row)), _version=row["version"])
+
+    def rebuild_trail_stats(self, username: str) -> Optional[Dict[str, Any]]:
+        """从城市重新计算统计聚合值并保存 (一致性修复用)，返回新的统计结果；用户数据版本不变。"""
+        with self._write_transaction() as conn:
+            row = self._user_row(conn, username)
+            if row is None:
+                return None
+            stats = self._build_trail_stats(conn, row["id"])
+            self._store_trail_stats(conn, row["id"], stats)
+            return dict(summarize_trail_aggregates(stats), _version=row["version"])
+
+    def list_city_columns(self, username: str, fields: Tuple[str, ...]) -> Optional[Dict[str, List[Any]]]:
+        """按列读取全部城市的标量字段 (如统计用的经纬度)：{字段: [按轨迹顺序的值]}；用户不存在时返回 None。"""
+        with self._read_transaction() as conn:
+            user_row = conn.execute("SELECT id FROM users WHERE username = ?", (username,)).fetchone()
+            if user_row is None:
+                return None
+            fields = tuple(field for field in fields if field in CITY_COLUMNS)
+            rows = conn.execute(
+                f"SELECT {', '.join(fields)} FROM cities WHERE user_id = ? ORDER BY position", (user_row["id"],)
+            ).fetchall()
+            columns = list(zip(*rows)) if rows else [()] * len(fields)
+            return {field: list(column) for field, column in zip(fields, columns)}
+
+    # --- 旅行轨迹的细粒度变更 ---
+    # 城市/照片可以按位置 (int) 或稳定 id (str) 定位。
+    # 用户不存在时返回 None；城市/照片索引无效或 id 不存在时抛出 IndexError；
+    # 传入 expected_version 且与当前版本不一致时抛出 VersionConflictError。
+    # 返回的城市带有 "_version"：变更后该用户的版本号 (用于 ETag / If-Match)。
+
+    def get_city(self, username: str, city_key: ItemKey) -> Optional[Dict[str, Any]]:
+        """按位置或 id 读取单个城市 (只查询该城市及其照片)；用户不存在时返回 None。"""
+        with self._read_transaction() as conn:
+            user_row = conn.execute("SELECT id, version FROM users WHERE username = ?", (username,)).fetchone()
+            if user_row is None:
+                return None
+            city = self._city_to_dict(conn, self._city_row(conn, user_row["id"], city_key))
+            city["_version"] = user_row["version"]
+            return city
+
+    def add_city(self, username: str, city_data: Dict[str, Any], expected_version: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """在用户轨迹末尾追加一个城市，返回新城市。"""
+        with self._write_transaction() as conn:
+            row = self._user_row_for_update(conn, username, expected_version)
+            if row is None:
+                return None
+            stats = self._load_trail_stats(conn, row)
+            add_city_to_aggregates(stats, self._last_city(conn, row["id"]), city_data)
+            city_id = self._insert_city(conn, row["id"], city_data)
+            self._store_trail_stats(conn, row["id"], stats)
+            version = self._bump_version(conn, row["id"])
+            city = self._city_to_dict(conn, conn.execute("SELECT * FROM cities WHERE id = ?", (city_id,)).fetchone())
+            city["_version"] = version
+            self._notify_after_commit(TRAIL_CITIES_ADDED, username, [city])
+        return city
+
+    def add_cities(self, username: str, cities: List[Dict[str, Any]], expected_version: Optional[int] = None) -> Optional[List[Dict[str, Any]]]:
+        """批量追加城市 (导入用)：整批在一个事务中写入，版本号只加一，返回新城市列表。"""
+        with self._write_transaction() as conn:
+            row = self._user_row_for_update(conn, username, expected_version)
+            if row is None:
+                return None
+            last_position = conn.execute(
+                "SELECT COALESCE(MAX(position), 0) FROM cities WHERE user_id = ?", (row["id"],)
+            ).fetchone()[0]
+            stats = self._load_trail_stats(conn, row)
+            previous = self._last_city(conn, row["id"])
+            for city in cities:
+                add_city_to_aggregates(stats, previous, city)
+                self._insert_city(conn, row["id"], city)
+                previous = city
+            self._store_trail_stats(conn, row["id"], stats)
+            self._bump_version(conn, row["id"])
+            city_rows = conn.execute(
+                "SELECT * FROM cities WHERE user_id = ? AND position > ? ORDER BY position", (row["id"], last_position)
+            ).fetchall()
+            added = [self._city_to_dict(conn, city_row) for city_row in city_rows]
+            self._notify_after_commit(TRAIL_CITIES_ADDED, username, added)
+        return added
+
+    def remove_city(self, username: str, city_key: ItemKey, expected_version: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """删除指定位置或 id 的城市，返回被删除的城市。"""
+        with self._write_transaction() as conn:
+            row = self._user_row_for_update(conn, username, expected_version)
+            if row is None:
+                return None
+            city_row = self._city_row(conn, row["id"], city_key)
+            city = self._city_to_dict(conn, city_row)
+            stats = self._load_trail_stats(conn, row)
+            remove_city_from_aggregates(
+                stats,
+                self._neighbor_city(conn, row["id"], city_row["position"], before=True),
+                city,
+                self._neighbor_city(conn, row["id"], city_row["position"], before=False),
+            )
+            conn.execute("DELETE FROM cities WHERE id = ?", (city_row["id"],))
+            self._store_trail_stats(conn, row["id"], stats)
+            city["_version"] = self._bump_version(conn, row["id"])
+            self._notify_after_commit(TRAIL_CITY_REMOVED, username, [city])
+        return city
+
+    def update_city_blog(self, username: str, city_key: ItemKey, blog: Optional[str], expected_version: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """更新城市博客，返回更新后的城市。"""
+        with self._write_transaction() as conn:
+            row = self._user_row_for_update(conn, username, expected_version)
+            if row is None:
+                return None
+            city_row = self._city_row(conn, row["id"], city_key)
+            conn.execute("UPDATE cities SET blog = ? WHERE id = ?", (blog, city_row["id"]))
+            version = self._bump_version(conn, row["id"])
+            city = self._city_to_dict(conn, conn.execute("SELECT * FROM cities WHERE id = ?", (city_row["id"],)).fetchone())
+            city["_version"] = version
+            return city
+
+    def add_photo(self, username: str, city_key: ItemKey, photo: Dict[str, Any], expected_version: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """为城市追加一张照片，返回更新后的城市。"""
+        with self._write_transaction() as conn:
+            row = self._user_row_for_update(conn, username, expected_version)
+            if row is None:
+                return None
+            city_row = self._city_row(conn, row["id"], city_key)
+            self._insert_photo(conn, city_row["id"], photo)
+            version = self._bump_version(conn, row["id"])
+            city = self._city_to_dict(conn, city_row)
+            city["_version"] = version
+            return city
+
+    def remove_photo(self, username: str, city_key: ItemKey, photo_key: ItemKey, expected_version: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """删除城市中的一张照片 (按位置或 id)，返回更新后的城市。"""
+        with self._write_transaction() as conn:
+            row = self._user_row_for_update(conn, username, expected_version)
+            if row is None:
+                return None
+            city_row = self._city_row(conn, row["id"], city_key)
+            photo_row = self._photo_row(conn, city_row["id"], photo_key)
+            conn.execute("DELETE FROM photos WHERE id = ?", (photo_row["id"],))
+            version = self._bump_version(conn, row["id"])
+            city = self._city_to_dict(conn, city_row)
+            city["_version"] = version
+            self._notify_after_commit(TRAIL_PHOTO_REMOVED, username, [city])
+        return city
+
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """与 JSON 版接口一致；SQLite 存储没有进程内记录缓存 (依赖 SQLite 自身的页缓存)，返回空统计。"""
+        return {}
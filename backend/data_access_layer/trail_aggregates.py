@@ -0,0 +1,149 @@
+# backend/data_access_layer/trail_aggregates.py
+# 每个用户的旅行统计聚合值 (trail_stats)，与用户记录一起保存，由增删城市的写路径增量维护，
+# 读取统计时只需把聚合值整理成响应 (与城市数量无关)。
+# 聚合值只包含计数和距离之和：
+#   {"city_count", "cities_by_mode", "segments_by_mode", "distance_by_mode", "countries", "city_visits", "months"}
+# 计数为 0 的分组会被删除；距离是浮点累加，可能有微小误差，可随时用 build_trail_aggregates 从城市重建。
+
+import math
+from typing import Any, Dict, List, Optional
+
+# 地球平均半径 (km)
+EARTH_RADIUS_KM = 6371.0088
+# 城市没有填写交通方式时的分组名
+UNKNOWN_TRANSPORT_MODE = "unknown"
+# 计算聚合值需要的城市字段
+AGGREGATE_CITY_FIELDS = ("city", "country", "latitude", "longitude", "transport_mode", "visit_date")
+# city_visits 的键：城市名和国家用不可见分隔符拼接
+_CITY_KEY_SEPARATOR = "\x1f"
+
+
+def transport_mode_key(city: Dict[str, Any]) -> str:
+    return city.get("transport_mode") or UNKNOWN_TRANSPORT_MODE
+
+
+def visit_month_key(city: Dict[str, Any]) -> Optional[str]:
+    """visit_date (ISO 8601 字符串或 datetime) -> "YYYY-MM"；没有或无法识别时返回 None。"""
+    visit_date = city.get("visit_date")
+    if not visit_date:
+        return None
+    month = str(visit_date)[:7]
+    return month if len(month) == 7 and month[4] == "-" and month[:4].isdigit() and month[5:].isdigit() else None
+
+
+def segment_km(previous: Dict[str, Any], city: Dict[str, Any]) -> Optional[float]:
+    """两个城市之间的大圆距离 (haversine，km)；任一城市缺少经纬度时返回 None (该段不计入)。"""
+    try:
+        lat1, lon1, lat2, lon2 = (
+            math.radians(float(value))
+            for value in (previous.get("latitude"), previous.get("longitude"), city.get("latitude"), city.get("longitude"))
+        )
+    except (TypeError, ValueError):
+        return None
+    if not all(math.isfinite(value) for value in (lat1, lon1, lat2, lon2)):
+        return None
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(1.0, max(0.0, a))))
+
+
+def empty_trail_aggregates() -> Dict[str, Any]:
+    return {
+        "city_count": 0,
+        "cities_by_mode": {},
+        "segments_by_mode": {},
+        "distance_by_mode": {},
+        "countries": {},
+        "city_visits": {},
+        "months": {},
+    }
+
+
+def _bump(counts: Dict[str, Any], key: Optional[str], delta):
+    if key is None:
+        return
+    value = counts.get(key, 0) + delta
+    if value:
+        counts[key] = value
+    else:
+        counts.pop(key, None)
+
+
+def _change_segment(aggregates: Dict[str, Any], previous: Dict[str, Any], city: Dict[str, Any], sign: int):
+    """路段 previous -> city 计入到达城市 city 的交通方式。"""
+    distance = segment_km(previous, city)
+    if distance is None:
+        return
+    mode = transport_mode_key(city)
+    _bump(aggregates["segments_by_mode"], mode, sign)
+    if mode in aggregates["segments_by_mode"]:
+        aggregates["distance_by_mode"][mode] = aggregates["distance_by_mode"].get(mode, 0.0) + sign * distance
+    else:  # 该交通方式已经没有路段，直接清零，避免浮点累加的残差
+        aggregates["distance_by_mode"].pop(mode, None)
+
+
+def _change_city(aggregates: Dict[str, Any], city: Dict[str, Any], sign: int):
+    aggregates["city_count"] += sign
+    _bump(aggregates["cities_by_mode"], transport_mode_key(city), sign)
+    _bump(aggregates["countries"], city.get("country") or None, sign)
+    if city.get("city"):
+        _bump(aggregates["city_visits"], f"{city['city']}{_CITY_KEY_SEPARATOR}{city.get('country') or ''}", sign)
+    _bump(aggregates["months"], visit_month_key(city), sign)
+
+
+def add_city_to_aggregates(aggregates: Dict[str, Any], previous: Optional[Dict[str, Any]], city: Dict[str, Any]):
+    """在轨迹末尾追加 city (previous 为原来的最后一个城市)。"""
+    _change_city(aggregates, city, 1)
+    if previous is not None:
+        _change_segment(aggregates, previous, city, 1)
+
+
+def remove_city_from_aggregates(aggregates: Dict[str, Any], previous: Optional[Dict[str, Any]], city: Dict[str, Any],
+                                following: Optional[Dict[str, Any]]):
+    """删除 city (previous / following 为它前后的城市)：去掉两段路程，前后城市直接相连。"""
+    _change_city(aggregates, city, -1)
+    if previous is not None:
+        _change_segment(aggregates, previous, city, -1)
+    if following is not None:
+        _change_segment(aggregates, city, following, -1)
+        if previous is not None:
+            _change_segment(aggregates, previous, following, 1)
+
+
+def build_trail_aggregates(cities: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """从城市列表重建聚合值 (旧数据升级、整体替换轨迹、一致性修复时使用)。"""
+    aggregates = empty_trail_aggregates()
+    previous = None
+    for city in cities:
+        add_city_to_aggregates(aggregates, previous, city)
+        previous = city
+    return aggregates
+
+
+def summarize_trail_aggregates(aggregates: Dict[str, Any]) -> Dict[str, Any]:
+    """聚合值 -> 统计响应 (与 trail_statistics.compute_trail_statistics 的结果格式相同)。"""
+    months = dict(sorted(aggregates["months"].items()))
+    years: Dict[str, int] = {}
+    for month, visits in months.items():
+        years[month[:4]] = years.get(month[:4], 0) + visits
+    modes = set(aggregates["cities_by_mode"]) | set(aggregates["segments_by_mode"])
+    distances = {mode: max(0.0, aggregates["distance_by_mode"].get(mode, 0.0)) for mode in modes}
+    countries = aggregates["countries"]
+    return {
+        "city_count": aggregates["city_count"],
+        "unique_city_count": len(aggregates["city_visits"]),
+        "country_count": len(countries),
+        "total_distance_km": round(sum(distances.values()), 3),
+        "countries": dict(sorted(countries.items(), key=lambda item: (-item[1], item[0]))),
+        "transport_modes": {
+            mode: {
+                "cities": aggregates["cities_by_mode"].get(mode, 0),
+                "segments": aggregates["segments_by_mode"].get(mode, 0),
+                "distance_km": round(distances[mode], 3),
+            }
+            for mode in sorted(modes)
+        },
+        "by_year": years,
+        "by_month": months,
+        "first_visit_month": min(months) if months else None,
+        "last_visit_month": max(months) if months else None,
+    }
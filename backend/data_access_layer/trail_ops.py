@@ -0,0 +1,230 @@
+# backend/data_access_layer/trail_ops.py
+# 用户记录上的变更操作 (mutation)。
+# 每个变更是一个小字典，例如 {"op": "add_city", "city": {...}}，
+# 既用于直接修改内存中的记录，也用于写入/回放追加日志 (journal)。
+# 城市和照片可以按位置 (city_index / photo_index) 或稳定 id (city_id / photo_id) 定位；
+# 按 id 定位不受其他客户端并发删除导致的位置变化影响。
+
+import copy
+import uuid
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Union
+
+from .trail_aggregates import add_city_to_aggregates, build_trail_aggregates, remove_city_from_aggregates
+
+# 城市/照片的定位方式：int 为在列表中的位置，str 为稳定 id
+ItemKey = Union[int, str]
+
+# 城市列表接口可选择返回的字段 (fields= 投影)；photo_count 是照片数量，不含照片内容
+CITY_LIST_FIELDS = ("city", "country", "latitude", "longitude", "transport_mode", "visit_date", "blog", "photos", "photo_count")
+# 默认不返回照片和博客正文，地图和统计页面只需要这些字段
+DEFAULT_CITY_LIST_FIELDS = ("city", "country", "latitude", "longitude", "transport_mode", "visit_date", "photo_count")
+
+# 轨迹变更通知的事件类型 (DAO 提交写入后通知监听者，如空间索引)，事件数据为相关城市列表
+TRAIL_CITIES_ADDED = "cities_added"      # 追加的城市
+TRAIL_CITY_REMOVED = "city_removed"      # 被删除的城市 (一个)
+TRAIL_REPLACED = "trail_replaced"        # 整体替换后的全部城市 (保存/更新用户)
+TRAIL_USER_DELETED = "user_deleted"      # 用户被删除 (空列表)
+TRAIL_PHOTO_REMOVED = "photo_removed"    # 删除了照片的城市 (一个，删除后的状态)
+TrailListener = Callable[[str, str, List[Dict[str, Any]]], None]
+
+
+class TrailChangeNotifier:
+    """
+    两种 DAO 共用的轨迹变更通知：监听者以 (事件, 用户名, 城市列表) 被调用。
+    通知在写入提交之后、释放写锁 (JSON：该用户的写锁；SQLite：通知锁) 之前发出，
+    同一用户的通知顺序与提交顺序一致，增量维护的监听者 (如空间索引) 不会先收到较新的变更。
+    监听者应只做内存中的短操作，不得在回调中写入同一个 DAO；出错只打印日志，不影响写入结果。
+    """
+
+    def add_listener(self, listener: TrailListener):
+        if not hasattr(self, "_trail_listeners"):
+            self._trail_listeners: List[TrailListener] = []
+        self._trail_listeners.append(listener)
+
+    def _notify(self, event: str, username: str, cities: List[Dict[str, Any]]):
+        for listener in getattr(self, "_trail_listeners", ()):
+            try:
+                listener(event, username, cities)
+            except Exception as e:
+                print(f"[DAO] Trail listener failed for {username} ({event}): {e}")
+
+
+def ensure_cities(user: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """返回用户第一条轨迹的城市列表，必要时初始化 travel_trails 结构。"""
+    if "travel_trails" not in user or not user["travel_trails"]:
+        user["travel_trails"] = [{"cities": []}]
+    elif "cities" not in user["travel_trails"][0] or user["travel_trails"][0]["cities"] is None:
+        user["travel_trails"][0]["cities"] = []
+    return user["travel_trails"][0]["cities"]
+
+
+def photo_refs(cities: Iterable[Dict[str, Any]]) -> Set[str]:
+    """城市列表中照片引用的内容哈希 (尚未迁移的内嵌照片没有 ref)。"""
+    return {photo["ref"] for city in cities for photo in city.get("photos") or []
+            if isinstance(photo, dict) and photo.get("ref")}
+
+
+def trail_cities(user: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """只读地取出用户第一条轨迹的城市列表 (没有时为空列表)。"""
+    trails = user.get("travel_trails") or [{}]
+    return trails[0].get("cities") or []
+
+
+def new_id() -> str:
+    """城市/照片的稳定 id。"""
+    return uuid.uuid4().hex
+
+
+def ensure_ids(user: Dict[str, Any]) -> bool:
+    """给缺少 id 的城市和照片分配 id (旧数据升级用)，返回记录是否被修改。"""
+    changed = False
+    for trail in user.get("travel_trails") or []:
+        for city in trail.get("cities") or []:
+            if not city.get("id"):
+                city["id"] = new_id()
+                changed = True
+            for photo in city.get("photos") or []:
+                if isinstance(photo, dict) and not photo.get("id"):
+                    photo["id"] = new_id()
+                    changed = True
+    return changed
+
+
+def refresh_trail_stats(user: Dict[str, Any]) -> Dict[str, Any]:
+    """从城市重新计算记录中的统计聚合值 (trail_stats)。"""
+    trails = user.get("travel_trails") or [{}]
+    user["trail_stats"] = build_trail_aggregates(trails[0].get("cities") or [])
+    return user["trail_stats"]
+
+
+def ensure_trail_stats(user: Dict[str, Any]) -> Dict[str, Any]:
+    """返回记录中的统计聚合值；旧记录没有时先从城市计算。"""
+    if not isinstance(user.get("trail_stats"), dict):
+        return refresh_trail_stats(user)
+    return user["trail_stats"]
+
+
+def city_positions(user: Dict[str, Any]) -> Dict[str, int]:
+    """城市 id -> 在轨迹中的位置。"""
+    trails = user.get("travel_trails") or [{}]
+    return {city["id"]: i for i, city in enumerate(trails[0].get("cities") or []) if city.get("id")}
+
+
+def city_key_fields(city_key: ItemKey) -> Dict[str, Any]:
+    """构造变更记录中定位城市的字段。"""
+    return {"city_id": city_key} if isinstance(city_key, str) else {"city_index": city_key}
+
+
+def photo_key_fields(photo_key: ItemKey) -> Dict[str, Any]:
+    return {"photo_id": photo_key} if isinstance(photo_key, str) else {"photo_index": photo_key}
+
+
+def _city_position(user: Dict[str, Any], mutation: Dict[str, Any], positions: Optional[Dict[str, int]]) -> int:
+    """按 city_index 或 city_id 找到城市的位置；有 id -> 位置索引时 O(1)，否则线性查找。"""
+    cities = ensure_cities(user)
+    if "city_id" in mutation:
+        city_id = mutation["city_id"]
+        position = positions.get(city_id) if positions is not None else None
+        if position is None or position >= len(cities) or cities[position].get("id") != city_id:
+            position = next((i for i, city in enumerate(cities) if city.get("id") == city_id), None)
+        if position is None:
+            raise IndexError("城市不存在")
+        return position
+    city_index = mutation["city_index"]
+    if not (0 <= city_index < len(cities)):
+        raise IndexError("城市索引无效")
+    return city_index
+
+
+def _get_city(user: Dict[str, Any], mutation: Dict[str, Any], positions: Optional[Dict[str, int]]) -> Dict[str, Any]:
+    return ensure_cities(user)[_city_position(user, mutation, positions)]
+
+
+def _city_photos(city: Dict[str, Any]) -> List[Dict[str, Any]]:
+    if "photos" not in city or city["photos"] is None:
+        city["photos"] = []
+    return city["photos"]
+
+
+def _photo_position(photos: List[Dict[str, Any]], mutation: Dict[str, Any]) -> int:
+    if "photo_id" in mutation:
+        position = next((i for i, photo in enumerate(photos) if photo.get("id") == mutation["photo_id"]), None)
+        if position is None:
+            raise IndexError("照片不存在")
+        return position
+    if not (0 <= mutation["photo_index"] < len(photos)):
+        raise IndexError("照片索引无效")
+    return mutation["photo_index"]
+
+
+def project_city(city: Dict[str, Any], index: int, fields: Iterable[str]) -> Dict[str, Any]:
+    """按 fields 取出城市的部分字段 (附带城市在轨迹中的位置 index)，不修改原记录。"""
+    item: Dict[str, Any] = {"index": index, "id": city.get("id")}
+    for field in fields:
+        if field == "photo_count":
+            item["photo_count"] = len(city.get("photos") or [])
+        elif field == "photos":
+            item["photos"] = copy.deepcopy(city.get("photos") or [])
+        else:
+            item[field] = city.get(field)
+    return item
+
+
+def page_cities(cities: List[Dict[str, Any]], offset: int, limit: Optional[int], fields: Iterable[str]) -> List[Dict[str, Any]]:
+    """城市列表的一页 (按投影字段)。"""
+    end = None if limit is None else offset + limit
+    return [project_city(city, offset + i, fields) for i, city in enumerate(cities[offset:end])]
+
+
+def apply_mutation(user: Dict[str, Any], mutation: Dict[str, Any], positions: Optional[Dict[str, int]] = None) -> Any:
+    """
+    将一个变更应用到用户记录 (原地修改)，返回受影响的对象 (城市字典等)。
+    positions 为可选的城市 id -> 位置索引 (由 DAO 维护)，用于按 id 定位时避免线性查找。
+    增删城市时同时增量更新记录中的统计聚合值 (trail_stats)，整体替换轨迹时重新计算。
+    索引无效或 id 不存在时抛出 IndexError，此时记录不会被修改。
+    """
+    op = mutation["op"]
+    if op == "update":
+        user.update(mutation["data"])
+        if "travel_trails" in mutation["data"] or "trail_stats" in mutation["data"]:
+            refresh_trail_stats(user)
+        return user
+    if op == "add_city":
+        stats = ensure_trail_stats(user)
+        cities = ensure_cities(user)
+        city = dict(mutation["city"])
+        add_city_to_aggregates(stats, cities[-1] if cities else None, city)
+        cities.append(city)
+        return city
+    if op == "add_cities":  # 批量导入：一条变更记录追加多个城市
+        stats = ensure_trail_stats(user)
+        cities = ensure_cities(user)
+        added = [dict(city) for city in mutation["cities"]]
+        for city in added:
+            add_city_to_aggregates(stats, cities[-1] if cities else None, city)
+            cities.append(city)
+        return added
+    if op == "remove_city":
+        cities = ensure_cities(user)
+        position = _city_position(user, mutation, positions)
+        remove_city_from_aggregates(
+            ensure_trail_stats(user),
+            cities[position - 1] if position > 0 else None,
+            cities[position],
+            cities[position + 1] if position + 1 < len(cities) else None,
+        )
+        return cities.pop(position)
+    if op == "set_city_blog":
+        city = _get_city(user, mutation, positions)
+        city["blog"] = mutation["blog"]
+        return city
+    if op == "add_photo":
+        city = _get_city(user, mutation, positions)
+        _city_photos(city).append(dict(mutation["photo"]))
+        return city
+    if op == "remove_photo":
+        city = _get_city(user, mutation, positions)
+        photos = _city_photos(city)
+        photos.pop(_photo_position(photos, mutation))
+        return city
+    raise ValueError(f"Unknown mutation op: {op}")
@@ -4,95 +4,711 @@
 # from .models import User, get_db # 假设 User 模型和数据库会话获取函数在 models.py
 # from werkzeug.security import generate_password_hash, check_password_hash # 用于密码哈希
 
+import copy
+import hashlib
 import json
 import os
-from typing import Optional, Dict, List, Any
+import queue
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Optional, Dict, List, Any, Set, Tuple
+
+from ..config import USERS_DATA_DIR, USER_CACHE_MAX_ENTRIES, JOURNAL_COMPACT_THRESHOLD
+from .lru_cache import LRUCache
+from .trail_ops import (
+    DEFAULT_CITY_LIST_FIELDS, TRAIL_CITIES_ADDED, TRAIL_CITY_REMOVED, TRAIL_PHOTO_REMOVED, TRAIL_REPLACED,
+    TRAIL_USER_DELETED, ItemKey, TrailChangeNotifier, apply_mutation, city_key_fields, city_positions, ensure_ids,
+    ensure_trail_stats, new_id, page_cities, photo_key_fields, photo_refs, refresh_trail_stats, trail_cities,
+)
+from .trail_aggregates import summarize_trail_aggregates
+from .errors import DuplicateEmailError, VersionConflictError
 
 # --- 修改 USERS_FILE 路径 --- 
 # 获取当前 DAO 文件所在的目录
 _DAO_DIR = os.path.dirname(os.path.abspath(__file__))
-# 定义 users.json 文件相对于 DAO 文件目录的位置
+# 定义 users.json 文件相对于 DAO 文件目录的位置 (旧的单文件存储，仅用于首次迁移)
 USERS_FILE = os.path.join(_DAO_DIR, "users.json")
+# 分片存储目录：每个用户一个记录文件，外加一个记录 username -> 文件名 的 manifest
+USERS_DIR = USERS_DATA_DIR or os.path.join(_DAO_DIR, "users_data")
+MANIFEST_FILE = os.path.join(USERS_DIR, "manifest.json")
+# 迁移/升级存储格式时的进程间文件锁 (多个 worker 进程同时启动时只有一个执行迁移)
+MANIFEST_LOCK_FILE = os.path.join(USERS_DIR, "manifest.lock")
+# 2: 增加二级索引；3: 城市和照片带稳定 id
+MANIFEST_FORMAT_VERSION = 3
+# 在 manifest 中维护的二级索引字段 (字段值 -> username)，新增字段只需加入此元组
+SECONDARY_INDEX_FIELDS = ("email",)
+# 其中取值必须唯一的字段：写入前在 manifest 锁内检查，已被其他用户使用时拒绝写入
+UNIQUE_INDEX_FIELDS = ("email",)
+
+# 进程内共享的用户记录缓存：
+# username -> {"signature": (快照签名, 日志签名), "record": 当前状态, "journal_entries": 日志条数, "positions": 城市 id -> 位置}
+# DAO 每个请求都会重新实例化，因此缓存放在模块级别，跨请求复用。
+_user_record_cache = LRUCache(max_entries=USER_CACHE_MAX_ENTRIES)
+# manifest (含二级索引) 的解析结果缓存：(文件签名, manifest)
+_manifest_cache: Dict[str, Any] = {"signature": None, "manifest": None}
+# 每个用户一把写锁：同一用户的读-改-写 (追加日志、写快照、压缩) 串行化，不同用户之间互不阻塞
+_user_locks: Dict[str, threading.RLock] = {}
+_user_locks_guard = threading.Lock()
+# manifest (用户列表 + 二级索引) 的读-改-写单独加锁
+_manifest_lock = threading.RLock()
+# 本进程是否已确认存储格式是最新的 (迁移和索引升级每个进程只检查一次)
+_storage_ready = False
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+@contextmanager
+def _interprocess_lock(path: str):
+    """文件锁：同一时间只有一个进程进入 (进程退出时由操作系统释放，不会遗留)。"""
+    with open(path, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _user_lock(username: str) -> threading.RLock:
+    with _user_locks_guard:
+        lock = _user_locks.get(username)
+        if lock is None:
+            lock = _user_locks[username] = threading.RLock()
+        return lock
+
+
+class _JournalCompactor:
+    """后台压缩线程：把用户的追加日志合并进新的快照，然后删除日志。"""
+
+    def __init__(self):
+        self._queue: "queue.Queue[Tuple[UserManagementDAO, str]]" = queue.Queue()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def schedule(self, dao: "UserManagementDAO", username: str):
+        """由 dao 在写入后调用，压缩时复用同一个 DAO 实例。"""
+        with self._lock:
+            if username in self._pending:
+                return
+            self._pending.add(username)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="journal-compactor", daemon=True)
+                self._thread.start()
+        self._queue.put((dao, username))
+
+    def _run(self):
+        while True:
+            dao, username = self._queue.get()
+            with self._lock:
+                self._pending.discard(username)
+            try:
+                dao.compact_journal(username)
+            except Exception as e:
+                print(f"[DAO] Journal compaction failed for {username}: {e}")
 
-class UserManagementDAO:
+
+_compactor = _JournalCompactor()
+
+class UserManagementDAO(TrailChangeNotifier):
     def __init__(self):
         # self.db_session = next(get_db()) # 如果使用数据库
-        # 确保 users.json 文件存在，如果不存在则创建一个空的
-        if not os.path.exists(USERS_FILE):
-            self._save_users_to_file({}) # 创建空文件
-        pass
-
-    def _load_users_from_file(self) -> Dict[str, Dict]:
-        """从 JSON 文件加载用户数据。"""
-        if not os.path.exists(USERS_FILE):
-            # 如果在 init 时检查并创建了，这里理论上不应该再需要判断不存在的情况
-            # 但作为健壮性保留
-            return {}
+        self._ensure_storage()
+
+    def _ensure_storage(self):
+        """
+        确保分片目录和 manifest 存在且格式最新：首次运行时从旧的 users.json 迁移，旧格式 manifest 重建索引。
+        每个进程只执行一次；在 manifest 锁和进程间文件锁内重新检查，多个线程或进程同时启动时只有一个执行迁移。
+        """
+        global _storage_ready
+        if _storage_ready:
+            return
+        with _manifest_lock:
+            if _storage_ready:
+                return
+            os.makedirs(USERS_DIR, exist_ok=True)
+            with _interprocess_lock(MANIFEST_LOCK_FILE):
+                if not os.path.exists(MANIFEST_FILE):
+                    self._migrate_legacy_users_file()
+                elif self._load_manifest().get("format", 1) < MANIFEST_FORMAT_VERSION:
+                    self._rebuild_indexes()
+            _storage_ready = True
+
+    # --- 分片存储的底层读写 ---
+
+    @staticmethod
+    def _shard_filename(username: str) -> str:
+        """用户名 -> 分片文件名。使用哈希避免非法字符和大小写不敏感文件系统上的冲突。"""
+        return hashlib.sha1(username.encode("utf-8")).hexdigest() + ".json"
+
+    def _shard_path(self, username: str) -> str:
+        return os.path.join(USERS_DIR, self._shard_filename(username))
+
+    def _journal_path(self, username: str) -> str:
+        """用户的追加日志：每行一个 JSON 变更记录，带递增的版本号 "v"。"""
+        return self._shard_path(username)[:-len(".json")] + ".journal"
+
+    def _read_json_file(self, path: str) -> Optional[Any]:
         try:
-            with open(USERS_FILE, "r", encoding='utf-8') as f:
-                data = json.load(f)
-                return data if isinstance(data, dict) else {}
-        except (json.JSONDecodeError, FileNotFoundError):
-             # 如果文件为空或者不是有效的JSON，也返回空字典
-            return {}
+            with open(path, "r", encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except json.JSONDecodeError:
+            # 如果文件为空或者不是有效的JSON，按不存在处理
+            return None
         except Exception as e:
-            print(f"Error loading users from {USERS_FILE}: {e}") # 添加日志
-            return {}
+            print(f"Error loading {path}: {e}") # 添加日志
+            return None
 
-    def _save_users_to_file(self, users: Dict[str, Dict]):
-        """将用户数据保存到 JSON 文件。"""
+    def _write_json_file(self, path: str, data: Any, indent: Optional[int] = 2):
+        """
+        先写临时文件再原子替换，写入中途崩溃不会留下被截断的文件。
+        临时文件由 mkstemp 在同一目录下创建 (os.replace 要求同一文件系统)，多进程/多线程写入同一文件时互不覆盖。
+        """
+        tmp_path = None
         try:
-            with open(USERS_FILE, "w", encoding='utf-8') as f:
-                json.dump(users, f, indent=2, ensure_ascii=False)
+            fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=os.path.dirname(path))
+            with os.fdopen(fd, "w", encoding='utf-8') as f:
+                json.dump(data, f, indent=indent, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
         except Exception as e:
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
             # 在实际应用中，这里应该有更健壮的错误处理和日志记录
-            print(f"DAO Error: Failed to save user data to {USERS_FILE}: {e}")
-            # raise PersistError(f"Failed to save user data: {str(e)}") # 自定义异常
-            raise IOError(f"Failed to save user data to {USERS_FILE}: {str(e)}")
+            print(f"DAO Error: Failed to save user data to {path}: {e}")
+            raise IOError(f"Failed to save user data to {path}: {str(e)}")
+
+    @staticmethod
+    def _empty_manifest() -> Dict[str, Any]:
+        return {
+            "format": MANIFEST_FORMAT_VERSION,
+            "users": {},
+            "indexes": {field: {} for field in SECONDARY_INDEX_FIELDS},
+        }
+
+    def _load_manifest(self) -> Dict[str, Any]:
+        """
+        加载 manifest：{"format": 3, "users": {username: 分片文件名}, "indexes": {字段: {值: username}}}。
+        返回的是缓存中的共享对象，只读；需要修改时请先 _copy_manifest。
+        """
+        signature = self._file_signature(MANIFEST_FILE)
+        if signature is not None and _manifest_cache["signature"] == signature:
+            return _manifest_cache["manifest"]
+        manifest = self._read_json_file(MANIFEST_FILE)
+        if not isinstance(manifest, dict) or not isinstance(manifest.get("users"), dict):
+            return self._empty_manifest()
+        indexes = manifest.setdefault("indexes", {})
+        for field in SECONDARY_INDEX_FIELDS:
+            indexes.setdefault(field, {})
+        _manifest_cache["signature"] = signature
+        _manifest_cache["manifest"] = manifest
+        return manifest
+
+    def _copy_manifest(self) -> Dict[str, Any]:
+        return copy.deepcopy(self._load_manifest())
+
+    def _save_manifest(self, manifest: Dict[str, Any]):
+        _manifest_cache["signature"] = None
+        self._write_json_file(MANIFEST_FILE, manifest)
+        _manifest_cache["signature"] = self._file_signature(MANIFEST_FILE)
+        _manifest_cache["manifest"] = manifest
+
+    @staticmethod
+    def _index_user(manifest: Dict[str, Any], username: str, old_data: Optional[Dict[str, Any]], new_data: Optional[Dict[str, Any]]) -> bool:
+        """根据新旧记录更新 manifest 中的二级索引，返回索引是否发生变化。"""
+        changed = False
+        for field in SECONDARY_INDEX_FIELDS:
+            index = manifest["indexes"][field]
+            old_value = old_data.get(field) if old_data else None
+            new_value = new_data.get(field) if new_data else None
+            if old_value == new_value and (new_value is None or index.get(new_value) == username):
+                continue
+            if old_value is not None and index.get(old_value) == username:
+                del index[old_value]
+                changed = True
+            if new_value is not None:
+                index[new_value] = username
+                changed = True
+        return changed
+
+    def _check_unique(self, manifest: Dict[str, Any], username: str, new_data: Dict[str, Any]):
+        """
+        唯一字段的值已被其他用户使用时抛出 DuplicateEmailError (调用方持有 _manifest_lock)。
+        索引项指向的用户记录中已不是该值 (索引过期) 时不算冲突。
+        """
+        for field in UNIQUE_INDEX_FIELDS:
+            value = new_data.get(field)
+            owner = manifest["indexes"][field].get(value) if value is not None else None
+            if owner is None or owner == username:
+                continue
+            owner_data = self._load_cache_entry(owner)
+            if owner_data is not None and owner_data["record"].get(field) == value:
+                raise DuplicateEmailError(value)
+
+    def _rebuild_indexes(self):
+        """扫描所有分片重建二级索引，并给旧数据中的城市/照片补上稳定 id (旧格式 manifest 升级时使用)。"""
+        manifest = self._copy_manifest()
+        manifest["format"] = MANIFEST_FORMAT_VERSION
+        manifest["indexes"] = {field: {} for field in SECONDARY_INDEX_FIELDS}
+        for username in manifest["users"]:
+            user_data = self._load_user_record(username)
+            if user_data is not None and ensure_ids(user_data):
+                self._save_user_record(username, user_data)
+            self._index_user(manifest, username, None, user_data)
+        self._save_manifest(manifest)
+        print(f"[DAO] Rebuilt secondary indexes for {len(manifest['users'])} users")
+
+    def _find_by_index(self, field: str, value: Any) -> Optional[Dict[str, Any]]:
+        """通过二级索引查找用户，O(1)；索引与记录不一致时按未找到处理。"""
+        username = self._load_manifest()["indexes"].get(field, {}).get(value)
+        if username is None:
+            return None
+        user_data = self._load_user_record(username)
+        if user_data is None or user_data.get(field) != value:
+            return None
+        return user_data
+
+    @staticmethod
+    def _file_signature(path: str) -> Optional[Tuple[int, int]]:
+        """文件的 (mtime_ns, size)，用于判断缓存是否仍然有效；文件不存在时返回 None。"""
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _shard_signature(self, username: str) -> Tuple[Optional[Tuple[int, int]], Optional[Tuple[int, int]]]:
+        return (self._file_signature(self._shard_path(username)), self._file_signature(self._journal_path(username)))
+
+    def _read_journal(self, username: str, snapshot_version: int, repair: bool = False) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        读取追加日志中版本号大于快照版本的变更，末尾不完整的行 (写入时崩溃或正在写入) 被忽略。
+        repair=True 时 (调用方必须持有该用户的写锁) 会截掉这段残缺的尾部，以免后续追加的记录与之粘连。
+        返回 (变更列表, 残缺的尾部是否仍留在文件中)。
+        """
+        path = self._journal_path(username)
+        mutations = []
+        good_offset = 0
+        damaged = False
+        try:
+            with open(path, "rb") as f:
+                for raw_line in f:
+                    try:
+                        if not raw_line.endswith(b"\n"):
+                            raise ValueError("incomplete journal line")
+                        mutation = json.loads(raw_line.decode("utf-8"))
+                    except ValueError:
+                        damaged = True
+                        break
+                    good_offset += len(raw_line)
+                    if mutation.get("v", 0) > snapshot_version:
+                        mutations.append(mutation)
+        except FileNotFoundError:
+            return mutations, False
+        if damaged and repair:
+            print(f"[DAO] Truncating damaged journal tail in {path} at byte {good_offset}")
+            with open(path, "r+b") as f:
+                f.truncate(good_offset)
+            damaged = False
+        return mutations, damaged
+
+    def _make_cache_entry(self, username: str, record: Dict[str, Any], journal_entries: int,
+                          positions: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+        return {
+            "signature": self._shard_signature(username),
+            "record": record,
+            "journal_entries": journal_entries,
+            "positions": positions if positions is not None else city_positions(record),
+        }
+
+    def _load_cache_entry(self, username: str, repair: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        读取用户当前状态 = 最近一次快照 + 日志回放。
+        优先使用缓存；快照或日志文件的 mtime/大小变化 (包括其他进程的写入) 会使缓存失效。
+        不加锁的读取如果与写入交错 (读取前后文件签名不一致)，会重新读取，且不把可能过期的结果放入缓存。
+        返回的是缓存中的共享对象，调用方不得修改。
+        """
+        for _ in range(3):
+            signature = self._shard_signature(username)
+            if signature[0] is None:
+                _user_record_cache.invalidate(username)
+                return None
+            cached = _user_record_cache.get(username, is_valid=lambda entry: entry["signature"] == signature)
+            if cached is not None:
+                return cached
+            data = self._read_json_file(self._shard_path(username))
+            if not isinstance(data, dict):
+                return None
+            mutations, damaged = self._read_journal(username, data.get("_version", 0), repair=repair)
+            for mutation in mutations:
+                try:
+                    apply_mutation(data, mutation)
+                except (IndexError, KeyError, ValueError) as e:
+                    print(f"[DAO] Skipping unreplayable journal entry v{mutation.get('v')} for {username}: {e}")
+                data["_version"] = mutation["v"]
+            ensure_trail_stats(data)
+            entry = self._make_cache_entry(username, data, len(mutations))
+            if entry["signature"] == signature or repair:
+                # 日志尾部残缺时不缓存：下一次写入必须重新读取并截掉残缺部分，否则追加的记录会与之粘连而丢失
+                if not damaged:
+                    _user_record_cache.put(username, entry)
+                return entry
+        return entry
+
+    def _load_user_record(self, username: str) -> Optional[Dict[str, Any]]:
+        """读取单个用户的当前状态，返回深拷贝，调用方可以随意修改而不污染缓存。"""
+        entry = self._load_cache_entry(username)
+        return copy.deepcopy(entry["record"]) if entry else None
+
+    def _save_user_record(self, username: str, user_data: Dict[str, Any]):
+        """写入完整快照并丢弃旧日志 (日志中的变更已包含在快照里)。"""
+        with _user_lock(username):
+            entry = self._load_cache_entry(username, repair=True)
+            snapshot = dict(user_data)
+            snapshot["_version"] = max(user_data.get("_version", 0), entry["record"].get("_version", 0) + 1 if entry else 1)
+            try:
+                self._write_json_file(self._shard_path(username), snapshot, indent=None)
+                self._remove_file(self._journal_path(username))
+            except IOError:
+                _user_record_cache.invalidate(username)
+                raise
+            # 写入后直接刷新缓存，下一次读取无需重新解析
+            _user_record_cache.put(username, self._make_cache_entry(username, copy.deepcopy(snapshot), 0))
+            user_data["_version"] = snapshot["_version"]
+
+    @staticmethod
+    def _check_version(username: str, record: Dict[str, Any], expected_version: Optional[int]):
+        """expected_version 不为 None 时做比较-交换：与当前版本不一致则抛出 VersionConflictError。"""
+        current_version = record.get("_version", 0)
+        if expected_version is not None and expected_version != current_version:
+            raise VersionConflictError(username, expected_version, current_version)
+
+    def _append_mutation(self, username: str, mutation: Dict[str, Any], expected_version: Optional[int] = None) -> Tuple[Optional[Dict[str, Any]], Any]:
+        """
+        把一个小的变更记录追加到用户日志，写入量只与变更大小有关。
+        在该用户的写锁内完成 读取-校验版本-应用-追加，并发请求不会互相覆盖。
+        返回 (变更后的记录, 受影响的对象)；用户不存在时返回 (None, None)。
+        变更无效 (如索引越界) 时抛出 IndexError，版本不匹配时抛出 VersionConflictError，日志均不会被写入。
+        """
+        with _user_lock(username):
+            entry = self._load_cache_entry(username, repair=True)
+            if entry is None:
+                return None, None
+            self._check_version(username, entry["record"], expected_version)
+            record = copy.deepcopy(entry["record"])
+            affected = apply_mutation(record, mutation, entry["positions"])
+            version = record.get("_version", 0) + 1
+            record["_version"] = version
+            line = json.dumps(dict(mutation, v=version), ensure_ascii=False) + "\n"
+            journal_path = self._journal_path(username)
+            try:
+                with open(journal_path, "a", encoding="utf-8") as f:
+                    f.write(line)
+                    f.flush()
+                    os.fsync(f.fileno())
+            except Exception as e:
+                _user_record_cache.invalidate(username)
+                print(f"DAO Error: Failed to append to journal {journal_path}: {e}")
+                raise IOError(f"Failed to append to journal {journal_path}: {str(e)}")
+            journal_entries = entry["journal_entries"] + 1
+            # 只有增删城市 (或整体更新) 会改变城市位置，其他变更沿用原来的 id -> 位置索引
+            positions = entry["positions"] if mutation["op"] not in ("add_city", "add_cities", "remove_city", "update") else None
+            _user_record_cache.put(username, self._make_cache_entry(username, record, journal_entries, positions))
+        if journal_entries >= JOURNAL_COMPACT_THRESHOLD:
+            _compactor.schedule(self, username)
+        return copy.deepcopy(record), copy.deepcopy(affected)
+
+    def compact_journal(self, username: str) -> bool:
+        """把日志合并进新快照 (原子替换) 后删除日志。由后台线程调用，也可手动调用。"""
+        with _user_lock(username):
+            if not os.path.exists(self._journal_path(username)):
+                return False
+            entry = self._load_cache_entry(username, repair=True)
+            if entry is None:
+                self._remove_file(self._journal_path(username))
+                return False
+            # 快照中记录已合并到的版本号；如果在删除日志前崩溃，回放时会跳过这些旧记录
+            self._write_json_file(self._shard_path(username), entry["record"], indent=None)
+            self._remove_file(self._journal_path(username))
+            _user_record_cache.put(username, self._make_cache_entry(username, entry["record"], 0, entry["positions"]))
+        return True
+
+    @staticmethod
+    def _remove_file(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _drop_user_record(self, username: str):
+        with _user_lock(username):
+            _user_record_cache.invalidate(username)
+            self._remove_file(self._journal_path(username))
+            self._remove_file(self._shard_path(username))
+
+    def _migrate_legacy_users_file(self):
+        """将旧的单文件 users.json 拆分为每用户一个分片。原文件保留不动，作为备份。"""
+        legacy_users = self._read_json_file(USERS_FILE)
+        manifest = self._empty_manifest()
+        if isinstance(legacy_users, dict):
+            for username, user_data in legacy_users.items():
+                if not isinstance(user_data, dict):
+                    continue
+                ensure_ids(user_data)
+                refresh_trail_stats(user_data)
+                self._save_user_record(username, user_data)
+                manifest["users"][username] = self._shard_filename(username)
+                self._index_user(manifest, username, None, user_data)
+            print(f"[DAO] Migrated {len(manifest['users'])} users from {USERS_FILE} to {USERS_DIR}")
+        self._save_manifest(manifest)
+
+    # --- 对外接口 (与原单文件实现保持一致) ---
+
+    def list_usernames(self) -> List[str]:
+        """返回所有用户名 (只读取 manifest)。"""
+        return list(self._load_manifest()["users"].keys())
 
     def find_user_by_username(self, username: str) -> Optional[Dict[str, Any]]:
         """通过用户名查找用户。"""
-        users = self._load_users_from_file()
-        return users.get(username)
+        return self._load_user_record(username)
 
     def find_user_by_email(self, email: str) -> Optional[Dict[str, Any]]:
-        """通过邮箱查找用户。"""
-        users = self._load_users_from_file()
-        for user_data in users.values():
-            if user_data.get("email") == email:
-                return user_data
-        return None
+        """通过邮箱查找用户 (走 email 二级索引)。"""
+        return self._find_by_index("email", email)
 
-    def save_user(self, user_data_to_save: Dict[str, Any]) -> Dict[str, Any]:
-        """保存新用户或更新现有用户信息 (基于 username 作为 key)。"""
-        users = self._load_users_from_file()
+    def save_user(self, user_data_to_save: Dict[str, Any], overwrite: bool = True) -> Dict[str, Any]:
+        """
+        保存新用户或更新现有用户信息 (基于 username 作为 key)。
+        overwrite=False 时用户已存在则抛出 ValueError (注册时使用，检查与写入在同一把锁内完成)。
+        """
         username = user_data_to_save.get("username")
         if not username:
             raise ValueError("Username is required to save a user.")
         
-        # 原 user_management/main.py 使用 username 作为 users 字典的键
-        users[username] = user_data_to_save
-        self._save_users_to_file(users)
+        ensure_ids(user_data_to_save)
+        refresh_trail_stats(user_data_to_save)  # 调用方传入的记录可能带有过期的统计聚合值
+        with _user_lock(username):
+            old_data = self._load_user_record(username)
+            if old_data is not None and not overwrite:
+                raise ValueError(f"用户名 '{username}' 已存在。")
+            # 唯一性检查、写入记录和更新索引在同一把 manifest 锁内完成，并发注册不会得到重复的邮箱
+            with _manifest_lock:
+                manifest = self._copy_manifest()
+                self._check_unique(manifest, username, user_data_to_save)
+                self._save_user_record(username, user_data_to_save)
+                is_new = username not in manifest["users"]
+                if is_new:
+                    manifest["users"][username] = self._shard_filename(username)
+                if self._index_user(manifest, username, old_data, user_data_to_save) or is_new:
+                    self._save_manifest(manifest)
+            self._notify(TRAIL_REPLACED, username, trail_cities(user_data_to_save))
         # 返回保存的数据，模拟数据库返回包含ID等的情况 (此处username即ID)
         return user_data_to_save 
 
-    def update_user(self, username: str, update_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
-        """更新指定用户名的用户信息。"""
-        users = self._load_users_from_file()
-        if username in users:
-            users[username].update(update_data)
-            self._save_users_to_file(users)
-            return users[username]
-        return None
+    def update_user(self, username: str, update_data: Dict[str, Any], expected_version: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """更新指定用户名的用户信息。以变更记录的形式追加到该用户的日志。"""
+        if "travel_trails" in update_data:
+            # 整体替换轨迹时，先给新城市/照片分配 id 再写入日志，回放结果才是确定的
+            update_data = dict(update_data, travel_trails=copy.deepcopy(update_data["travel_trails"]))
+            ensure_ids(update_data)
+        with _user_lock(username):
+            old_data = self._load_user_record(username)
+            if old_data is None:
+                return None
+            old_indexed = {field: old_data.get(field) for field in SECONDARY_INDEX_FIELDS}
+            if any(field in update_data for field in SECONDARY_INDEX_FIELDS):
+                with _manifest_lock:
+                    manifest = self._copy_manifest()
+                    self._check_unique(manifest, username, update_data)
+                    user_data, _ = self._append_mutation(username, {"op": "update", "data": update_data}, expected_version)
+                    if user_data is None:
+                        return None
+                    if self._index_user(manifest, username, old_indexed, user_data):
+                        self._save_manifest(manifest)
+            else:
+                user_data, _ = self._append_mutation(username, {"op": "update", "data": update_data}, expected_version)
+                if user_data is None:
+                    return None
+            if "travel_trails" in update_data:
+                self._notify(TRAIL_REPLACED, username, trail_cities(user_data))
+        return user_data
 
     def delete_user(self, username: str) -> bool:
         """通过用户名删除用户。"""
-        users = self._load_users_from_file()
-        if username in users:
-            del users[username]
-            self._save_users_to_file(users)
-            return True
-        return False
+        with _user_lock(username):
+            with _manifest_lock:
+                manifest = self._copy_manifest()
+                shard_path = self._shard_path(username)
+                if username not in manifest["users"] and not os.path.exists(shard_path):
+                    return False
+                manifest["users"].pop(username, None)
+                self._index_user(manifest, username, self._load_user_record(username), None)
+                self._save_manifest(manifest)
+            self._drop_user_record(username)
+            self._notify(TRAIL_USER_DELETED, username, [])
+        return True
+
+    def get_user_version(self, username: str) -> Optional[int]:
+        """只读取用户的版本号 (每次变更加一)，用于 ETag；用户不存在时返回 None。"""
+        entry = self._load_cache_entry(username)
+        return entry["record"].get("_version", 0) if entry else None
+
+    def list_cities(self, username: str, offset: int = 0, limit: Optional[int] = None,
+                    fields: Tuple[str, ...] = DEFAULT_CITY_LIST_FIELDS) -> Optional[Tuple[List[Dict[str, Any]], int]]:
+        """
+        分页并按字段投影读取用户的城市列表，返回 (当前页, 城市总数)；用户不存在时返回 None。
+        直接从缓存的记录中取出所需字段，不复制整个用户记录 (照片只在请求 photos 字段时复制)。
+        """
+        entry = self._load_cache_entry(username)
+        if entry is None:
+            return None
+        trails = entry["record"].get("travel_trails") or [{}]
+        cities = trails[0].get("cities") or []
+        return page_cities(cities, offset, limit, fields), len(cities)
+
+    def get_trail_stats(self, username: str) -> Optional[Dict[str, Any]]:
+        """读取记录中增量维护的统计聚合值并整理成统计结果 (带 "_version")，与城市数量无关；用户不存在时返回 None。"""
+        entry = self._load_cache_entry(username)
+        if entry is None:
+            return None
+        record = entry["record"]
+        return dict(summarize_trail_aggregates(record["trail_stats"]), _version=record.get("_version", 0))
+
+    def rebuild_trail_stats(self, username: str) -> Optional[Dict[str, Any]]:
+        """从城市重新计算统计聚合值并写入快照 (一致性修复用)，返回新的统计结果；用户数据版本不变。"""
+        with _user_lock(username):
+            entry = self._load_cache_entry(username, repair=True)
+            if entry is None:
+                return None
+            record = copy.deepcopy(entry["record"])
+            refresh_trail_stats(record)
+            self._write_json_file(self._shard_path(username), record, indent=None)
+            self._remove_file(self._journal_path(username))
+            _user_record_cache.put(username, self._make_cache_entry(username, record, 0, entry["positions"]))
+        return dict(summarize_trail_aggregates(record["trail_stats"]), _version=record.get("_version", 0))
+
+    def list_city_columns(self, username: str, fields: Tuple[str, ...]) -> Optional[Dict[str, List[Any]]]:
+        """按列读取全部城市的标量字段 (如统计用的经纬度)：{字段: [按轨迹顺序的值]}；用户不存在时返回 None。"""
+        entry = self._load_cache_entry(username)
+        if entry is None:
+            return None
+        trails = entry["record"].get("travel_trails") or [{}]
+        cities = trails[0].get("cities") or []
+        return {field: [city.get(field) for city in cities] for field in fields}
+
+    def user_has_photo(self, username: str, ref: str) -> bool:
+        """用户轨迹中是否有引用该内容哈希的照片 (照片接口据此限制只能读取自己轨迹中的照片)。"""
+        columns = self.list_city_columns(username, ("photos",))
+        return columns is not None and ref in photo_refs({"photos": photos} for photos in columns["photos"])
+
+    def list_photo_refs(self) -> Set[str]:
+        """所有用户轨迹中引用的照片内容哈希 (清理未引用照片时的标记阶段)。"""
+        refs: Set[str] = set()
+        for username in self.list_usernames():
+            columns = self.list_city_columns(username, ("photos",))
+            if columns is not None:
+                refs |= photo_refs({"photos": photos} for photos in columns["photos"])
+        return refs
+
+    # --- 旅行轨迹的细粒度变更 (只追加一条小日志记录，而不是重写整个用户) ---
+    # 城市/照片可以按位置 (int) 或稳定 id (str) 定位。
+    # 用户不存在时返回 None；城市/照片索引无效或 id 不存在时抛出 IndexError；
+    # 传入 expected_version 且与当前版本不一致时抛出 VersionConflictError。
+    # 返回的城市带有 "_version"：变更后该用户的版本号 (用于 ETag / If-Match)。
+
+    def _change_city(self, username: str, mutation: Dict[str, Any], expected_version: Optional[int]) -> Optional[Dict[str, Any]]:
+        record, city = self._append_mutation(username, mutation, expected_version)
+        if record is None:
+            return None
+        city["_version"] = record["_version"]
+        return city
+
+    def get_city(self, username: str, city_key: ItemKey) -> Optional[Dict[str, Any]]:
+        """按位置或 id 读取单个城市 (id 经缓存中的 id -> 位置索引 O(1) 定位)；用户不存在时返回 None。"""
+        entry = self._load_cache_entry(username)
+        if entry is None:
+            return None
+        record = entry["record"]
+        trails = record.get("travel_trails") or [{}]
+        cities = trails[0].get("cities") or []
+        if isinstance(city_key, str):
+            position = entry["positions"].get(city_key)
+            if position is None:
+                raise IndexError("城市不存在")
+        else:
+            position = city_key
+            if not (0 <= position < len(cities)):
+                raise IndexError("城市索引无效")
+        city = copy.deepcopy(cities[position])
+        city["_version"] = record.get("_version", 0)
+        return city
+
+    def add_city(self, username: str, city_data: Dict[str, Any], expected_version: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """在用户轨迹末尾追加一个城市 (分配稳定 id)，返回新城市。"""
+        city = dict(city_data, id=city_data.get("id") or new_id())
+        city["photos"] = [dict(photo, id=photo.get("id") or new_id()) for photo in city.get("photos") or []]
+        with _user_lock(username):
+            added = self._change_city(username, {"op": "add_city", "city": city}, expected_version)
+            if added is not None:
+                self._notify(TRAIL_CITIES_ADDED, username, [added])
+        return added
+
+    def add_cities(self, username: str, cities: List[Dict[str, Any]], expected_version: Optional[int] = None) -> Optional[List[Dict[str, Any]]]:
+        """批量追加城市 (导入用)：整批只写一条日志记录，返回新城市列表。"""
+        cities = [
+            dict(city, id=city.get("id") or new_id(),
+                 photos=[dict(photo, id=photo.get("id") or new_id()) for photo in city.get("photos") or []])
+            for city in cities
+        ]
+        with _user_lock(username):
+            _, added = self._append_mutation(username, {"op": "add_cities", "cities": cities}, expected_version)
+            if added is not None:
+                self._notify(TRAIL_CITIES_ADDED, username, added)
+        return added
+
+    def remove_city(self, username: str, city_key: ItemKey, expected_version: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """删除指定位置或 id 的城市，返回被删除的城市。"""
+        with _user_lock(username):
+            removed = self._change_city(username, {"op": "remove_city", **city_key_fields(city_key)}, expected_version)
+            if removed is not None:
+                self._notify(TRAIL_CITY_REMOVED, username, [removed])
+        return removed
+
+    def update_city_blog(self, username: str, city_key: ItemKey, blog: Optional[str], expected_version: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """更新城市博客，返回更新后的城市。"""
+        return self._change_city(username, {"op": "set_city_blog", **city_key_fields(city_key), "blog": blog}, expected_version)
+
+    def add_photo(self, username: str, city_key: ItemKey, photo: Dict[str, Any], expected_version: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """为城市追加一张照片 (分配稳定 id)，返回更新后的城市。"""
+        photo = dict(photo, id=photo.get("id") or new_id())
+        return self._change_city(username, {"op": "add_photo", **city_key_fields(city_key), "photo": photo}, expected_version)
+
+    def remove_photo(self, username: str, city_key: ItemKey, photo_key: ItemKey, expected_version: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """删除城市中的一张照片 (按位置或 id)，返回更新后的城市。"""
+        with _user_lock(username):
+            city = self._change_city(username, {"op": "remove_photo", **city_key_fields(city_key), **photo_key_fields(photo_key)}, expected_version)
+            if city is not None:
+                self._notify(TRAIL_PHOTO_REMOVED, username, [city])
+        return city
+
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """用户记录缓存的命中/未命中统计，用于根据工作集大小调整 USER_CACHE_MAX_ENTRIES。"""
+        return _user_record_cache.stats()
 
     # find_user_by_id 如果需要，可以实现，但当前 users.json 是以 username 为主键
     # def find_user_by_id(self, user_id: str) -> Optional[Dict[str, Any]]:
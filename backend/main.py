@@ -1,6 +1,8 @@
 # backend/main.py
 
 import os # 确保 os 在 dotenv 前导入以避免潜在问题
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 
@@ -26,17 +28,26 @@ from fastapi.middleware.cors import CORSMiddleware
 # 从 presentation_layer 导入路由
 from .presentation_layer.routes import ai_router, user_router, auth_router
 from .presentation_layer.travel_router import router as travel_router
-from .config import CORS_ALLOWED_ORIGINS_STRING # 导入配置
-
-# TODO: 数据库初始化 (如果使用 SQLAlchemy，可以在启动时调用 init_db)
-# from .data_access_layer.models import init_db
-# from .data_access_layer.user_management_dao import USERS_FILE # for creating dummy file
-# import os # for creating dummy file
+from .presentation_layer.geo_router import geo_router
+from .config import CORS_ALLOWED_ORIGINS_STRING, IO_THREAD_POOL_SIZE, CACHE_STATS_ENDPOINT_ENABLED # 导入配置
+from .data_access_layer.dao_factory import get_user_dao
+from .data_access_layer.photo_blob_store import migrate_embedded_photos
+from .data_access_layer.photo_variants import get_photo_variant_service
+from .data_access_layer.photo_gc import get_photo_garbage_collector
+from .data_access_layer.spatial_index import get_spatial_index
+from .data_access_layer.recommendation_cache import get_recommendation_cache
+from .data_access_layer.geocode_cache import get_geocode_cache
+from .data_access_layer.gazetteer import get_gazetteer
+from .business_logic_layer.ai_recommendation_service import AIRecommendationService, warm_geocode_cache
+from .business_logic_layer.geocoding_pipeline import get_nominatim_geocoder
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     print("TravelTrails Backend API 启动中...")
+    # DAO 的阻塞 I/O 通过 asyncio.to_thread 放到默认执行器中运行，这里设置其并发上限
+    io_executor = ThreadPoolExecutor(max_workers=IO_THREAD_POOL_SIZE, thread_name_prefix="io")
+    asyncio.get_running_loop().set_default_executor(io_executor)
     # 尝试创建空的 users.json (如果不存在)，以便 DAO 初始化时不会失败
     # user_json_path = os.path.join(os.path.dirname(__file__), "data_access_layer", "users.json")
     # if not os.path.exists(user_json_path):
@@ -46,12 +57,33 @@ async def lifespan(app: FastAPI):
     #         print(f"Created empty users.json at {user_json_path}")
     #     except Exception as e:
     #         print(f"Could not create users.json: {e}")
-    # init_db() # 数据库初始化
+    # 数据库初始化：按 DATABASE_URI 创建存储后端 (SQLite 建表/迁移并一次性导入已有的 JSON 数据)
+    await asyncio.to_thread(get_user_dao)
+    # 把旧记录中内嵌的 base64 照片迁移到内容寻址的照片存储 (完成后不再重复扫描)
+    await asyncio.to_thread(migrate_embedded_photos, get_user_dao())
+    # 缩略图服务 (进程池在第一次生成时才创建)；Pillow 缺失时在启动日志中警告一次
+    get_photo_variant_service()
+    # 定期清理删除照片/城市/用户后不再被引用的照片文件和缩略图
+    photo_gc_task = asyncio.create_task(get_photo_garbage_collector().run_periodically())
+    # 地理编码缓存：先订阅用户新增城市，再用预定义推荐和已有城市坐标预热
+    geocode_cache = await asyncio.to_thread(get_geocode_cache)
+    get_user_dao().add_listener(geocode_cache.on_trail_change)
+    await asyncio.to_thread(warm_geocode_cache, geocode_cache, get_user_dao())
+    # 离线地名库在启动时加载，第一次推荐和自动补全请求不需要等待读取数据文件
+    await asyncio.to_thread(get_gazetteer)
+    # AI 推荐服务只创建一次，大模型接口和 Nominatim 请求共用一个 HTTP 连接池 (keep-alive / HTTP/2)
+    app.state.ai_recommendation_service = AIRecommendationService()
     
     yield
     
     # Shutdown
     print("TravelTrails Backend API 关闭中...")
+    photo_gc_task.cancel()
+    ai_recommendation_service, app.state.ai_recommendation_service = app.state.ai_recommendation_service, None
+    await ai_recommendation_service.aclose()
+    # 关闭生成缩略图的进程池 (未开始的任务直接取消，下次请求时会重新生成)
+    await asyncio.to_thread(get_photo_variant_service().shutdown)
+    io_executor.shutdown(wait=True)
 
 app = FastAPI(
     title="TravelTrails Backend API",
@@ -81,6 +113,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Total-Count", "ETag", "X-Point-Count", "X-Original-Count", "X-Tolerance-Km"], # 分页总数、版本 ETag、二进制轨迹几何的点数，前端跨域时需要显式暴露
 )
 
 # 包含路由
@@ -88,12 +121,28 @@ app.include_router(ai_router)
 app.include_router(auth_router) # 认证路由，例如 /auth/login, /auth/register
 app.include_router(user_router) # 用户信息路由，例如 /users/me
 app.include_router(travel_router, prefix="/users") # 挂载到 /users/{username}/cities 等
+app.include_router(geo_router) # 空间查询和城市自动补全，例如 /geo/cities?bbox=...、/geo/places/autocomplete?q=...
 
 @app.get("/", tags=["Root"])
 async def read_root():
     """API 根路径，返回欢迎信息。"""    
     return {"message": "欢迎使用 TravelTrails Backend API", "version": app.version}
 
+# 内部统计接口默认不注册 (暴露各子系统的内部状态)，调优时设置 CACHE_STATS_ENDPOINT_ENABLED=true 开启
+if CACHE_STATS_ENDPOINT_ENABLED:
+    @app.get("/internal/cache-stats", tags=["Internal"])
+    async def read_cache_stats():
+        """进程内缓存的命中/未命中统计，用于调整缓存大小。"""
+        return {
+            "user_records": get_user_dao().get_cache_stats(),
+            "spatial_index": get_spatial_index().stats(),
+            "recommendations": get_recommendation_cache().stats(),
+            "geocodes": await asyncio.to_thread(lambda: get_geocode_cache().stats()),
+            "gazetteer": get_gazetteer().stats(),
+            "nominatim": get_nominatim_geocoder().stats(),
+            "photo_gc": get_photo_garbage_collector().stats(),
+        }
+
 # uvicorn backend.main:app --reload --port 8008
 
 # 如果希望直接通过 python backend/main.py 启动 (需要 uvicorn 安装在环境中)
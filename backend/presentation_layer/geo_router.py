@@ -0,0 +1,83 @@
+# backend/presentation_layer/geo_router.py
+# 空间查询接口：地图视野 (bbox) 内的城市、某点附近的城市。
+# 查询走进程内的 geohash 空间索引 (data_access_layer/spatial_index.py)，不遍历用户和城市。
+# 只返回当前用户自己的城市 (与 /users/me 相同，目前通过查询参数 username_param 模拟登录用户)，
+# 不对外暴露其他用户的足迹坐标。
+# 另外提供基于离线地名库 (data_access_layer/gazetteer.py) 的城市名称自动补全。
+
+import asyncio
+from typing import List, Optional, Tuple
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+
+from .schemas import GeoCitySchema, PlaceSuggestionSchema
+from ..config import GEO_QUERY_MAX_RESULTS
+from ..data_access_layer.gazetteer import Gazetteer, get_gazetteer
+from ..data_access_layer.spatial_index import SpatialIndex, get_spatial_index
+
+def get_geo_index():
+    return get_spatial_index()
+
+
+def get_geo_gazetteer():
+    return get_gazetteer()
+
+
+geo_router = APIRouter(
+    prefix="/geo",
+    tags=["Geo"]
+)
+
+
+def parse_bbox(bbox: str) -> Tuple[float, float, float, float]:
+    """"west,south,east,north" (角度制) -> 元组；west > east 表示跨越 180° 经线。"""
+    try:
+        west, south, east, north = (float(value) for value in bbox.split(","))
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="bbox 格式应为 west,south,east,north")
+    if not (-180.0 <= west <= 180.0 and -180.0 <= east <= 180.0 and -90.0 <= south <= north <= 90.0):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="bbox 超出经纬度范围")
+    return west, south, east, north
+
+
+@geo_router.get("/cities", response_model=List[GeoCitySchema])
+async def get_cities_in_bbox(
+    response: Response,
+    bbox: str = Query(..., description="west,south,east,north (角度制)，如 Cesium 视野的 Rectangle 换算成角度"),
+    username_param: str = Query(..., description="当前用户 (只返回该用户的城市)"),
+    limit: int = Query(1000, ge=1, le=GEO_QUERY_MAX_RESULTS),
+    index: SpatialIndex = Depends(get_geo_index),
+):
+    """当前用户视野内已访问的城市 (地球仪只加载可见范围)。X-Total-Count 为范围内的城市总数。"""
+    west, south, east, north = parse_bbox(bbox)
+    # 第一次查询时会构建索引 (读取所有用户)，放到线程池中执行
+    cities, total = await asyncio.to_thread(index.query_bbox, west, south, east, north, username_param, limit)
+    response.headers["X-Total-Count"] = str(total)
+    return cities
+
+
+@geo_router.get("/cities/nearby", response_model=List[GeoCitySchema])
+async def get_cities_nearby(
+    response: Response,
+    lat: float = Query(..., ge=-90.0, le=90.0),
+    lon: float = Query(..., ge=-180.0, le=180.0),
+    radius_km: float = Query(50.0, gt=0, le=20037.5),
+    username_param: str = Query(..., description="当前用户 (只返回该用户的城市)"),
+    limit: int = Query(100, ge=1, le=GEO_QUERY_MAX_RESULTS),
+    index: SpatialIndex = Depends(get_geo_index),
+):
+    """距离 (lat, lon) radius_km 以内当前用户已访问的城市，按距离从近到远。X-Total-Count 为范围内的城市总数。"""
+    cities, total = await asyncio.to_thread(index.query_radius, lat, lon, radius_km, username_param, limit)
+    response.headers["X-Total-Count"] = str(total)
+    return cities
+
+
+@geo_router.get("/places/autocomplete", response_model=List[PlaceSuggestionSchema])
+async def autocomplete_places(
+    q: str = Query(..., min_length=1, max_length=100, description="城市名称前缀 (中文或英文)"),
+    country: Optional[str] = Query(None, description="只返回该国家的城市 (名称或 ISO 代码)"),
+    limit: int = Query(10, ge=1, le=50),
+    gazetteer: Gazetteer = Depends(get_geo_gazetteer),
+):
+    """添加城市时的名称自动补全，返回离线地名库中的城市及其坐标 (不请求在线地理编码)。"""
+    return gazetteer.autocomplete(q, limit=limit, country=country)
@@ -1,12 +1,14 @@
 # backend/presentation_layer/routes.py
 # 此处定义 API 路由，例如使用 Flask 或 FastAPI
 
-from fastapi import APIRouter, HTTPException, Depends, Body, status, Form
+import asyncio
+from fastapi import APIRouter, HTTPException, Depends, Body, status, Form, Request
 from typing import List, Optional
 
 # 从上级目录导入服务和 schemas
 from ..business_logic_layer.ai_recommendation_service import AIRecommendationService
 from ..business_logic_layer.user_management_service import UserManagementService
+from ..data_access_layer.errors import DuplicateEmailError
 from .schemas import (
     VisitedCitiesRequestSchema, 
     RecommendationResponseSchema,
@@ -18,8 +20,12 @@ from .schemas import (
 )
 from ..dependencies import get_current_active_user
 
-def get_ai_recommendation_service():
-    return AIRecommendationService()
+def get_ai_recommendation_service(request: Request) -> AIRecommendationService:
+    """应用启动时 (main.py 的 lifespan) 创建的推荐服务，所有请求共享其 HTTP 连接池。"""
+    service = getattr(request.app.state, "ai_recommendation_service", None)
+    if service is None:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="AI 推荐服务尚未启动")
+    return service
 
 def get_user_management_service():
     return UserManagementService()
@@ -51,6 +57,7 @@ async def get_ai_recommendations(
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
 # --- 用户管理路由 ---
+# UserManagementService 是同步的 (文件/数据库 I/O)，通过 asyncio.to_thread 在线程池中执行，避免阻塞事件循环
 user_router = APIRouter(
     prefix="/users",
     tags=["User Management"]
@@ -68,8 +75,10 @@ async def register_user(
 ):
     """用户注册"""
     try:
-        created_user = service.create_user(user_create_data=user_create)
+        created_user = await asyncio.to_thread(service.create_user, user_create_data=user_create)
         return created_user
+    except DuplicateEmailError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
     except ValueError as ve:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(ve))
     except Exception as e: # 其他意外错误
@@ -84,7 +93,7 @@ async def login_for_access_token(
 ):
     """用户登录，返回 JWT Token。"""
     try:
-        token = service.login_user(username=username, password=password)
+        token = await asyncio.to_thread(service.login_user, username=username, password=password)
         return token
     except ValueError as ve: # Service 层可能抛出 ValueError 表示认证失败或用户问题
         raise HTTPException(
@@ -106,7 +115,7 @@ async def read_current_user(
     service: UserManagementService = Depends(get_user_management_service)
 ):
     """获取当前登录用户的信息。 (目前通过查询参数username模拟)"""
-    user = service.get_user_by_username(username_param)
+    user = await asyncio.to_thread(service.get_user_by_username, username_param)
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="用户未找到。")
     return user
@@ -119,10 +128,12 @@ async def update_current_user(
 ):
     """更新当前登录用户的信息。 (目前通过查询参数username模拟)"""
     try:
-        updated_user = service.update_user_profile(username=username_param, user_update_data=user_update)
+        updated_user = await asyncio.to_thread(service.update_user_profile, username=username_param, user_update_data=user_update)
         if not updated_user:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="用户未找到或更新失败。")
         return updated_user
+    except DuplicateEmailError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
     except ValueError as ve: # Service 层可能因数据问题抛出 ValueError
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(ve))
     except Exception as e:
@@ -135,7 +146,7 @@ async def delete_current_user(
     service: UserManagementService = Depends(get_user_management_service)
 ):
     """删除当前登录用户。 (目前通过查询参数username模拟)"""
-    success = service.delete_user_by_username(username_param)
+    success = await asyncio.to_thread(service.delete_user_by_username, username_param)
     if not success:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="用户未找到或删除失败。")
     return # 返回 204 No Content
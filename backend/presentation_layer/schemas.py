@@ -2,7 +2,7 @@
 # 此文件用于定义 API 请求和响应的数据模型 (Pydantic Schemas)
 
 from pydantic import BaseModel, EmailStr, HttpUrl
-from typing import Optional, List, Dict
+from typing import Any, Optional, List, Dict
 from datetime import datetime
 
 # --- AI Recommendation Schemas (from AI_rmd.py) ---
@@ -48,9 +48,15 @@ class TokenSchema(BaseModel):
 
 # --- Travel Trail Schemas (from user_models.py - 初始定义，可能需要调整) ---
 class PhotoSchema(BaseModel):
-    data: str  # Base64编码的图片数据
+    id: Optional[str] = None  # 稳定 id，用于按 id 删除照片
+    ref: Optional[str] = None  # 照片存储中的内容哈希 (SHA-256)
+    content_type: Optional[str] = None
+    size: Optional[int] = None
+    data: Optional[str] = None  # 旧数据：内嵌的 Base64 图片，迁移后为空
+    url: Optional[str] = None  # 照片下载地址 (GET /users/{username}/photos/{ref})，仅出现在响应中
 
 class CitySchema(BaseModel):
+    id: Optional[str] = None  # 稳定 id，见 /users/{username}/cities/id/{city_id} 系列路由
     city: str
     country: str
     latitude: float
@@ -60,6 +66,20 @@ class CitySchema(BaseModel):
     blog: Optional[str] = None
     visit_date: Optional[datetime] = None
 
+class CityListItemSchema(BaseModel):
+    """城市列表中的一项：只包含 fields= 请求的字段 (未请求的字段不会出现在响应中)。"""
+    index: int  # 城市在轨迹中的位置，用于后续按索引修改/删除
+    id: Optional[str] = None  # 城市的稳定 id (推荐使用)
+    city: Optional[str] = None
+    country: Optional[str] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    transport_mode: Optional[str] = None
+    visit_date: Optional[datetime] = None
+    blog: Optional[str] = None
+    photos: Optional[List[PhotoSchema]] = None
+    photo_count: Optional[int] = None
+
 class TravelTrailSchema(BaseModel):
     cities: List[CitySchema] = []
 
@@ -75,4 +95,79 @@ class CityCreateSchema(BaseModel):
     transport_mode: Optional[str] = None
 
 class CityUpdateSchema(BaseModel):
-    blog: Optional[str] = None 
\ No newline at end of file
+    blog: Optional[str] = None 
+
+# 批量导入 (POST /users/{username}/cities/import) 的任务进度/结果
+class ImportErrorSchema(BaseModel):
+    record: int  # 第几条记录 (从 1 开始，GeoJSON 线要素的每个顶点各算一条)
+    error: str
+
+class ImportJobSchema(BaseModel):
+    job_id: str
+    format: Optional[str] = None  # gpx / geojson / ndjson
+    status: str  # running / completed / failed
+    bytes_received: int = 0
+    imported: int = 0
+    rejected: int = 0
+    batches: int = 0
+    errors: List[ImportErrorSchema] = []  # 只包含前若干条被拒绝记录的原因
+    error: Optional[str] = None  # 导入中止的原因 (status 为 failed 时)
+    started_at: float
+    finished_at: Optional[float] = None
+
+
+# 旅行统计 (GET /users/{username}/stats)
+class TransportModeStatsSchema(BaseModel):
+    cities: int  # 使用该交通方式到达的城市数
+    segments: int  # 计入距离的路段数
+    distance_km: float
+
+class TrailStatsSchema(BaseModel):
+    city_count: int  # 访问次数 (轨迹中的城市数)
+    unique_city_count: int
+    country_count: int
+    total_distance_km: float
+    countries: Dict[str, int] = {}  # 国家 -> 访问次数
+    transport_modes: Dict[str, TransportModeStatsSchema] = {}
+    by_year: Dict[str, int] = {}  # "2024" -> 访问次数
+    by_month: Dict[str, int] = {}  # "2024-05" -> 访问次数
+    first_visit_month: Optional[str] = None
+    last_visit_month: Optional[str] = None
+
+class TrailStatsConsistencySchema(BaseModel):
+    consistent: bool
+    version: int  # 比较时的用户数据版本
+    differences: Dict[str, Dict[str, Any]] = {}  # 字段 -> {"stored": 增量维护的值, "computed": 重新计算的值}
+
+
+# 简化后的轨迹折线 (GET /users/{username}/trail/geometry?format=polyline)
+class TrailGeometrySchema(BaseModel):
+    version: int  # 用户数据版本
+    tolerance_km: float  # 简化容差，0 表示不简化
+    original_count: int  # 有坐标的城市数
+    point_count: int  # 简化后的点数
+    indices: List[int] = []  # 保留的点在城市列表中的位置
+    precision: int = 5  # 编码折线的坐标精度 (小数位数)
+    polyline: str  # Google Encoded Polyline (纬度, 经度)
+
+# 空间查询 (GET /geo/cities, /geo/cities/nearby) 返回的城市 (只包含当前用户的城市)
+class GeoCitySchema(BaseModel):
+    username: str
+    id: str  # 城市的稳定 id
+    city: Optional[str] = None
+    country: Optional[str] = None
+    latitude: float
+    longitude: float
+    distance_km: Optional[float] = None  # 只有半径查询返回，到查询中心的距离
+
+
+class PlaceSuggestionSchema(BaseModel):
+    city: str  # 与输入相同语言的名称 (输入中文时为中文名)
+    country: str
+    city_en: str
+    city_zh: str
+    country_en: str
+    country_zh: str
+    country_code: str
+    latitude: float
+    longitude: float
@@ -1,20 +1,50 @@
-from fastapi import APIRouter, HTTPException, Form, status, Depends
-from typing import List
+import asyncio
+import hashlib
+from urllib.parse import quote
+from fastapi import APIRouter, HTTPException, File, Form, Header, Query, Request, Response, UploadFile, status, Depends
+from fastapi.responses import StreamingResponse
+from typing import Awaitable, List, Optional, Tuple
 
 # 使用新的 schemas
 from .schemas import CitySchema as City # Renamed from user_models
+from .schemas import CityListItemSchema
 from .schemas import CityCreateSchema as CityCreate
 from .schemas import CityUpdateSchema as CityUpdate
 from .schemas import PhotoSchema # For photo data
+from .schemas import ImportJobSchema
+from .schemas import TrailGeometrySchema, TrailStatsConsistencySchema, TrailStatsSchema
+from .utils import cached_file_response, etag_matches
 
-# 导入 UserManagementDAO (暂时直接使用，理想情况下应通过服务层)
+# 导入用户 DAO (暂时直接使用，理想情况下应通过服务层)
 # 或者依赖一个 get_user_management_service
 from ..business_logic_layer.user_management_service import UserManagementService
-from ..data_access_layer.user_management_dao import UserManagementDAO # Direct DAO for now
+from ..business_logic_layer.trail_export_service import EXPORT_CITY_FIELDS, iter_ndjson_archive, iter_zip_archive
+from ..business_logic_layer.trail_geometry import POLYLINE_PRECISION, TrailGeometryService, get_trail_geometry_service, zoom_tolerance_km
+from ..business_logic_layer.trail_statistics import STATS_CITY_FIELDS, compute_trail_statistics, diff_trail_statistics
+from ..business_logic_layer.trail_import_service import ImportFormatError, ImportJobConflictError, TrailImportService, get_trail_import_service, resolve_import_format
+from ..data_access_layer.async_user_dao import AsyncUserDAO # Direct DAO for now
+from ..data_access_layer.dao_factory import get_async_user_dao
+from ..data_access_layer.trail_ops import CITY_LIST_FIELDS, DEFAULT_CITY_LIST_FIELDS, ItemKey, ensure_cities
+from ..config import MAX_PHOTO_UPLOAD_BYTES
+from ..data_access_layer.errors import PhotoTooLargeError, VersionConflictError
+from ..data_access_layer.photo_blob_store import PhotoBlobStore, UPLOAD_CHUNK_SIZE, get_photo_blob_store, is_valid_ref
+from ..data_access_layer.photo_variants import PhotoVariantService, VARIANT_CONTENT_TYPE, VARIANT_SIZES, get_photo_variant_service
 
 # 依赖注入函数
 def get_user_management_dao(): # Temporary direct DAO access
-    return UserManagementDAO()
+    return get_async_user_dao() # JSON 或 SQLite (由 DATABASE_URI 决定)，I/O 在线程池中执行
+
+def get_photo_store():
+    return get_photo_blob_store()
+
+def get_photo_variants():
+    return get_photo_variant_service()
+
+def get_trail_importer():
+    return get_trail_import_service()
+
+def get_trail_geometry():
+    return get_trail_geometry_service()
 
 def get_user_management_service(): # For consistency, though some direct DAO calls remain for now
     return UserManagementService()
@@ -30,91 +60,400 @@ router = APIRouter(
 # 注意：直接在路由中使用 DAO 违反了严格的分层，这是一个临时的迁移步骤。
 # 理想情况下，所有数据操作都应通过服务层。
 
-def verify_and_get_user_for_travel(username: str, dao: UserManagementDAO = Depends(get_user_management_dao)):
-    user = dao.find_user_by_username(username)
+async def verify_and_get_user_for_travel(username: str, dao: AsyncUserDAO = Depends(get_user_management_dao)):
+    user = await dao.find_user_by_username(username)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="用户不存在"
         )
     # 初始化 travel_trails 和 cities 如果它们不存在 (在DAO返回的字典上操作)
-    if "travel_trails" not in user or not user["travel_trails"]:
-        user["travel_trails"] = [{"cities": []}]
-    elif "cities" not in user["travel_trails"][0]:
-        user["travel_trails"][0]["cities"] = []
+    ensure_cities(user)
     return user
 
+def get_expected_version(if_match: Optional[str] = Header(None)) -> Optional[int]:
+    """
+    从 If-Match 请求头解析客户端基于的记录版本 (如 "12" 或 "12-xxxx")，用于乐观并发控制。
+    未提供或为 * 时不做版本校验。
+    """
+    if if_match is None or if_match.strip() == "*":
+        return None
+    value = if_match.strip()
+    if value.startswith("W/"):
+        value = value[2:]
+    value = value.strip('"').split("-", 1)[0]
+    if not value.isdigit():
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="If-Match 请求头格式无效")
+    return int(value)
+
+def parse_city_fields(fields: Optional[str] = Query(None, description="逗号分隔的字段列表，如 city,country,latitude,longitude；all 返回全部字段")) -> Tuple[str, ...]:
+    """解析城市列表的 fields= 投影参数；默认不返回照片和博客正文。"""
+    if fields is None:
+        return DEFAULT_CITY_LIST_FIELDS
+    if fields.strip() in ("all", "*"):
+        return CITY_LIST_FIELDS
+    requested = tuple(dict.fromkeys(field.strip() for field in fields.split(",") if field.strip()))
+    unknown = [field for field in requested if field not in CITY_LIST_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"未知字段: {', '.join(unknown)}；可选字段: {', '.join(CITY_LIST_FIELDS)}")
+    return requested
+
+def make_etag(version: int, *variant) -> str:
+    """
+    ETag = 用户版本号 (每次变更加一)，同一资源的不同表示 (分页/投影参数) 再附加参数的短哈希。
+    版本号写在最前面，客户端可以直接把它放进 If-Match。
+    """
+    if not variant:
+        return f'"{version}"'
+    digest = hashlib.sha1(repr(variant).encode("utf-8")).hexdigest()[:10]
+    return f'"{version}-{digest}"'
+
+def with_photo_urls(request: Request, username: str, city: dict) -> dict:
+    """给城市中的照片加上 url 字段 (照片单独下载，浏览器可以按 URL 长期缓存)。"""
+    for photo in city.get("photos") or []:
+        if photo.get("ref"):
+            photo["url"] = request.app.url_path_for("get_photo_route", username=username, photo_ref=photo["ref"])
+    return city
+
+async def apply_city_change(change: Awaitable, response: Optional[Response] = None):
+    """
+    DAO 变更结果的统一处理：用户不存在 -> 404；城市/照片索引无效 -> 404；
+    If-Match 中的版本已过期 (期间有其他修改) -> 412。
+    传入 response 时把变更后的用户版本作为 ETag 返回，客户端可用于下一次 If-Match。
+    """
+    try:
+        result = await change
+    except IndexError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except VersionConflictError as e:
+        raise HTTPException(status_code=status.HTTP_412_PRECONDITION_FAILED, detail=str(e))
+    if result is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="用户不存在")
+    if response is not None and "_version" in result:
+        response.headers["ETag"] = make_etag(result["_version"])
+    return result
+
+async def receive_photo(file: Optional[UploadFile], photo_data: Optional[str], photo_store: PhotoBlobStore) -> PhotoSchema:
+    """
+    两种提交方式：multipart 文件 (file，推荐，流式写入) 或 base64 字符串 (data，兼容旧前端)。
+    照片内容存入照片存储 (相同内容自动去重)，城市记录中只保存引用。
+    """
+    if file is not None:
+        return PhotoSchema(**await store_uploaded_photo(file, photo_store))
+    if photo_data is not None:
+        try:
+            return PhotoSchema(**await asyncio.to_thread(photo_store.put_base64, photo_data, MAX_PHOTO_UPLOAD_BYTES))
+        except PhotoTooLargeError as e:
+            raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="请上传照片文件 (file) 或 base64 照片数据 (data)")
+
+async def add_photo_to_city(username: str, city_key: ItemKey, request: Request, response: Response, file: Optional[UploadFile], photo_data: Optional[str],
+                            dao: AsyncUserDAO, photo_store: PhotoBlobStore, photo_variants: PhotoVariantService, expected_version: Optional[int]) -> City:
+    """按位置和按 id 的上传路由共用的实现。"""
+    new_photo = await receive_photo(file, photo_data, photo_store)
+    city = await apply_city_change(dao.add_photo(username, city_key, new_photo.dict(exclude_none=True), expected_version), response)
+    # 缩略图和中等尺寸版本在进程池中预先生成，画廊请求时直接读取缓存文件
+    photo_variants.schedule(new_photo.ref)
+    return City(**with_photo_urls(request, username, city))
+
+async def store_uploaded_photo(upload: UploadFile, photo_store: PhotoBlobStore) -> dict:
+    """把 multipart 上传的照片分块写入照片存储，内存中只保留一个块；超过大小上限 -> 413。"""
+    writer = await asyncio.to_thread(photo_store.open_writer, MAX_PHOTO_UPLOAD_BYTES)
+    try:
+        while True:
+            chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            await asyncio.to_thread(writer.write, chunk)
+        return await asyncio.to_thread(writer.commit, upload.content_type)
+    except PhotoTooLargeError as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+    except BaseException:
+        await asyncio.to_thread(writer.abort)
+        raise
+    finally:
+        await upload.close()
+
 # --- Travel Routes ---
 
-@router.get("/{username}/cities", response_model=List[City])
-async def get_user_cities_route(username: str, dao: UserManagementDAO = Depends(get_user_management_dao)):
-    user = verify_and_get_user_for_travel(username, dao)
-    return user["travel_trails"][0]["cities"]
+@router.get("/{username}/cities", response_model=List[CityListItemSchema], response_model_exclude_unset=True)
+async def get_user_cities_route(
+    username: str,
+    request: Request,
+    response: Response,
+    offset: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="每页城市数，不传则返回 offset 之后的全部城市"),
+    fields: Tuple[str, ...] = Depends(parse_city_fields),
+    if_none_match: Optional[str] = Header(None),
+    dao: AsyncUserDAO = Depends(get_user_management_dao),
+):
+    """
+    分页、按字段投影的城市列表；城市总数在 X-Total-Count 响应头中。
+    带 ETag (用户版本号)，If-None-Match 命中时返回 304，不读取也不序列化城市列表。
+    """
+    version = await dao.get_user_version(username)
+    if version is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="用户不存在")
+    # 先取版本再读列表：期间如有新的变更，ETag 只会偏旧，下次请求会重新获取，不会把旧数据当成新的
+    etag = make_etag(version, offset, limit, fields)
+    cache_headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=cache_headers)
+    result = await dao.list_cities(username, offset, limit, fields)
+    if result is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="用户不存在")
+    cities, total = result
+    if "photos" in fields:
+        for city in cities:
+            with_photo_urls(request, username, city)
+    response.headers.update(cache_headers)
+    response.headers["X-Total-Count"] = str(total)
+    return cities
 
 @router.post("/{username}/cities", response_model=City, status_code=status.HTTP_201_CREATED)
-async def add_city_route(username: str, city_create: CityCreate, dao: UserManagementDAO = Depends(get_user_management_dao)):
-    user = verify_and_get_user_for_travel(username, dao)
-    
+async def add_city_route(username: str, city_create: CityCreate, request: Request, response: Response, dao: AsyncUserDAO = Depends(get_user_management_dao), expected_version: Optional[int] = Depends(get_expected_version)):
     new_city_data = city_create.dict()
     # Ensure photos and blog are initialized if not present in CityCreate schema
     new_city_data.setdefault("photos", [])
     new_city_data.setdefault("blog", "")
     
     # FastAPI/Pydantic 会自动校验 CityCreate，这里直接用
-    user["travel_trails"][0]["cities"].append(new_city_data)
-    dao.update_user(username, {"travel_trails": user["travel_trails"]}) # Save entire user object
+    # DAO 只追加一条变更记录，而不是重写整个用户
+    city = await apply_city_change(dao.add_city(username, new_city_data, expected_version), response)
     # 返回创建的城市数据，确保它符合City schema
-    return City(**new_city_data)
+    return City(**with_photo_urls(request, username, city))
 
 
 @router.delete("/{username}/cities/{city_index}", status_code=status.HTTP_204_NO_CONTENT)
-async def remove_city_route(username: str, city_index: int, dao: UserManagementDAO = Depends(get_user_management_dao)):
-    user = verify_and_get_user_for_travel(username, dao)
-    cities = user["travel_trails"][0]["cities"]
-    if not (0 <= city_index < len(cities)):
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="城市索引无效")
-    cities.pop(city_index)
-    dao.update_user(username, {"travel_trails": user["travel_trails"]})
+async def remove_city_route(username: str, city_index: int, response: Response, dao: AsyncUserDAO = Depends(get_user_management_dao), expected_version: Optional[int] = Depends(get_expected_version)):
+    await apply_city_change(dao.remove_city(username, city_index, expected_version), response)
     return
 
 @router.put("/{username}/cities/{city_index}/blog", response_model=City)
-async def update_city_blog_route(username: str, city_index: int, city_update: CityUpdate, dao: UserManagementDAO = Depends(get_user_management_dao)):
-    user = verify_and_get_user_for_travel(username, dao)
-    cities = user["travel_trails"][0]["cities"]
-    if not (0 <= city_index < len(cities)):
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="城市索引无效")
-    cities[city_index]["blog"] = city_update.blog
-    dao.update_user(username, {"travel_trails": user["travel_trails"]})
-    return City(**cities[city_index])
+async def update_city_blog_route(username: str, city_index: int, city_update: CityUpdate, request: Request, response: Response, dao: AsyncUserDAO = Depends(get_user_management_dao), expected_version: Optional[int] = Depends(get_expected_version)):
+    city = await apply_city_change(dao.update_city_blog(username, city_index, city_update.blog, expected_version), response)
+    return City(**with_photo_urls(request, username, city))
 
 @router.post("/{username}/cities/{city_index}/photos", response_model=City, status_code=status.HTTP_201_CREATED)
-async def add_photo_to_city_route(username: str, city_index: int, photo_data: str = Form(..., alias="data"), dao: UserManagementDAO = Depends(get_user_management_dao)):
-    user = verify_and_get_user_for_travel(username, dao)
-    cities = user["travel_trails"][0]["cities"]
-    if not (0 <= city_index < len(cities)):
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="城市索引无效")
-    
-    # 确保 photos 列表存在
-    if "photos" not in cities[city_index] or cities[city_index]["photos"] is None:
-        cities[city_index]["photos"] = []
-        
-    # photo_data is base64 string for the photo
-    new_photo = PhotoSchema(data=photo_data)
-    cities[city_index]["photos"].append(new_photo.dict())
-    dao.update_user(username, {"travel_trails": user["travel_trails"]})
-    return City(**cities[city_index])
+async def add_photo_to_city_route(username: str, city_index: int, request: Request, response: Response, file: Optional[UploadFile] = File(None), photo_data: Optional[str] = Form(None, alias="data"), dao: AsyncUserDAO = Depends(get_user_management_dao), photo_store: PhotoBlobStore = Depends(get_photo_store), photo_variants: PhotoVariantService = Depends(get_photo_variants), expected_version: Optional[int] = Depends(get_expected_version)):
+    return await add_photo_to_city(username, city_index, request, response, file, photo_data, dao, photo_store, photo_variants, expected_version)
 
 @router.delete("/{username}/cities/{city_index}/photos/{photo_index}", status_code=status.HTTP_204_NO_CONTENT)
-async def remove_photo_from_city_route(username: str, city_index: int, photo_index: int, dao: UserManagementDAO = Depends(get_user_management_dao)):
-    user = verify_and_get_user_for_travel(username, dao)
-    cities = user["travel_trails"][0]["cities"]
-    if not (0 <= city_index < len(cities)):
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="城市索引无效")
-    
-    photos = cities[city_index].get("photos", [])
-    if not photos or not (0 <= photo_index < len(photos)):
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="照片索引无效")
-        
-    photos.pop(photo_index)
-    dao.update_user(username, {"travel_trails": user["travel_trails"]})
-    return 
\ No newline at end of file
+async def remove_photo_from_city_route(username: str, city_index: int, photo_index: int, response: Response, dao: AsyncUserDAO = Depends(get_user_management_dao), expected_version: Optional[int] = Depends(get_expected_version)):
+    await apply_city_change(dao.remove_photo(username, city_index, photo_index, expected_version), response)
+    return
+
+# --- 按稳定 id 定位的路由 (不受其他客户端并发增删导致的位置变化影响，推荐使用) ---
+
+@router.get("/{username}/cities/id/{city_id}", response_model=City)
+async def get_city_by_id_route(username: str, city_id: str, request: Request, response: Response, if_none_match: Optional[str] = Header(None), dao: AsyncUserDAO = Depends(get_user_management_dao)):
+    """读取单个城市 (含博客和照片引用)，只读取该城市，不加载整个轨迹列表。"""
+    city = await apply_city_change(dao.get_city(username, city_id))
+    etag = make_etag(city["_version"], "city", city_id)
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    response.headers.update({"ETag": etag, "Cache-Control": "no-cache"})
+    return City(**with_photo_urls(request, username, city))
+
+@router.delete("/{username}/cities/id/{city_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def remove_city_by_id_route(username: str, city_id: str, response: Response, dao: AsyncUserDAO = Depends(get_user_management_dao), expected_version: Optional[int] = Depends(get_expected_version)):
+    await apply_city_change(dao.remove_city(username, city_id, expected_version), response)
+    return
+
+@router.put("/{username}/cities/id/{city_id}/blog", response_model=City)
+async def update_city_blog_by_id_route(username: str, city_id: str, city_update: CityUpdate, request: Request, response: Response, dao: AsyncUserDAO = Depends(get_user_management_dao), expected_version: Optional[int] = Depends(get_expected_version)):
+    city = await apply_city_change(dao.update_city_blog(username, city_id, city_update.blog, expected_version), response)
+    return City(**with_photo_urls(request, username, city))
+
+@router.post("/{username}/cities/id/{city_id}/photos", response_model=City, status_code=status.HTTP_201_CREATED)
+async def add_photo_to_city_by_id_route(username: str, city_id: str, request: Request, response: Response, file: Optional[UploadFile] = File(None), photo_data: Optional[str] = Form(None, alias="data"), dao: AsyncUserDAO = Depends(get_user_management_dao), photo_store: PhotoBlobStore = Depends(get_photo_store), photo_variants: PhotoVariantService = Depends(get_photo_variants), expected_version: Optional[int] = Depends(get_expected_version)):
+    return await add_photo_to_city(username, city_id, request, response, file, photo_data, dao, photo_store, photo_variants, expected_version)
+
+@router.delete("/{username}/cities/id/{city_id}/photos/{photo_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def remove_photo_by_id_route(username: str, city_id: str, photo_id: str, response: Response, dao: AsyncUserDAO = Depends(get_user_management_dao), expected_version: Optional[int] = Depends(get_expected_version)):
+    await apply_city_change(dao.remove_photo(username, city_id, photo_id, expected_version), response)
+    return
+
+# --- 统计 ---
+
+@router.get("/{username}/stats", response_model=TrailStatsSchema)
+async def get_trail_stats_route(username: str, response: Response, if_none_match: Optional[str] = Header(None), dao: AsyncUserDAO = Depends(get_user_management_dao)):
+    """
+    旅行统计：总距离、国家/城市数、按交通方式的距离和次数、按年/月的访问次数。
+    直接读取随城市增删增量维护的聚合值，不遍历城市；带 ETag，数据未变化时返回 304。
+    """
+    version = await dao.get_user_version(username)
+    if version is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="用户不存在")
+    etag = make_etag(version, "stats")
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    stats = await dao.get_trail_stats(username)
+    if stats is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="用户不存在")
+    response.headers["ETag"] = make_etag(stats.pop("_version"), "stats")
+    response.headers["Cache-Control"] = "no-cache"
+    return stats
+
+@router.get("/{username}/stats/consistency", response_model=TrailStatsConsistencySchema)
+async def check_trail_stats_route(username: str, dao: AsyncUserDAO = Depends(get_user_management_dao)):
+    """一致性检查：用统计引擎从城市重新计算，与增量维护的聚合值比较 (不修改数据，修复见 POST .../stats/rebuild)。"""
+    for _ in range(3):
+        stored = await dao.get_trail_stats(username)
+        columns = await dao.list_city_columns(username, STATS_CITY_FIELDS)
+        if stored is None or columns is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="用户不存在")
+        # 两次读取之间版本未变，说明聚合值和城市列是同一时刻的数据
+        if await dao.get_user_version(username) == stored["_version"]:
+            break
+    else:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="数据正在被修改，请稍后重试")
+    computed = await asyncio.to_thread(compute_trail_statistics, columns)
+    differences = diff_trail_statistics(stored, computed)
+    return {"consistent": not differences, "version": stored["_version"], "differences": differences}
+
+@router.post("/{username}/stats/rebuild", response_model=TrailStatsSchema)
+async def rebuild_trail_stats_route(username: str, response: Response, dao: AsyncUserDAO = Depends(get_user_management_dao)):
+    """从城市重新计算并保存该用户的统计聚合值。"""
+    stats = await dao.rebuild_trail_stats(username)
+    if stats is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="用户不存在")
+    response.headers["ETag"] = make_etag(stats.pop("_version"), "stats")
+    return stats
+
+# --- 地图轨迹几何 ---
+
+@router.get("/{username}/trail/geometry", response_model=TrailGeometrySchema)
+async def get_trail_geometry_route(
+    username: str,
+    response: Response,
+    zoom: Optional[float] = Query(None, ge=0, le=24, description="地图缩放级别，换算成 1 像素的简化容差"),
+    tolerance_km: Optional[float] = Query(None, ge=0, description="简化容差 (km)，优先于 zoom；都不传则不简化"),
+    geometry_format: str = Query("polyline", alias="format", pattern="^(polyline|f32)$", description="polyline (JSON 编码折线) 或 f32 (二进制 Float32 [经度, 纬度] 数组)"),
+    if_none_match: Optional[str] = Header(None),
+    dao: AsyncUserDAO = Depends(get_user_management_dao),
+    geometry: TrailGeometryService = Depends(get_trail_geometry),
+):
+    """
+    按缩放级别简化的轨迹折线 (球面 Douglas-Peucker)，地图画线时代替完整的城市列表。
+    简化结果按用户版本缓存；带 ETag，数据未变化时返回 304。
+    """
+    if tolerance_km is None:
+        tolerance_km = zoom_tolerance_km(zoom) if zoom is not None else 0.0
+    tolerance_km = float(f"{tolerance_km:.4g}")  # 相近的容差共用缓存
+    version = await dao.get_user_version(username)
+    if version is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="用户不存在")
+    etag = make_etag(version, "geometry", geometry_format, tolerance_km)
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    result = await geometry.get_geometry(username, version, tolerance_km, geometry_format)
+    if result is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="用户不存在")
+    headers = {"ETag": make_etag(result["version"], "geometry", geometry_format, tolerance_km), "Cache-Control": "no-cache"}
+    if geometry_format == "f32":
+        headers.update({
+            "X-Point-Count": str(result["point_count"]),
+            "X-Original-Count": str(result["original_count"]),
+            "X-Tolerance-Km": str(tolerance_km),
+        })
+        return Response(content=result["data"], media_type="application/octet-stream", headers=headers)
+    response.headers.update(headers)
+    body = {field: result[field] for field in ("version", "tolerance_km", "original_count", "point_count", "indices")}
+    return dict(body, precision=POLYLINE_PRECISION, polyline=result["data"])
+
+# --- 批量导入 ---
+
+@router.post("/{username}/cities/import", response_model=ImportJobSchema)
+async def import_cities_route(
+    username: str,
+    request: Request,
+    import_format: Optional[str] = Query(None, alias="format", description="gpx / geojson / ndjson，不传则按 Content-Type 或文件内容判断"),
+    job_id: Optional[str] = Query(None, pattern=r"^[A-Za-z0-9_-]{1,64}$", description="客户端指定的任务 id，上传过程中可用它查询进度"),
+    dao: AsyncUserDAO = Depends(get_user_management_dao),
+    importer: TrailImportService = Depends(get_trail_importer),
+):
+    """
+    把请求体 (GPX / GeoJSON FeatureCollection / NDJSON) 中的点流式导入为城市，追加到轨迹末尾。
+    边接收边解析、逐条校验，每 IMPORT_BATCH_SIZE 条写入一次；无效记录跳过并计入 rejected。
+    输入无法解析时返回 400，此前已写入的批次保留 (见进度接口中的 imported)。
+    """
+    if await dao.get_user_version(username) is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="用户不存在")
+    try:
+        import_format = resolve_import_format(import_format, request.headers.get("content-type"))
+        return await importer.import_stream(username, request.stream(), import_format, job_id)
+    except ImportFormatError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except LookupError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except ImportJobConflictError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+
+@router.get("/{username}/cities/import/{job_id}", response_model=ImportJobSchema)
+async def get_import_job_route(username: str, job_id: str, importer: TrailImportService = Depends(get_trail_importer)):
+    """导入进度：已接收字节数、已导入/拒绝的记录数。"""
+    job = importer.jobs.get(username, job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="导入任务不存在")
+    return job
+
+# --- 导出 ---
+
+@router.get("/{username}/export")
+async def export_trail_route(
+    username: str,
+    export_format: str = Query("zip", alias="format", pattern="^(zip|ndjson)$", description="zip (GeoJSON + 博客文本 + 照片文件) 或 ndjson"),
+    dao: AsyncUserDAO = Depends(get_user_management_dao),
+    photo_store: PhotoBlobStore = Depends(get_photo_store),
+):
+    """
+    流式导出用户的完整轨迹存档。只预先读取城市列表 (照片只有引用)，
+    照片在发送时逐个分块读取，响应立即开始，不会把整个存档或多张照片放进内存。
+    """
+    version = await dao.get_user_version(username)
+    result = await dao.list_cities(username, 0, None, EXPORT_CITY_FIELDS)
+    if version is None or result is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="用户不存在")
+    cities, _ = result
+    if export_format == "zip":
+        body, media_type = iter_zip_archive(username, version, cities, photo_store), "application/zip"
+    else:
+        body, media_type = iter_ndjson_archive(username, version, cities, photo_store), "application/x-ndjson"
+    file_name = quote(f"{username}-trail.{export_format}")
+    headers = {
+        "Content-Disposition": f"attachment; filename=\"trail.{export_format}\"; filename*=UTF-8''{file_name}",
+        "Cache-Control": "no-store",
+    }
+    # 同步生成器由 StreamingResponse 放到线程池中迭代，读取照片文件不会阻塞事件循环
+    return StreamingResponse(body, media_type=media_type, headers=headers)
+
+# 照片按内容哈希寻址，同一个 URL 的内容永远不变，浏览器可以缓存一年且无需重新验证 (immutable)；
+# private：只允许浏览器缓存，照片或用户被删除后共享缓存 (CDN/代理) 不会继续对其他人提供
+PHOTO_CACHE_CONTROL = "private, max-age=31536000, immutable"
+
+@router.get("/{username}/photos/{photo_ref}")
+async def get_photo_route(username: str, photo_ref: str, request: Request, size: Optional[str] = Query(None, description="thumb (256px) / medium (1024px)，不传则返回原图"), dao: AsyncUserDAO = Depends(get_user_management_dao), photo_store: PhotoBlobStore = Depends(get_photo_store), photo_variants: PhotoVariantService = Depends(get_photo_variants)):
+    """
+    按引用返回照片的二进制内容 (引用即内容哈希)；size 指定时返回缩小后的版本。
+    只返回该用户轨迹中仍在引用的照片 (照片被删除或用户被删除后返回 404)。
+    分块流式读取文件；强 ETag 即内容哈希，支持 If-None-Match (304) 和 Range (206)。
+    """
+    if size is not None and size != "original" and size not in VARIANT_SIZES:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"size 只能是 {', '.join(VARIANT_SIZES)} 或 original")
+    if not is_valid_ref(photo_ref) or not await dao.user_has_photo(username, photo_ref):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="照片不存在")
+    if not await asyncio.to_thread(photo_store.exists, photo_ref):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="照片不存在")
+    if size in VARIANT_SIZES:
+        variant_path = await photo_variants.get_variant_path(photo_ref, size)
+        if variant_path is not None:
+            return await cached_file_response(request, variant_path, VARIANT_CONTENT_TYPE, f'"{photo_ref}-{size}"', PHOTO_CACHE_CONTROL)
+        # 无法生成缩略图 (未安装 Pillow 或不是可解码的图片) 时返回原图
+    try:
+        media_type = await asyncio.to_thread(photo_store.content_type, photo_ref)
+    except FileNotFoundError:  # 检查之后被清理
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="照片不存在")
+    return await cached_file_response(request, photo_store.path_for(photo_ref), media_type, f'"{photo_ref}"', PHOTO_CACHE_CONTROL)
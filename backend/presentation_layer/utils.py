@@ -1,6 +1,14 @@
 # backend/presentation_layer/utils.py
 # 此处放置输入校验、数据转换、响应格式化等工具函数
 
+import asyncio
+import os
+import re
+from typing import BinaryIO, Iterator, Optional, Tuple
+
+from fastapi import HTTPException, Request, status
+from fastapi.responses import Response, StreamingResponse
+
 def validate_input(data, schema):
     """
     示例输入校验函数。
@@ -15,4 +23,108 @@ def format_response(data=None, error_message=None, status_code=200):
     """
     if error_message:
         return {"success": False, "error": error_message}, status_code
-    return {"success": True, "data": data}, status_code 
\ No newline at end of file
+    return {"success": True, "data": data}, status_code 
+
+# --- HTTP 缓存与分段下载 ---
+
+FILE_CHUNK_SIZE = 64 * 1024
+_RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match 可以是 *、单个或逗号分隔的多个 ETag (弱比较，忽略 W/ 前缀)。"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == "*" or candidate == etag:
+            return True
+    return False
+
+
+def parse_range(range_header: Optional[str], file_size: int) -> Optional[Tuple[int, int]]:
+    """
+    解析单段 Range 请求头 (bytes=start-end / bytes=start- / bytes=-suffix)，返回闭区间 (start, end)。
+    没有 Range、格式不支持 (如多段) 时返回 None，按完整文件响应；范围无法满足时抛出 ValueError。
+    """
+    if not range_header:
+        return None
+    match = _RANGE_PATTERN.match(range_header.strip())
+    if not match:
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:  # 最后 N 个字节
+        suffix = int(end)
+        if suffix == 0 or file_size == 0:
+            raise ValueError("unsatisfiable range")
+        return max(0, file_size - suffix), file_size - 1
+    start = int(start)
+    end = min(int(end), file_size - 1) if end else file_size - 1
+    if start >= file_size or start > end:
+        raise ValueError("unsatisfiable range")
+    return start, end
+
+
+def _open_file(path: str) -> Tuple[BinaryIO, int]:
+    """打开文件并读取其大小 (在线程池中执行)。先打开再 fstat：之后文件被删除也能读完已打开的内容。"""
+    f = open(path, "rb")
+    try:
+        return f, os.fstat(f.fileno()).st_size
+    except BaseException:
+        f.close()
+        raise
+
+
+def _iter_file(f: BinaryIO, start: int, length: int) -> Iterator[bytes]:
+    """分块读取已打开的文件，读完 (或响应中断) 后关闭。StreamingResponse 在线程池中迭代同步生成器。"""
+    try:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(FILE_CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+
+async def cached_file_response(request: Request, path: str, media_type: str, etag: str, cache_control: str) -> Response:
+    """
+    分块流式返回磁盘文件 (不把整个文件读入内存)，支持：
+    If-None-Match -> 304；Range (单段) -> 206 / 416；If-Range 与 ETag 不一致时忽略 Range。
+    打开文件和读取大小在线程池中执行，不阻塞事件循环；文件已不存在 (如刚被清理) 时返回 404。
+    """
+    headers = {"ETag": etag, "Cache-Control": cache_control, "Accept-Ranges": "bytes"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    try:
+        f, file_size = await asyncio.to_thread(_open_file, path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="文件不存在")
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if if_range is not None and if_range.strip() != etag:
+        range_header = None
+    try:
+        byte_range = parse_range(range_header, file_size)
+    except ValueError:
+        f.close()
+        headers["Content-Range"] = f"bytes */{file_size}"
+        return Response(status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE, headers=headers)
+    if byte_range is None:
+        headers["Content-Length"] = str(file_size)
+        return StreamingResponse(_iter_file(f, 0, file_size), media_type=media_type, headers=headers)
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{file_size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        _iter_file(f, start, end - start + 1),
+        status_code=status.HTTP_206_PARTIAL_CONTENT,
+        media_type=media_type,
+        headers=headers,
+    )
@@ -0,0 +1,140 @@
+# backend/tests/conftest.py
+# 测试公共设置：所有存储路径指向临时目录，不读写仓库中的数据文件。
+# 运行: python -m pytest backend/tests
+
+import os
+import tempfile
+
+# 必须在导入 backend 之前设置 (config.py 在导入时读取环境变量)
+_TEST_DATA_DIR = tempfile.mkdtemp(prefix="traveltrails-tests-")
+os.environ["USERS_DATA_DIR"] = os.path.join(_TEST_DATA_DIR, "users_data")
+os.environ["PHOTO_STORE_DIR"] = os.path.join(_TEST_DATA_DIR, "photo_blobs")
+os.environ["GEOCODE_CACHE_PATH"] = os.path.join(_TEST_DATA_DIR, "geocode_cache.db")
+os.environ["DATABASE_URI"] = "json://"
+
+import pytest
+
+from backend.data_access_layer import user_management_dao
+from backend.data_access_layer.lru_cache import LRUCache
+from backend.data_access_layer.sqlite_user_dao import SQLiteUserManagementDAO
+
+# 进程内共享的单例 (模块, 变量名)：路由测试前全部清空，按测试使用的 DAO 和临时目录重新创建
+_SINGLETONS = (
+    ("backend.data_access_layer.dao_factory", "_async_user_dao"),
+    ("backend.data_access_layer.photo_variants", "_photo_variant_service"),
+    ("backend.data_access_layer.photo_gc", "_photo_garbage_collector"),
+    ("backend.data_access_layer.spatial_index", "_spatial_index"),
+    ("backend.data_access_layer.recommendation_cache", "_recommendation_cache"),
+    ("backend.business_logic_layer.trail_geometry", "_trail_geometry_service"),
+    ("backend.business_logic_layer.trail_import_service", "_trail_import_service"),
+)
+
+
+@pytest.fixture
+def json_dao(tmp_path, monkeypatch):
+    """每个测试一个独立的分片目录，并清空模块级缓存和"存储已就绪"标记。"""
+    users_dir = tmp_path / "users_data"
+    monkeypatch.setattr(user_management_dao, "USERS_FILE", str(tmp_path / "users.json"))
+    monkeypatch.setattr(user_management_dao, "USERS_DIR", str(users_dir))
+    monkeypatch.setattr(user_management_dao, "MANIFEST_FILE", str(users_dir / "manifest.json"))
+    monkeypatch.setattr(user_management_dao, "MANIFEST_LOCK_FILE", str(users_dir / "manifest.lock"))
+    monkeypatch.setattr(user_management_dao, "_storage_ready", False)
+    monkeypatch.setattr(user_management_dao, "_user_record_cache", LRUCache(max_entries=64))
+    monkeypatch.setattr(user_management_dao, "_manifest_cache", {"signature": None, "manifest": None})
+    # 压缩由测试显式调用，不启动后台线程
+    monkeypatch.setattr(user_management_dao, "JOURNAL_COMPACT_THRESHOLD", 10 ** 9)
+    return user_management_dao.UserManagementDAO()
+
+
+@pytest.fixture
+def sqlite_dao(tmp_path, json_dao):
+    # 依赖 json_dao：首次启动时从 JSON 存储导入，这里导入的是上面的空目录
+    return SQLiteUserManagementDAO(str(tmp_path / "travel_trails.db"))
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def dao(request):
+    """两种存储后端各跑一遍。"""
+    return request.getfixturevalue(f"{request.param}_dao")
+
+
+@pytest.fixture
+def app(dao, tmp_path, monkeypatch):
+    """以 dao 为存储后端的应用；照片和地理编码缓存使用本测试的临时目录。"""
+    import importlib
+
+    from backend.data_access_layer import dao_factory, geocode_cache, photo_blob_store
+    from backend.main import app
+
+    for module_name, attribute in _SINGLETONS:
+        monkeypatch.setattr(importlib.import_module(module_name), attribute, None)
+    monkeypatch.setattr(dao_factory, "_user_dao", dao)
+    monkeypatch.setattr(photo_blob_store, "_photo_blob_store", photo_blob_store.PhotoBlobStore(str(tmp_path / "photo_blobs")))
+    monkeypatch.setattr(geocode_cache, "_geocode_cache", geocode_cache.GeocodeCache(str(tmp_path / "geocode_cache.db")))
+    return app
+
+
+@pytest.fixture
+def client(app):
+    """运行应用 lifespan 的 TestClient。"""
+    from fastapi.testclient import TestClient
+
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+def register(client, username: str, email: str = None):
+    response = client.post("/auth/register", json={
+        "username": username, "email": email or f"{username}@example.com", "password": "secret"})
+    assert response.status_code == 201, response.text
+    return response.json()
+
+
+def make_city(name: str, country: str = "日本", latitude: float = 35.68, longitude: float = 139.69, **fields):
+    return dict({"city": name, "country": country, "latitude": latitude, "longitude": longitude}, **fields)
+
+
+def make_user(username: str, cities=()):
+    return {
+        "username": username,
+        "email": f"{username}@example.com",
+        "password": "hashed",
+        "travel_trails": [{"cities": [dict(city) for city in cities]}],
+    }
+
+
+PHOTO_REF = "ab" * 32
+
+# 统计相关测试共用的轨迹：包含重复城市、缺少交通方式和无效日期
+TRAIL_CITIES = [
+    make_city("东京", "日本", 35.68, 139.69, transport_mode="plane", visit_date="2023-04-01T10:00:00"),
+    make_city("京都", "日本", 35.01, 135.77, transport_mode="train", visit_date="2023-04-03T09:00:00"),
+    make_city("巴黎", "法国", 48.86, 2.35, transport_mode="plane", visit_date="2023-05-20"),
+    make_city("东京", "日本", 35.68, 139.69, visit_date="not a date"),
+    make_city("里昂", "法国", 45.76, 4.84, transport_mode="car", visit_date="2024-01-15"),
+]
+
+
+def run_mutations(dao, username: str):
+    """一组覆盖各类细粒度变更的操作 (按位置和按 id 定位混用)。"""
+    dao.save_user(make_user(username, [make_city("东京")]), overwrite=False)
+    dao.add_city(username, make_city("大阪", latitude=34.69, longitude=135.50, transport_mode="train"))
+    added = dao.add_cities(username, [make_city("巴黎", "法国", 48.86, 2.35, transport_mode="plane"),
+                                      make_city("里昂", "法国", 45.76, 4.84, transport_mode="train")])
+    dao.update_city_blog(username, added[0]["id"], "铁塔")
+    dao.add_photo(username, 1, {"ref": PHOTO_REF, "content_type": "image/jpeg", "size": 3})
+    dao.add_photo(username, 1, {"ref": "cd" * 32, "content_type": "image/png", "size": 4})
+    dao.remove_photo(username, 1, 0)
+    dao.remove_city(username, 0)
+    dao.update_user(username, {"age": 30})
+
+
+def trail_summary(user):
+    """比较两种后端时忽略随机生成的 id，只看对外可见的内容。"""
+    cities = user["travel_trails"][0]["cities"]
+    return {
+        "version": user["_version"],
+        "age": user.get("age"),
+        "cities": [(city["city"], city["country"], city.get("transport_mode"), city.get("blog") or "",
+                    [photo["ref"] for photo in city.get("photos") or []]) for city in cities],
+    }
@@ -0,0 +1,55 @@
+# backend/tests/test_conditional_requests.py
+# 轨迹和城市接口的 ETag：If-None-Match -> 304，If-Match 版本过期 -> 412
+
+from .conftest import make_city, register
+
+
+def _setup(client, username):
+    register(client, username)
+    response = client.post(f"/users/{username}/cities", json=make_city("东京"))
+    assert response.status_code == 201, response.text
+    return response
+
+
+def test_city_list_etag_and_not_modified(client):
+    _setup(client, "eve")
+    response = client.get("/users/eve/cities")
+    etag = response.headers["etag"]
+    assert response.status_code == 200 and response.headers["cache-control"] == "no-cache"
+    assert response.headers["x-total-count"] == "1"
+
+    response = client.get("/users/eve/cities", headers={"If-None-Match": etag})
+    assert response.status_code == 304 and response.headers["etag"] == etag and not response.content
+    # 不同的分页/投影参数是不同的表示
+    assert client.get("/users/eve/cities", params={"fields": "city"}, headers={"If-None-Match": etag}).status_code == 200
+
+    client.post("/users/eve/cities", json=make_city("大阪"))
+    response = client.get("/users/eve/cities", headers={"If-None-Match": etag})
+    assert response.status_code == 200 and response.headers["etag"] != etag
+
+
+def test_single_city_etag(client):
+    city = _setup(client, "finn").json()
+    response = client.get(f"/users/finn/cities/id/{city['id']}")
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+    assert client.get(f"/users/finn/cities/id/{city['id']}", headers={"If-None-Match": f'W/{etag}'}).status_code == 304
+    assert client.get("/users/finn/cities/id/missing").status_code == 404
+
+
+def test_if_match_with_stale_version_returns_412(client):
+    response = _setup(client, "gus")
+    city, etag = response.json(), response.headers["etag"]
+    # 写操作返回变更后的版本，客户端可以直接用于下一次 If-Match
+    response = client.put(f"/users/gus/cities/id/{city['id']}/blog", json={"blog": "第一版"}, headers={"If-Match": etag})
+    assert response.status_code == 200, response.text
+    new_etag = response.headers["etag"]
+    assert new_etag != etag
+
+    response = client.put(f"/users/gus/cities/id/{city['id']}/blog", json={"blog": "覆盖"}, headers={"If-Match": etag})
+    assert response.status_code == 412
+    assert client.delete(f"/users/gus/cities/id/{city['id']}", headers={"If-Match": etag}).status_code == 412
+    assert client.get(f"/users/gus/cities/id/{city['id']}").json()["blog"] == "第一版"
+
+    assert client.put(f"/users/gus/cities/id/{city['id']}/blog", json={"blog": "x"}, headers={"If-Match": "abc"}).status_code == 400
+    assert client.delete(f"/users/gus/cities/id/{city['id']}", headers={"If-Match": "*"}).status_code == 204
@@ -0,0 +1,70 @@
+# backend/tests/test_gazetteer.py
+# 离线地名库：名称键的规范化、按国家消歧、前缀自动补全的排序，以及自动补全接口
+
+import pytest
+
+from backend.data_access_layer.gazetteer import Gazetteer, gazetteer_key
+
+
+@pytest.fixture
+def gazetteer(tmp_path):
+    """小型数据文件：两个同名城市 (按数据文件中的顺序决定默认结果) 和一条无效行。"""
+    (tmp_path / "countries.csv").write_text(
+        "code,name_en,name_zh,aliases\n"
+        "US,United States,美国,USA|America\n"
+        "AU,Australia,澳大利亚,\n"
+        "JP,Japan,日本,\n",
+        encoding="utf-8",
+    )
+    (tmp_path / "cities.csv").write_text(
+        "name_en,name_zh,country_code,latitude,longitude,aliases\n"
+        "Sydney,悉尼,AU,-33.8688,151.2093,雪梨\n"
+        "Sydney,悉尼,US,40.0,-80.0,\n"
+        "Osaka,大阪,JP,34.6937,135.5023,\n"
+        "Osaka Bay,大阪湾,JP,34.5,135.3,\n"
+        "Broken,坏,JP,not-a-number,0,\n",
+        encoding="utf-8",
+    )
+    return Gazetteer(str(tmp_path))
+
+
+def test_key_normalization():
+    assert gazetteer_key(" São  Paulo ") == "sao paulo"
+    assert gazetteer_key("St. Petersburg") == gazetteer_key("St Petersburg") == "st petersburg"
+    assert gazetteer_key("Xi'an") == "xi an"
+    assert gazetteer_key("北京市") == "北京"
+    assert gazetteer_key("ＴＯＫＹＯ") == "tokyo"
+
+
+def test_resolve_prefers_file_order_and_filters_by_country(gazetteer):
+    assert gazetteer.stats() == {"cities": 4, "names": 9, "countries": 3}
+    assert gazetteer.resolve("sydney")["country_code"] == "AU"
+    assert gazetteer.resolve("Sydney", "USA")["latitude"] == 40.0
+    assert gazetteer.resolve("雪梨")["city"] == "悉尼"  # 中文查询返回中文名称
+    assert gazetteer.resolve("Sydney", "Japan") is None
+    assert gazetteer.resolve("Sydney", "未知国家") is None  # 国家不认识时交给在线地理编码
+    assert gazetteer.resolve("Broken") is None
+
+
+def test_autocomplete_orders_exact_matches_first(gazetteer):
+    assert [city["city"] for city in gazetteer.autocomplete("osaka")] == ["Osaka", "Osaka Bay"]
+    assert [city["city"] for city in gazetteer.autocomplete("大阪", limit=1)] == ["大阪"]
+    assert [city["country_code"] for city in gazetteer.autocomplete("syd", country="us")] == ["US"]
+    assert gazetteer.autocomplete("syd", country="nowhere") == []
+    assert gazetteer.autocomplete("  ") == []
+
+
+def test_bundled_data_resolves_common_names():
+    gazetteer = Gazetteer()
+    assert gazetteer.resolve("Sao Paulo", "Brazil")["city_zh"] == "圣保罗"
+    assert gazetteer.resolve("北京市", "中国")["city"] == "北京"
+    assert gazetteer.resolve("Hong Kong", "中国")["country_code"] == "HK"  # "中国"也匹配香港
+    assert gazetteer.resolve("St. Petersburg")["country_code"] == "RU"
+
+
+def test_autocomplete_route(client):
+    response = client.get("/geo/places/autocomplete", params={"q": "旧金", "limit": 3})
+    assert response.status_code == 200
+    assert response.json()[0]["city"] == "旧金山" and response.json()[0]["country"] == "美国"
+    assert client.get("/geo/places/autocomplete", params={"q": "san", "country": "US"}).json()[0]["country_code"] == "US"
+    assert client.get("/geo/places/autocomplete", params={"q": ""}).status_code == 422
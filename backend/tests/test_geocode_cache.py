@@ -0,0 +1,71 @@
+# backend/tests/test_geocode_cache.py
+# 持久化地理编码缓存：规范化的查询、负缓存与有效期、预热不覆盖有效结果、随轨迹变更预热
+
+from backend.business_logic_layer.ai_recommendation_service import PREDEFINED_RECOMMENDATIONS_DATA, warm_geocode_cache
+from backend.data_access_layer.geocode_cache import GeocodeCache, normalize_geocode_query
+
+from .conftest import make_city, make_user
+
+
+def new_cache(tmp_path, **kwargs) -> GeocodeCache:
+    return GeocodeCache(str(tmp_path / "geocodes.db"), **kwargs)
+
+
+def test_put_and_get_with_normalized_queries(tmp_path):
+    cache = new_cache(tmp_path)
+    assert cache.get("Paris", "France") is None
+    cache.put("Paris", "France", 48.86, 2.35)
+    assert cache.get("  PARIS ", "ｆｒａｎｃｅ") == {"latitude": 48.86, "longitude": 2.35, "source": "nominatim"}
+    assert normalize_geocode_query("Ｐａｒｉｓ", " France ") == "paris, france"
+
+    # 重启后仍然有效
+    assert new_cache(tmp_path).get("paris", "france")["latitude"] == 48.86
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_negative_entries_use_shorter_ttl(tmp_path):
+    cache = new_cache(tmp_path, ttl_seconds=60, negative_ttl_seconds=0)
+    cache.put("不存在的城市", "无", None, None)
+    assert cache.get("不存在的城市", "无") is None  # 负缓存已过期
+    cache = new_cache(tmp_path, ttl_seconds=60, negative_ttl_seconds=60)
+    cache.put("不存在的城市", "无", None, None)
+    assert cache.get("不存在的城市", "无") == {"latitude": None, "longitude": None, "source": "nominatim"}
+    assert cache.stats()["negative_entries"] == 1 and cache.negative_hits == 1
+
+
+def test_get_many_counts_hits_and_misses(tmp_path):
+    cache = new_cache(tmp_path)
+    cache.put_many([("东京, 日本", 35.68, 139.69), ("无效, 无", None, None)])
+    found = cache.get_many(["东京, 日本", "无效, 无", "大阪, 日本", "东京, 日本"])
+    assert set(found) == {"东京, 日本", "无效, 无"}
+    assert (cache.hits, cache.negative_hits, cache.misses) == (1, 1, 1)
+
+
+def test_warm_fills_gaps_without_overwriting_valid_results(tmp_path):
+    cache = new_cache(tmp_path)
+    cache.put("东京", "日本", 35.6895, 139.6917)
+    cache.put("京都", "日本", None, None)
+    written = cache.warm([
+        make_city("东京"), make_city("京都", latitude=35.01, longitude=135.77),
+        make_city("大阪", latitude=34.69, longitude=135.50), make_city("无效", latitude=120.0, longitude=0.0),
+    ], source="user")
+    assert written == 2
+    assert cache.get("东京", "日本")["latitude"] == 35.6895  # 有效的地理编码结果不被覆盖
+    assert cache.get("京都", "日本")["source"] == "user"  # 负缓存被已知坐标替换
+    assert cache.get("无效", "日本") is None
+
+
+def test_warm_from_predefined_and_user_trails(tmp_path, dao):
+    dao.save_user(make_user("ada", [make_city("大阪", latitude=34.69, longitude=135.50)]))
+    cache = new_cache(tmp_path)
+    assert warm_geocode_cache(cache, dao) == len(PREDEFINED_RECOMMENDATIONS_DATA) + 1
+    assert warm_geocode_cache(cache, dao) == 0  # 重复预热不写入
+    first = PREDEFINED_RECOMMENDATIONS_DATA[0]
+    assert cache.get(first["city"], first["country"])["source"] == "predefined"
+
+    # 用户之后新增的城市通过轨迹变更通知写入
+    dao.add_listener(cache.on_trail_change)
+    dao.add_city("ada", make_city("那霸", latitude=26.21, longitude=127.68))
+    assert cache.get("那霸", "日本") == {"latitude": 26.21, "longitude": 127.68, "source": "user"}
+    cache.purge_expired()
+    assert cache.stats()["entries"] == len(PREDEFINED_RECOMMENDATIONS_DATA) + 2
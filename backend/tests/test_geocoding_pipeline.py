@@ -0,0 +1,109 @@
+# backend/tests/test_geocoding_pipeline.py
+# 推荐结果的地理编码流水线：先查离线地名库和缓存，未命中的地点才请求 Nominatim (同一地点只请求一次)；
+# 令牌桶限速、并发上限、出错的地点不写缓存。Nominatim 用 httpx.MockTransport 代替。
+
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from backend.business_logic_layer.geocoding_pipeline import GeocodingPipeline, NominatimGeocoder, TokenBucket
+from backend.data_access_layer.gazetteer import Gazetteer
+from backend.data_access_layer.geocode_cache import GeocodeCache
+
+
+@pytest.fixture(scope="module")
+def gazetteer():
+    return Gazetteer()
+
+
+@pytest.fixture
+def geocode_cache(tmp_path):
+    return GeocodeCache(str(tmp_path / "geocodes.db"))
+
+
+def nominatim_transport(queries, in_flight=None):
+    """按查询返回结果：含"失败"的地点返回 500，含"无"的地点返回空列表。"""
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        query = request.url.params["q"]
+        queries.append(query)
+        if in_flight is not None:
+            in_flight["now"] += 1
+            in_flight["peak"] = max(in_flight["peak"], in_flight["now"])
+            await asyncio.sleep(0.01)
+            in_flight["now"] -= 1
+        if "失败" in query:
+            return httpx.Response(500)
+        if "无" in query:
+            return httpx.Response(200, json=[])
+        return httpx.Response(200, json=[{"lat": "1.5", "lon": "2.5"}])
+
+    return httpx.MockTransport(handler)
+
+
+def resolve(pipeline, places, transport):
+    async def run():
+        async with httpx.AsyncClient(transport=transport) as client:
+            return await pipeline.resolve_many(places, client=client)
+    return asyncio.run(run())
+
+
+def test_token_bucket_spaces_requests_after_burst():
+    bucket = TokenBucket(rate=10.0, capacity=2)
+    delays = [bucket.reserve() for _ in range(4)]
+    assert delays[:2] == [0.0, 0.0]
+    assert delays[2] == pytest.approx(0.1, abs=0.01) and delays[3] == pytest.approx(0.2, abs=0.01)
+    assert bucket.throttled == 2
+
+    started = time.monotonic()
+    asyncio.run(TokenBucket(rate=20.0).acquire())
+    assert time.monotonic() - started < 0.05  # 桶是满的，第一个令牌不需要等待
+
+
+def test_only_misses_are_fetched_once_and_cached(gazetteer, geocode_cache):
+    geocode_cache.put("缓存城", "某国", 10.0, 20.0)
+    geocode_cache.put("已知无", "某国", None, None)
+    geocoder = NominatimGeocoder(TokenBucket(rate=1000.0, capacity=100), url="https://nominatim.test/search")
+    pipeline = GeocodingPipeline(gazetteer, geocode_cache, geocoder)
+    queries = []
+    places = [("京都", "日本"), ("缓存城", "某国"), ("已知无", "某国"), ("新城", "某国"), ("新城 ", "某国"),
+              ("查无", "某国"), ("失败城", "某国")]
+
+    results = resolve(pipeline, places, nominatim_transport(queries))
+    assert results[0] == pytest.approx((35.0116, 135.7681))  # 离线地名库
+    assert results[1:4] == [(10.0, 20.0), None, (1.5, 2.5)]
+    assert results[4] == (1.5, 2.5)  # 规范化后相同的地点共用一次请求
+    assert results[5] is None
+    assert isinstance(results[6], httpx.HTTPStatusError)
+    assert sorted(queries) == ["失败城, 某国", "新城, 某国", "查无, 某国"]
+    assert geocoder.stats()["requests"] == 3 and geocoder.errors == 1
+
+    # 查到和查不到的结果都已缓存，出错的地点下次重试
+    queries.clear()
+    results = resolve(pipeline, places, nominatim_transport(queries))
+    assert results[3] == (1.5, 2.5) and results[5] is None
+    assert queries == ["失败城, 某国"]
+
+
+def test_requests_respect_concurrency_and_rate_limit(gazetteer, geocode_cache):
+    geocoder = NominatimGeocoder(TokenBucket(rate=50.0, capacity=1), url="https://nominatim.test/search")
+    pipeline = GeocodingPipeline(gazetteer, geocode_cache, geocoder, max_concurrency=2)
+    queries, in_flight = [], {"now": 0, "peak": 0}
+    places = [(f"城市{i}", "某国") for i in range(6)]
+
+    started = time.monotonic()
+    results = resolve(pipeline, places, nominatim_transport(queries, in_flight))
+    elapsed = time.monotonic() - started
+    assert results == [(1.5, 2.5)] * 6 and len(queries) == 6
+    assert in_flight["peak"] <= 2
+    assert elapsed >= 5 / 50.0 * 0.9  # 第一个令牌之后每 20ms 一个
+    assert geocoder.limiter.throttled == 5
+
+
+def test_all_hits_need_no_client(gazetteer, geocode_cache):
+    geocoder = NominatimGeocoder(TokenBucket(rate=1.0))
+    pipeline = GeocodingPipeline(gazetteer, geocode_cache, geocoder)
+    assert asyncio.run(pipeline.resolve_many([("Paris", "France"), ("北京", "中国")]))[1] == pytest.approx((39.9042, 116.4074))
+    assert geocoder.requests == 0
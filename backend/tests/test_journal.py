@@ -0,0 +1,66 @@
+# backend/tests/test_journal.py
+# 追加日志：回放 (快照 + 日志)、压缩、残缺尾部的处理、达到阈值后的后台压缩
+
+import os
+import time
+
+from backend.data_access_layer import user_management_dao
+
+from .conftest import make_city, make_user, run_mutations
+
+
+def drop_record_cache(monkeypatch):
+    """丢弃进程内缓存，下一次读取从快照 + 日志回放。"""
+    monkeypatch.setattr(user_management_dao, "_user_record_cache", user_management_dao.LRUCache(max_entries=64))
+
+
+def test_journal_replay_and_compaction(json_dao, monkeypatch):
+    run_mutations(json_dao, "bob")
+    cached = json_dao.find_user_by_username("bob")
+
+    # 丢弃缓存后从快照 + 日志回放，结果与写入时一致
+    drop_record_cache(monkeypatch)
+    replayed = json_dao.find_user_by_username("bob")
+    assert replayed == cached
+
+    journal_path = json_dao._journal_path("bob")
+    with open(journal_path, encoding="utf-8") as f:
+        assert len(f.readlines()) == 8  # save_user 写快照，其余 8 个变更各一条日志
+
+    assert json_dao.compact_journal("bob") is True
+    assert not os.path.exists(journal_path)
+    assert json_dao.compact_journal("bob") is False
+    drop_record_cache(monkeypatch)
+    assert json_dao.find_user_by_username("bob") == cached
+
+
+def test_journal_replay_ignores_torn_tail(json_dao, monkeypatch):
+    json_dao.save_user(make_user("carol", [make_city("东京")]))
+    json_dao.add_city("carol", make_city("京都"))
+    with open(json_dao._journal_path("carol"), "a", encoding="utf-8") as f:
+        f.write('{"op": "add_city", "city": {"city": "半')  # 写入中途崩溃留下的残缺行
+    drop_record_cache(monkeypatch)
+    assert [city["city"] for city in json_dao.find_user_by_username("carol")["travel_trails"][0]["cities"]] == ["东京", "京都"]
+
+    json_dao.add_city("carol", make_city("奈良"))  # 追加前截掉残缺的尾部
+    drop_record_cache(monkeypatch)
+    user = json_dao.find_user_by_username("carol")
+    assert [city["city"] for city in user["travel_trails"][0]["cities"]] == ["东京", "京都", "奈良"]
+    assert user["_version"] == 3
+
+
+def test_background_compaction_after_threshold(json_dao, monkeypatch):
+    monkeypatch.setattr(user_management_dao, "JOURNAL_COMPACT_THRESHOLD", 3)
+    json_dao.save_user(make_user("nina", [make_city("东京")]))
+    for name in ("京都", "大阪", "奈良"):
+        json_dao.add_city("nina", make_city(name))
+    journal_path = json_dao._journal_path("nina")
+    for _ in range(100):
+        if not os.path.exists(journal_path):
+            break
+        time.sleep(0.02)
+    assert not os.path.exists(journal_path)
+    drop_record_cache(monkeypatch)
+    user = json_dao.find_user_by_username("nina")
+    assert [city["city"] for city in user["travel_trails"][0]["cities"]] == ["东京", "京都", "大阪", "奈良"]
+    assert user["_version"] == 4
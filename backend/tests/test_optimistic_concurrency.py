@@ -0,0 +1,83 @@
+# backend/tests/test_optimistic_concurrency.py
+# 乐观并发：版本号比较-交换、无效变更不写入、并发写入同一文件
+
+import json
+import os
+import threading
+
+import pytest
+
+from backend.data_access_layer.errors import VersionConflictError
+
+from .conftest import make_city, make_user
+
+
+def test_stale_expected_version_raises_conflict(dao):
+    dao.save_user(make_user("dave", [make_city("东京")]))
+    version = dao.get_user_version("dave")
+    city = dao.add_city("dave", make_city("大阪"), expected_version=version)
+    assert city["_version"] == version + 1
+
+    with pytest.raises(VersionConflictError) as excinfo:
+        dao.add_city("dave", make_city("京都"), expected_version=version)
+    assert (excinfo.value.expected_version, excinfo.value.current_version) == (version, version + 1)
+    with pytest.raises(VersionConflictError):
+        dao.remove_city("dave", 0, expected_version=version)
+    with pytest.raises(VersionConflictError):
+        dao.update_user("dave", {"age": 1}, expected_version=version)
+    # 冲突的写入不生效
+    assert dao.get_user_version("dave") == version + 1
+    assert len(dao.list_city_columns("dave", ("city",))["city"]) == 2
+
+
+def test_invalid_position_raises_index_error_without_writing(dao):
+    dao.save_user(make_user("erin", [make_city("东京")]))
+    version = dao.get_user_version("erin")
+    with pytest.raises(IndexError):
+        dao.remove_city("erin", 5)
+    with pytest.raises(IndexError):
+        dao.remove_photo("erin", 0, 0)
+    assert dao.get_user_version("erin") == version
+
+
+def test_concurrent_writers_with_same_version_only_one_wins(dao):
+    dao.save_user(make_user("gina", [make_city("东京")]))
+    version = dao.get_user_version("gina")
+    barrier = threading.Barrier(8)
+    results = []
+
+    def add(i):
+        barrier.wait()
+        try:
+            dao.add_city("gina", make_city(f"城市{i}"), expected_version=version)
+            results.append("ok")
+        except VersionConflictError:
+            results.append("conflict")
+
+    threads = [threading.Thread(target=add, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(results) == ["conflict"] * 7 + ["ok"]
+    assert dao.get_user_version("gina") == version + 1
+
+
+def test_concurrent_json_file_writes_do_not_collide(json_dao, tmp_path):
+    path = str(tmp_path / "shared.json")
+    barrier = threading.Barrier(8)
+
+    def write(i):
+        barrier.wait()
+        for _ in range(20):
+            json_dao._write_json_file(path, {"writer": i, "payload": "x" * 1000})
+
+    threads = [threading.Thread(target=write, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    with open(path, encoding="utf-8") as f:
+        assert json.load(f)["payload"] == "x" * 1000
+    assert os.listdir(tmp_path).count("shared.json") == 1
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
@@ -0,0 +1,116 @@
+# backend/tests/test_photo_serving.py
+# 照片下载接口：缓存头、If-None-Match、Range，以及归属检查和已删除的照片
+
+import asyncio
+import os
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from backend.presentation_layer.travel_router import PHOTO_CACHE_CONTROL
+from backend.presentation_layer.utils import cached_file_response, etag_matches, parse_range
+
+from .conftest import make_city, register
+
+PHOTO = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 4
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("", None),
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-", (100, 999)),          # 到文件末尾
+    ("bytes=-100", (900, 999)),          # 最后 100 个字节
+    ("bytes=-5000", (0, 999)),           # 后缀长于文件时返回整个文件
+    ("bytes=900-5000", (900, 999)),      # 结束位置超出文件时截断
+    (" bytes=5-5 ", (5, 5)),
+    ("bytes=0-9,20-29", None),           # 多段不支持，按完整文件响应
+    ("bytes=-", None),
+    ("items=0-9", None),
+    ("bytes=abc-", None),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header, file_size", [
+    ("bytes=1000-", 1000),   # 起点等于文件大小
+    ("bytes=50-10", 1000),   # 起点大于终点
+    ("bytes=-0", 1000),      # 长度为 0 的后缀
+    ("bytes=-10", 0),        # 空文件
+    ("bytes=0-", 0),
+])
+def test_parse_range_unsatisfiable(header, file_size):
+    with pytest.raises(ValueError):
+        parse_range(header, file_size)
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, False),
+    ("", False),
+    ('"abc"', True),
+    ('W/"abc"', True),
+    ('"xyz", "abc"', True),
+    ('"xyz",W/"abc"', True),
+    ("*", True),
+    ('"abcd"', False),
+    ("abc", False),
+])
+def test_etag_matches(header, expected):
+    assert etag_matches(header, '"abc"') is expected
+
+
+def _upload(client, username):
+    register(client, username)
+    city = client.post(f"/users/{username}/cities", json=make_city("东京")).json()
+    response = client.post(f"/users/{username}/cities/id/{city['id']}/photos", files={"file": ("p.png", PHOTO, "image/png")})
+    assert response.status_code == 201, response.text
+    return city, response.json()["photos"][0]
+
+
+def test_photo_is_served_with_long_lived_private_caching(client):
+    _, photo = _upload(client, "hana")
+    response = client.get(photo["url"])
+    assert response.status_code == 200 and response.content == PHOTO
+    assert response.headers["cache-control"] == PHOTO_CACHE_CONTROL == "private, max-age=31536000, immutable"
+    assert response.headers["etag"] == f'"{photo["ref"]}"'
+    assert response.headers["content-type"] == "image/png" and response.headers["content-length"] == str(len(PHOTO))
+
+    response = client.get(photo["url"], headers={"If-None-Match": f'"{photo["ref"]}"'})
+    assert response.status_code == 304 and not response.content
+
+
+def test_photo_range_requests(client):
+    _, photo = _upload(client, "ian")
+    response = client.get(photo["url"], headers={"Range": "bytes=8-15"})
+    assert response.status_code == 206 and response.content == PHOTO[8:16]
+    assert response.headers["content-range"] == f"bytes 8-15/{len(PHOTO)}"
+    response = client.get(photo["url"], headers={"Range": "bytes=-4"})
+    assert response.status_code == 206 and response.content == PHOTO[-4:]
+    # If-Range 与当前 ETag 不一致：忽略 Range，返回完整文件
+    response = client.get(photo["url"], headers={"Range": "bytes=0-3", "If-Range": '"other"'})
+    assert response.status_code == 200 and response.content == PHOTO
+    response = client.get(photo["url"], headers={"Range": f"bytes={len(PHOTO)}-"})
+    assert response.status_code == 416 and response.headers["content-range"] == f"bytes */{len(PHOTO)}"
+
+
+def test_photo_is_only_served_to_the_referencing_user(client, tmp_path):
+    city, photo = _upload(client, "jade")
+    register(client, "kim")
+    assert client.get(f"/users/kim/photos/{photo['ref']}").status_code == 404
+    assert client.get("/users/jade/photos/not-a-ref").status_code == 404
+
+    # 照片文件已被清理 (记录中仍有引用) 时返回 404 而不是 500
+    os.remove(tmp_path / "photo_blobs" / photo["ref"][:2] / photo["ref"])
+    assert client.get(photo["url"]).status_code == 404
+    # 照片从城市中删除后不再提供
+    assert client.delete(f"/users/jade/cities/id/{city['id']}/photos/{photo['id']}").status_code == 204
+    assert client.get(photo["url"]).status_code == 404
+
+
+def test_cached_file_response_maps_missing_file_to_404(tmp_path):
+    request = Request({"type": "http", "method": "GET", "path": "/", "headers": []})
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(cached_file_response(request, str(tmp_path / "missing"), "image/png", '"x"', "no-cache"))
+    assert excinfo.value.status_code == 404
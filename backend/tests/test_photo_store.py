@@ -0,0 +1,136 @@
+# backend/tests/test_photo_store.py
+# 内容寻址的照片存储：存入与复用、内嵌照片迁移、未引用照片的清理
+
+import base64
+import os
+
+import pytest
+
+from backend.data_access_layer.errors import PhotoTooLargeError
+from backend.data_access_layer.photo_blob_store import PhotoBlobStore, migrate_embedded_photos
+from backend.data_access_layer.photo_gc import PhotoGarbageCollector
+from backend.data_access_layer.photo_variants import PhotoVariantService
+from backend.data_access_layer.trail_ops import TRAIL_CITIES_ADDED, TRAIL_CITY_REMOVED
+
+from .conftest import PHOTO_REF, make_city, make_user
+
+PNG_HEADER = b"\x89PNG\r\n\x1a\n" + b"\x00" * 8
+
+
+@pytest.fixture
+def blob_store(tmp_path):
+    return PhotoBlobStore(str(tmp_path / "photo_blobs"))
+
+
+def test_put_bytes_deduplicates_by_content(blob_store):
+    first = blob_store.put_bytes(PNG_HEADER + b"one", "image/jpeg")
+    second = blob_store.put_bytes(PNG_HEADER + b"one")
+    assert first == second
+    # 按文件头判断类型，不信任声明的类型
+    assert first["content_type"] == "image/png" and first["size"] == len(PNG_HEADER) + 3
+    assert [ref for ref, _ in blob_store.iter_blobs()] == [first["ref"]]
+    assert not [name for name in os.listdir(os.path.dirname(blob_store.path_for(first["ref"]))) if name.endswith(".tmp")]
+    assert blob_store.delete(first["ref"]) and not blob_store.exists(first["ref"])
+    assert not blob_store.touch(first["ref"])
+
+
+def test_put_base64_accepts_data_uri_and_enforces_limit(blob_store):
+    data = "data:image/webp;base64," + base64.b64encode(b"not really webp").decode()
+    record = blob_store.put_base64(data)
+    assert record["content_type"] == "image/webp"
+    with open(blob_store.path_for(record["ref"]), "rb") as f:
+        assert f.read() == b"not really webp"
+    with pytest.raises(PhotoTooLargeError):
+        blob_store.put_base64(base64.b64encode(b"x" * 100).decode(), max_bytes=10)
+    with pytest.raises(ValueError):
+        blob_store.put_base64("not base64!")
+
+
+def test_streamed_writer_matches_put_bytes(blob_store):
+    writer = blob_store.open_writer(max_bytes=1024)
+    for chunk in (PNG_HEADER[:4], PNG_HEADER[4:], b"two"):
+        writer.write(chunk)
+    assert writer.commit() == blob_store.put_bytes(PNG_HEADER + b"two")
+
+    writer = blob_store.open_writer(max_bytes=4)
+    with pytest.raises(PhotoTooLargeError):
+        writer.write(b"12345")
+    assert not [name for name in os.listdir(blob_store.root) if name.endswith(".tmp")]
+
+
+def test_photo_refs_and_ownership(dao):
+    dao.save_user(make_user("frank", [make_city("东京")]))
+    dao.save_user(make_user("grace", [make_city("大阪")]))
+    dao.add_photo("frank", 0, {"ref": PHOTO_REF, "content_type": "image/jpeg", "size": 3})
+    assert dao.user_has_photo("frank", PHOTO_REF)
+    assert not dao.user_has_photo("grace", PHOTO_REF)
+    assert dao.list_photo_refs() == {PHOTO_REF}
+    dao.remove_photo("frank", 0, 0)
+    assert not dao.user_has_photo("frank", PHOTO_REF)
+    assert dao.list_photo_refs() == set()
+
+
+def _embedded_user(username):
+    city = make_city("东京", photos=[{"id": f"{username}-photo", "data": base64.b64encode(PNG_HEADER + b"old").decode()},
+                                   {"data": "not base64!"}])
+    return make_user(username, [city])
+
+
+def test_migrate_embedded_photos_once(dao, blob_store):
+    dao.save_user(_embedded_user("olga"))
+    assert migrate_embedded_photos(dao, blob_store) == 1
+    photos = dao.get_city("olga", 0)["photos"]
+    assert photos[0]["id"] == "olga-photo" and blob_store.exists(photos[0]["ref"]) and "data" not in photos[0]
+    # 无法解码的照片保持原样
+    assert photos[1]["data"] == "not base64!"
+    # 标记文件存在后直接跳过
+    dao.save_user(_embedded_user("pete"))
+    assert migrate_embedded_photos(dao, blob_store) == 0
+
+
+class _ConcurrentWriteDAO:
+    """第一次写回迁移结果之前，模拟另一个请求先修改了用户。"""
+
+    def __init__(self, dao):
+        self._dao = dao
+        self.conflicts = 0
+
+    def __getattr__(self, name):
+        return getattr(self._dao, name)
+
+    def update_user(self, username, update_data, expected_version=None):
+        if not self.conflicts:
+            self.conflicts += 1
+            self._dao.add_city(username, make_city("大阪"))
+        return self._dao.update_user(username, update_data, expected_version=expected_version)
+
+
+def test_migration_retries_on_concurrent_write(dao, blob_store):
+    dao.save_user(_embedded_user("quinn"))
+    assert migrate_embedded_photos(_ConcurrentWriteDAO(dao), blob_store) == 1
+    # 并发追加的城市没有被迁移结果覆盖
+    assert dao.list_city_columns("quinn", ("city",))["city"] == ["东京", "大阪"]
+    assert dao.get_city("quinn", 0)["photos"][0]["ref"]
+
+
+def test_garbage_collector_removes_unreferenced_blobs(dao, blob_store):
+    variants = PhotoVariantService(blob_store)
+    kept = blob_store.put_bytes(PNG_HEADER + b"kept")
+    dropped = blob_store.put_bytes(PNG_HEADER + b"dropped")
+    orphan_variant = variants.path_for(dropped["ref"], "thumb")
+    os.makedirs(os.path.dirname(orphan_variant))
+    open(orphan_variant, "wb").close()
+    dao.save_user(make_user("rosa", [make_city("东京", photos=[kept])]))
+
+    collector = PhotoGarbageCollector(dao, blob_store, variants, grace_seconds=3600)
+    # 宽限期内的照片 (可能刚上传、还没写入用户记录) 不删除
+    assert collector.collect() == {"blobs": 0, "variants": 0}
+    collector.grace_seconds = -1
+    assert collector.collect() == {"blobs": 1, "variants": 1}
+    assert blob_store.exists(kept["ref"]) and not blob_store.exists(dropped["ref"])
+    assert not os.path.exists(orphan_variant)
+
+    collector.on_trail_change(TRAIL_CITIES_ADDED, "rosa", [])
+    assert not collector.pending
+    collector.on_trail_change(TRAIL_CITY_REMOVED, "rosa", [])
+    assert collector.pending
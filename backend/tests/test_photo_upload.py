@@ -0,0 +1,62 @@
+# backend/tests/test_photo_upload.py
+# 照片上传接口：multipart 流式写入、base64 兼容方式、大小上限
+
+import base64
+import hashlib
+import os
+
+from backend.presentation_layer import travel_router
+
+from .conftest import make_city, register
+
+PHOTO = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 40
+
+
+def _add_city(client, username):
+    register(client, username)
+    response = client.post(f"/users/{username}/cities", json=make_city("东京"))
+    assert response.status_code == 201, response.text
+    return response.json()
+
+
+def _tmp_files(root):
+    return [name for _, _, names in os.walk(root) for name in names if name.endswith(".tmp")]
+
+
+def test_multipart_upload_is_stored_by_content_hash(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(travel_router, "UPLOAD_CHUNK_SIZE", 1000)  # 多个块
+    city = _add_city(client, "amy")
+    response = client.post(f"/users/amy/cities/id/{city['id']}/photos",
+                           files={"file": ("photo.bin", PHOTO, "application/octet-stream")})
+    assert response.status_code == 201, response.text
+    photo = response.json()["photos"][0]
+    assert photo["ref"] == hashlib.sha256(PHOTO).hexdigest()
+    assert photo["content_type"] == "image/png" and photo["size"] == len(PHOTO)
+    assert photo["url"] == f"/users/amy/photos/{photo['ref']}"
+    with open(tmp_path / "photo_blobs" / photo["ref"][:2] / photo["ref"], "rb") as f:
+        assert f.read() == PHOTO
+
+    # 相同内容以 base64 提交时复用同一个文件
+    response = client.post("/users/amy/cities/0/photos", data={"data": base64.b64encode(PHOTO).decode()})
+    assert response.status_code == 201, response.text
+    assert [p["ref"] for p in response.json()["photos"]] == [photo["ref"]] * 2
+
+
+def test_oversized_upload_is_rejected_without_leftovers(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(travel_router, "MAX_PHOTO_UPLOAD_BYTES", 1024)
+    monkeypatch.setattr(travel_router, "UPLOAD_CHUNK_SIZE", 256)
+    city = _add_city(client, "ben")
+    response = client.post(f"/users/ben/cities/id/{city['id']}/photos", files={"file": ("big.png", PHOTO, "image/png")})
+    assert response.status_code == 413
+    response = client.post(f"/users/ben/cities/id/{city['id']}/photos", data={"data": base64.b64encode(PHOTO).decode()})
+    assert response.status_code == 413
+    assert not _tmp_files(tmp_path / "photo_blobs")
+    assert client.get(f"/users/ben/cities/id/{city['id']}").json()["photos"] == []
+
+
+def test_upload_requires_file_or_data(client):
+    _add_city(client, "cai")
+    assert client.post("/users/cai/cities/0/photos").status_code == 400
+    assert client.post("/users/cai/cities/0/photos", data={"data": "not base64!"}).status_code == 400
+    response = client.post("/users/cai/cities/5/photos", files={"file": ("p.png", PHOTO, "image/png")})
+    assert response.status_code == 404
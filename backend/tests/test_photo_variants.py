@@ -0,0 +1,60 @@
+# backend/tests/test_photo_variants.py
+# 缩略图 / 中等尺寸版本：进程池中生成、缓存复用、无法解码时回退原图
+
+import asyncio
+import io
+
+import pytest
+
+from backend.data_access_layer.photo_blob_store import PhotoBlobStore
+from backend.data_access_layer.photo_variants import VARIANT_SIZES, PhotoVariantService
+
+from .conftest import make_city, register
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def _jpeg(width, height):
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), (200, 30, 30)).save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def variants(tmp_path):
+    service = PhotoVariantService(PhotoBlobStore(str(tmp_path / "photo_blobs")), max_workers=1)
+    yield service
+    service.shutdown()
+
+
+def test_variants_are_rendered_once_and_cached(variants):
+    record = variants.blob_store.put_bytes(_jpeg(2000, 1000))
+    path = asyncio.run(variants.get_variant_path(record["ref"], "thumb"))
+    assert path == variants.path_for(record["ref"], "thumb")
+    with Image.open(path) as image:
+        assert image.format == "JPEG" and image.size == (VARIANT_SIZES["thumb"], VARIANT_SIZES["thumb"] // 2)
+    assert [ref for ref, _ in variants.iter_variant_refs()] == [record["ref"]]
+    # 已生成的版本直接返回路径，不再提交任务
+    variants._pool.shutdown()
+    variants._pool = None
+    assert asyncio.run(variants.get_variant_path(record["ref"], "thumb")) == path
+    assert variants._pool is None
+
+
+def test_undecodable_photo_falls_back_to_none(variants):
+    record = variants.blob_store.put_bytes(b"not an image")
+    assert asyncio.run(variants.get_variant_path(record["ref"], "medium")) is None
+
+
+def test_photo_route_serves_resized_variant(client):
+    register(client, "dana")
+    city = client.post("/users/dana/cities", json=make_city("东京")).json()
+    photo = client.post(f"/users/dana/cities/id/{city['id']}/photos",
+                        files={"file": ("p.jpg", _jpeg(1600, 1200), "image/jpeg")}).json()["photos"][0]
+
+    response = client.get(photo["url"], params={"size": "medium"})
+    assert response.status_code == 200 and response.headers["content-type"] == "image/jpeg"
+    assert response.headers["etag"] == f'"{photo["ref"]}-medium"'
+    with Image.open(io.BytesIO(response.content)) as image:
+        assert image.size == (1024, 768)
+    assert client.get(photo["url"], params={"size": "huge"}).status_code == 400
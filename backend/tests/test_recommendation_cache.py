@@ -0,0 +1,79 @@
+# backend/tests/test_recommendation_cache.py
+# AI 推荐缓存：规范化的键、有效期、写入磁盘后重启继续使用；推荐服务命中缓存时不再调用大模型
+
+import asyncio
+import json
+import os
+
+import httpx
+
+from backend.business_logic_layer import ai_recommendation_service
+from backend.data_access_layer import recommendation_cache
+from backend.data_access_layer.recommendation_cache import RecommendationCache, recommendation_cache_key
+from backend.presentation_layer.schemas import CityInputSchema
+
+RECOMMENDATIONS = [{"city": "京都", "country": "日本", "inferred_preferences": ["历史古迹"], "reason": "古都"}]
+
+
+def test_key_ignores_order_case_width_and_duplicates():
+    key = recommendation_cache_key([("Paris", "France"), ("東京", "日本")])
+    assert recommendation_cache_key([("東京", "日本"), (" paris ", "FRANCE"), ("Ｐａｒｉｓ", "france")]) == key
+    assert recommendation_cache_key([("Paris", "France")]) != key
+    assert recommendation_cache_key([("Paris", "France"), ("東京", "日本")], variant="model-2") != key
+
+
+def test_entries_expire_after_ttl():
+    cache = RecommendationCache(ttl_seconds=0, path=None)
+    cache.put("key", RECOMMENDATIONS)
+    assert cache.get("key") is None
+    cache = RecommendationCache(max_entries=1, ttl_seconds=60, path=None)
+    cache.put("first", RECOMMENDATIONS)
+    cache.put("second", RECOMMENDATIONS)
+    assert (cache.get("first"), cache.get("second")) == (None, RECOMMENDATIONS)
+    assert cache.stats()["persistent"] is False
+
+
+def test_persisted_entries_survive_restart(tmp_path):
+    path = tmp_path / "cache" / "recommendations.json"
+    cache = RecommendationCache(ttl_seconds=60, path=str(path))
+    cache.put("key", RECOMMENDATIONS)
+    # 临时文件写完后被替换，不留在目录中
+    assert os.listdir(path.parent) == ["recommendations.json"]
+
+    assert RecommendationCache(ttl_seconds=60, path=str(path)).get("key") == RECOMMENDATIONS
+    # 磁盘上记录的是绝对过期时间：已过期的条目不再加载
+    data = json.loads(path.read_text(encoding="utf-8"))
+    data["entries"][0]["expires_at"] -= 120
+    path.write_text(json.dumps(data), encoding="utf-8")
+    assert RecommendationCache(ttl_seconds=60, path=str(path)).get("key") is None
+
+    path.write_text("{not json", encoding="utf-8")
+    assert RecommendationCache(ttl_seconds=60, path=str(path)).get("key") is None
+
+
+def test_service_serves_repeated_city_sets_from_cache(monkeypatch):
+    monkeypatch.setattr(ai_recommendation_service, "DEEPSEEK_API_KEY", "test-key")
+    monkeypatch.setattr(ai_recommendation_service, "AI_MODEL_ENDPOINT", "https://ai.example.com/chat")
+    monkeypatch.setattr(recommendation_cache, "_recommendation_cache", RecommendationCache(ttl_seconds=60, path=None))
+    ai_requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert request.url.host == "ai.example.com"  # 京都在离线地名库中，不请求 Nominatim
+        ai_requests.append(request)
+        return httpx.Response(200, json={"choices": [{"message": {"content": json.dumps(RECOMMENDATIONS, ensure_ascii=False)}}]})
+
+    async def recommend_twice():
+        service = ai_recommendation_service.AIRecommendationService()
+        await service.http_client.aclose()
+        service.http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        try:
+            first = await service.get_recommendations([CityInputSchema(city="巴黎", country="法国"), CityInputSchema(city="东京", country="日本")])
+            second = await service.get_recommendations([CityInputSchema(city="东京", country="日本"), CityInputSchema(city="巴黎", country="法国")])
+        finally:
+            await service.aclose()
+        return first, second
+
+    first, second = asyncio.run(recommend_twice())
+    assert len(ai_requests) == 1
+    assert [rec.dict() for rec in first] == [rec.dict() for rec in second]
+    assert (first[0].city, round(first[0].latitude, 2)) == ("京都", 35.01)
@@ -0,0 +1,46 @@
+# backend/tests/test_recommendation_service_lifespan.py
+# AI 推荐服务在应用 lifespan 中只创建一次：所有请求共用同一个 HTTP 连接池，关闭应用时连接池被关闭
+
+import json
+
+import httpx
+from fastapi.testclient import TestClient
+
+from backend.business_logic_layer import ai_recommendation_service
+
+RECOMMENDATIONS = [{"city": "京都", "country": "日本", "inferred_preferences": ["历史古迹"], "reason": "古都"}]
+
+
+def test_service_is_created_once_and_closed_on_shutdown(app, monkeypatch):
+    monkeypatch.setattr(ai_recommendation_service, "DEEPSEEK_API_KEY", "test-key")
+    monkeypatch.setattr(ai_recommendation_service, "AI_MODEL_ENDPOINT", "https://ai.example.com/chat")
+    http_clients, ai_requests = [], []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        ai_requests.append(request)
+        return httpx.Response(200, json={"choices": [{"message": {"content": json.dumps(RECOMMENDATIONS, ensure_ascii=False)}}]})
+
+    def create_http_client() -> httpx.AsyncClient:
+        http_clients.append(httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+        return http_clients[-1]
+
+    monkeypatch.setattr(ai_recommendation_service, "create_http_client", create_http_client)
+
+    with TestClient(app) as client:
+        service = app.state.ai_recommendation_service
+        assert isinstance(service, ai_recommendation_service.AIRecommendationService)
+        # 不同的已访问城市不命中推荐缓存，两次都请求大模型接口
+        for visited in ([{"city": "巴黎", "country": "法国"}], [{"city": "东京", "country": "日本"}]):
+            response = client.post("/ai/recommendations", json={"visitedCities": visited})
+            assert response.status_code == 200
+            assert response.json()[0]["city"] == "京都"
+        assert app.state.ai_recommendation_service is service
+        assert len(ai_requests) == 2 and len(http_clients) == 1
+        assert not service.http_client.is_closed
+
+    assert app.state.ai_recommendation_service is None
+    assert service.http_client.is_closed
+
+    # lifespan 之外 (服务未创建) 的请求返回 503，而不是临时创建服务
+    response = TestClient(app).post("/ai/recommendations", json={"visitedCities": []})
+    assert response.status_code == 503
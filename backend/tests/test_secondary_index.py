@@ -0,0 +1,122 @@
+# backend/tests/test_secondary_index.py
+# email 二级索引：按邮箱查找、索引随更新/删除维护、邮箱唯一 (两种后端都在写入时原子检查，接口返回 409)
+
+import json
+import threading
+
+import pytest
+
+from backend.data_access_layer import user_management_dao
+from backend.data_access_layer.errors import DuplicateEmailError
+
+from .conftest import make_city, make_user, register
+
+
+def test_email_lookup_follows_updates_and_deletes(dao):
+    dao.save_user(make_user("olive"))
+    assert dao.find_user_by_email("olive@example.com")["username"] == "olive"
+
+    dao.update_user("olive", {"email": "new@example.com"})
+    assert dao.find_user_by_email("olive@example.com") is None
+    assert dao.find_user_by_email("new@example.com")["username"] == "olive"
+
+    dao.delete_user("olive")
+    assert dao.find_user_by_email("new@example.com") is None
+    dao.save_user(make_user("other") | {"email": "new@example.com"})  # 删除后邮箱可以再次使用
+    assert dao.find_user_by_email("new@example.com")["username"] == "other"
+
+
+def test_duplicate_email_is_rejected_without_writing(dao):
+    dao.save_user(make_user("paul"))
+    dao.save_user(make_user("quinn"))
+    with pytest.raises(DuplicateEmailError):
+        dao.save_user(make_user("rose") | {"email": "paul@example.com"})
+    assert dao.find_user_by_username("rose") is None
+
+    version = dao.get_user_version("quinn")
+    with pytest.raises(DuplicateEmailError):
+        dao.update_user("quinn", {"email": "paul@example.com", "age": 5})
+    assert dao.get_user_version("quinn") == version
+    assert dao.find_user_by_username("quinn")["email"] == "quinn@example.com"
+    assert dao.find_user_by_email("paul@example.com")["username"] == "paul"
+
+    # 保存自己当前的邮箱不算冲突
+    dao.update_user("paul", {"email": "paul@example.com"})
+    dao.save_user(make_user("paul", [make_city("东京")]))
+
+
+def test_concurrent_registrations_with_same_email(dao):
+    results = []
+
+    def save(username: str):
+        try:
+            dao.save_user(make_user(username) | {"email": "same@example.com"}, overwrite=False)
+            results.append(username)
+        except DuplicateEmailError:
+            pass
+
+    threads = [threading.Thread(target=save, args=(f"user{i}",)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(results) == 1
+    assert dao.find_user_by_email("same@example.com")["username"] == results[0]
+
+
+def test_stale_index_entry_is_not_a_conflict(json_dao):
+    json_dao.save_user(make_user("sam"))
+    # 索引项指向的用户已改用其他邮箱 (例如旧版本写入中途崩溃)
+    with open(user_management_dao.MANIFEST_FILE, encoding="utf-8") as f:
+        manifest = json.load(f)
+    manifest["indexes"]["email"]["stale@example.com"] = "sam"
+    with open(user_management_dao.MANIFEST_FILE, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    json_dao.save_user(make_user("tina") | {"email": "stale@example.com"})
+    assert json_dao.find_user_by_email("stale@example.com")["username"] == "tina"
+
+
+def test_old_manifest_format_rebuilds_indexes(json_dao, monkeypatch):
+    json_dao.save_user(make_user("henry", [make_city("东京")]))
+    with open(user_management_dao.MANIFEST_FILE, encoding="utf-8") as f:
+        manifest = json.load(f)
+    manifest.update(format=2, indexes={"email": {}})
+    with open(user_management_dao.MANIFEST_FILE, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    assert json_dao.find_user_by_email("henry@example.com") is None
+
+    monkeypatch.setattr(user_management_dao, "_storage_ready", False)
+    dao = user_management_dao.UserManagementDAO()
+    with open(user_management_dao.MANIFEST_FILE, encoding="utf-8") as f:
+        assert json.load(f)["format"] == user_management_dao.MANIFEST_FORMAT_VERSION
+    assert dao.find_user_by_email("henry@example.com")["username"] == "henry"
+
+
+def test_duplicate_email_returns_409(client):
+    register(client, "uma")
+    register(client, "vic")
+    response = client.post("/auth/register", json={"username": "walt", "email": "uma@example.com", "password": "x"})
+    assert response.status_code == 409
+    response = client.put("/users/me", params={"username_param": "vic"}, json={"email": "uma@example.com"})
+    assert response.status_code == 409
+    response = client.put("/users/me", params={"username_param": "vic"}, json={"email": "vic2@example.com"})
+    assert response.status_code == 200 and response.json()["email"] == "vic2@example.com"
+
+
+def test_sqlite_migration_makes_email_unique(tmp_path):
+    import sqlite3
+
+    from backend.data_access_layer.models import SCHEMA_MIGRATIONS, init_db
+
+    conn = sqlite3.connect(str(tmp_path / "old.db"), isolation_level=None)
+    for version in range(1, 5):
+        for statement in SCHEMA_MIGRATIONS[version]:
+            conn.execute(statement)
+    conn.execute("PRAGMA user_version = 4")
+    conn.executemany("INSERT INTO users (username, email) VALUES (?, ?)",
+                     [("first", "dup@example.com"), ("second", "dup@example.com"), ("third", None), ("fourth", None)])
+    init_db(conn)
+    assert conn.execute("SELECT username, email FROM users ORDER BY id").fetchall() == [
+        ("first", "dup@example.com"), ("second", None), ("third", None), ("fourth", None)]
+    with pytest.raises(sqlite3.IntegrityError):
+        conn.execute("INSERT INTO users (username, email) VALUES ('fifth', 'dup@example.com')")
@@ -0,0 +1,68 @@
+# backend/tests/test_sharded_store.py
+# 分片 JSON 存储：每用户一个记录文件、manifest、旧 users.json 的一次性迁移
+
+import json
+import os
+import threading
+
+import pytest
+
+from backend.data_access_layer import user_management_dao
+
+from .conftest import make_city, make_user
+
+
+def test_each_user_is_stored_in_its_own_shard(json_dao):
+    json_dao.save_user(make_user("a/b"))
+    json_dao.save_user(make_user("A/B"))
+    paths = {json_dao._shard_path("a/b"), json_dao._shard_path("A/B")}
+    assert len(paths) == 2  # 文件名是用户名的哈希，不受非法字符和大小写影响
+    assert all(os.path.dirname(path) == user_management_dao.USERS_DIR and os.path.exists(path) for path in paths)
+    assert sorted(json_dao.list_usernames()) == ["A/B", "a/b"]
+
+    assert json_dao.delete_user("a/b") is True
+    assert json_dao.delete_user("a/b") is False
+    assert not os.path.exists(json_dao._shard_path("a/b"))
+    assert json_dao.find_user_by_username("a/b") is None
+    assert json_dao.list_usernames() == ["A/B"]
+
+
+def test_overwrite_false_rejects_existing_username(json_dao):
+    json_dao.save_user(make_user("bella"), overwrite=False)
+    with pytest.raises(ValueError):
+        json_dao.save_user(make_user("bella"), overwrite=False)
+
+
+def test_json_store_migrates_legacy_file_once(json_dao, tmp_path, monkeypatch):
+    legacy = {"old": make_user("old", [make_city("东京")]), "broken": "not a record"}
+    (tmp_path / "users.json").write_text(json.dumps(legacy, ensure_ascii=False), encoding="utf-8")
+    os.remove(user_management_dao.MANIFEST_FILE)
+    monkeypatch.setattr(user_management_dao, "_storage_ready", False)
+
+    dao = user_management_dao.UserManagementDAO()
+    assert dao.list_usernames() == ["old"]
+    assert dao.find_user_by_username("old")["travel_trails"][0]["cities"][0]["id"]
+    assert dao.find_user_by_email("old@example.com")["username"] == "old"
+
+    # 迁移每个进程只做一次：之后 users.json 的变化不会再被读取
+    (tmp_path / "users.json").write_text(json.dumps({"new": make_user("new")}), encoding="utf-8")
+    os.remove(user_management_dao.MANIFEST_FILE)
+    assert user_management_dao.UserManagementDAO().list_usernames() == []
+
+
+def test_concurrent_instances_migrate_once(json_dao, tmp_path, monkeypatch):
+    (tmp_path / "users.json").write_text(json.dumps({"old": make_user("old")}), encoding="utf-8")
+    os.remove(user_management_dao.MANIFEST_FILE)
+    monkeypatch.setattr(user_management_dao, "_storage_ready", False)
+    calls = []
+    migrate = user_management_dao.UserManagementDAO._migrate_legacy_users_file
+    monkeypatch.setattr(user_management_dao.UserManagementDAO, "_migrate_legacy_users_file",
+                        lambda self: calls.append(1) or migrate(self))
+
+    threads = [threading.Thread(target=user_management_dao.UserManagementDAO) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert calls == [1]
+    assert user_management_dao.UserManagementDAO().list_usernames() == ["old"]
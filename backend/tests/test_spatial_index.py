@@ -0,0 +1,118 @@
+# backend/tests/test_spatial_index.py
+# geohash 空间索引：编码、bbox (含跨越 180° 经线) 与半径查询、增量维护、并发写入时通知的顺序；
+# 空间查询接口只返回当前用户的城市
+
+import threading
+import time
+
+from backend.data_access_layer.spatial_index import (
+    SpatialIndex, cover_bbox, geohash_encode, radius_bboxes, split_bbox,
+)
+
+from .conftest import make_city, make_user, register
+
+FIJI = make_city("苏瓦", "斐济", -18.14, 178.44)
+TAVEUNI = make_city("塔韦乌尼", "斐济", -16.85, -179.97)
+KYOTO = make_city("京都", "日本", 35.01, 135.77)
+
+
+def build_index(dao) -> SpatialIndex:
+    index = SpatialIndex(dao)
+    dao.add_listener(index.on_trail_change)
+    index.ensure_built()
+    return index
+
+
+def city_names(cities):
+    return sorted(city["city"] for city in cities)
+
+
+def test_geohash_matches_reference_values():
+    assert geohash_encode(57.64911, 10.40744, 11) == "u4pruydqqvj"
+    assert geohash_encode(42.6, -5.6, 5) == "ezs42"
+    assert geohash_encode(90.0, 180.0, 3) == "zzz"
+    assert geohash_encode(-90.0, -180.0, 3) == "000"
+
+
+def test_bbox_cover_and_antimeridian_split():
+    assert split_bbox(170.0, -20.0, -170.0, -10.0) == [(170.0, -20.0, 180.0, -10.0), (-180.0, -20.0, -170.0, -10.0)]
+    cells = cover_bbox((135.0, 34.0, 136.0, 36.0))
+    assert 0 < len(cells) <= 64
+    assert any(geohash_encode(35.01, 135.77).startswith(cell) for cell in cells)
+    # 跨越 180° 经线的圆拆成两个范围
+    assert len(radius_bboxes(-17.0, 179.9, 100.0)) == 2
+
+
+def test_bbox_and_radius_queries(dao):
+    dao.save_user(make_user("una", [FIJI, TAVEUNI, KYOTO]))
+    dao.save_user(make_user("vic", [make_city("大阪", latitude=34.69, longitude=135.50)]))
+    index = build_index(dao)
+
+    cities, total = index.query_bbox(178.0, -20.0, -179.0, -16.0)
+    assert (city_names(cities), total) == (["塔韦乌尼", "苏瓦"], 2)
+    cities, total = index.query_bbox(130.0, 30.0, 140.0, 40.0, username="una")
+    assert (city_names(cities), total) == (["京都"], 1)
+    cities, total = index.query_bbox(130.0, 30.0, 140.0, 40.0, limit=1)
+    assert (len(cities), total) == (1, 2)
+
+    nearby, total = index.query_radius(-17.0, 179.9, 300.0)
+    assert [city["city"] for city in nearby] == ["塔韦乌尼", "苏瓦"]  # 按距离从近到远
+    assert nearby[0]["distance_km"] < nearby[1]["distance_km"] <= 300.0
+    assert index.query_radius(34.8, 135.6, 30.0, username="vic")[0][0]["city"] == "大阪"
+
+
+def test_index_follows_incremental_changes(dao):
+    dao.save_user(make_user("wes", [KYOTO]))
+    index = build_index(dao)
+
+    added = dao.add_city("wes", FIJI)
+    assert index.query_radius(-18.14, 178.44, 1.0, username="wes")[1] == 1
+    dao.add_cities("wes", [TAVEUNI, make_city("坐标无效", latitude=95.0, longitude=0.0)])
+    assert index.stats()["cities"] == 3
+    dao.remove_city("wes", added["id"])
+    assert city_names(index.query_bbox(-180.0, -90.0, 180.0, 90.0)[0]) == ["京都", "塔韦乌尼"]
+    dao.update_user("wes", {"travel_trails": [{"cities": [FIJI]}]})
+    assert city_names(index.query_bbox(-180.0, -90.0, 180.0, 90.0)[0]) == ["苏瓦"]
+    dao.delete_user("wes")
+    assert index.stats() == {"built": True, "cities": 0, "users": 0}
+
+
+def test_concurrent_writes_reach_listeners_in_commit_order(dao):
+    """较早的写入在通知时被拖慢：通知若在释放写锁之后才发出，较新的写入会先通知，索引最后留下旧轨迹。"""
+    dao.save_user(make_user("xia", [KYOTO]))
+    slow_notify_started = threading.Event()
+
+    def slow_listener(event, username, cities):
+        if cities and cities[0]["city"] == "旧":
+            slow_notify_started.set()
+            time.sleep(0.2)
+
+    dao.add_listener(slow_listener)
+    index = build_index(dao)
+
+    older = threading.Thread(target=dao.update_user, args=("xia", {"travel_trails": [{"cities": [make_city("旧")]}]}))
+    older.start()
+    assert slow_notify_started.wait(5)
+    dao.update_user("xia", {"travel_trails": [{"cities": [make_city("新")]}]})
+    older.join()
+
+    assert dao.list_city_columns("xia", ("city",))["city"] == ["新"]
+    assert city_names(index.query_bbox(-180.0, -90.0, 180.0, 90.0, username="xia")[0]) == ["新"]
+
+
+def test_geo_routes_only_return_callers_cities(client):
+    for username, city in (("yan", KYOTO), ("zoe", make_city("大阪", latitude=34.69, longitude=135.50))):
+        register(client, username)
+        assert client.post(f"/users/{username}/cities", json=city).status_code == 201
+
+    response = client.get("/geo/cities", params={"bbox": "130,30,140,40", "username_param": "yan"})
+    assert response.status_code == 200
+    assert [(city["username"], city["city"]) for city in response.json()] == [("yan", "京都")]
+    assert response.headers["X-Total-Count"] == "1"
+    response = client.get("/geo/cities/nearby", params={"lat": 34.7, "lon": 135.5, "radius_km": 100, "username_param": "zoe"})
+    assert [city["city"] for city in response.json()] == ["大阪"]
+
+    # 不指定当前用户时不返回任何人的城市
+    assert client.get("/geo/cities", params={"bbox": "130,30,140,40"}).status_code == 422
+    assert client.get("/geo/cities/nearby", params={"lat": 34.7, "lon": 135.5}).status_code == 422
+    assert client.get("/geo/cities", params={"bbox": "1,2,3", "username_param": "yan"}).status_code == 400
@@ -0,0 +1,87 @@
+# backend/tests/test_sqlite_store.py
+# SQLite 存储：与 JSON 后端结果一致、模式迁移、JSON 存储一次性导入、快照读取
+
+import sqlite3
+
+from backend.data_access_layer.models import SCHEMA_MIGRATIONS, SCHEMA_VERSION, init_db
+from backend.data_access_layer.sqlite_user_dao import SQLiteUserManagementDAO
+
+from .conftest import make_city, make_user, run_mutations, trail_summary
+
+
+def test_mutations_produce_same_trail_on_both_backends(json_dao, sqlite_dao):
+    run_mutations(json_dao, "alice")
+    run_mutations(sqlite_dao, "alice")
+    expected = trail_summary(json_dao.find_user_by_username("alice"))
+    assert expected["cities"] == [
+        ("大阪", "日本", "train", "", ["cd" * 32]),
+        ("巴黎", "法国", "plane", "铁塔", []),
+        ("里昂", "法国", "train", "", []),
+    ]
+    assert trail_summary(sqlite_dao.find_user_by_username("alice")) == expected
+    assert json_dao.get_trail_stats("alice") == sqlite_dao.get_trail_stats("alice")
+
+
+def test_sqlite_schema_migrates_from_first_version(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "old.db"), isolation_level=None)
+    for statement in SCHEMA_MIGRATIONS[1]:
+        conn.execute(statement)
+    conn.execute("PRAGMA user_version = 1")
+    conn.execute("INSERT INTO users (username) VALUES ('old')")
+    conn.execute("INSERT INTO cities (user_id, position, city, country, latitude, longitude) VALUES (1, 0, '东京', '日本', 35.68, 139.69)")
+
+    init_db(conn)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+    public_id, = conn.execute("SELECT public_id FROM cities").fetchone()
+    assert public_id and len(public_id) == 32
+    # 旧版本只在空库时导入过 JSON 存储：已有用户的库视为已导入
+    assert conn.execute("SELECT 1 FROM store_meta WHERE key = 'json_store_imported'").fetchone()
+
+
+def test_generated_ids_are_written_back(sqlite_dao):
+    user = make_user("henry", [make_city("东京")])
+    sqlite_dao.save_user(user)
+    city = make_city("大阪")
+    photo = {"ref": "ab" * 32, "content_type": "image/jpeg", "size": 3}
+    city["photos"] = [photo]
+    added = sqlite_dao.add_city("henry", city)
+    assert city["id"] == added["id"]
+    assert photo["id"] == added["photos"][0]["id"]
+    assert user["travel_trails"][0]["cities"][0]["id"] == sqlite_dao.get_city("henry", 0)["id"]
+
+
+def test_json_store_is_imported_once(json_dao, tmp_path):
+    json_dao.save_user(make_user("ivy", [make_city("东京")]))
+    db_path = str(tmp_path / "import.db")
+    SQLiteUserManagementDAO(db_path).delete_user("ivy")
+    # 再次启动不会把已删除的用户重新导入
+    assert SQLiteUserManagementDAO(db_path).find_user_by_username("ivy") is None
+
+
+def test_json_import_skips_existing_usernames_and_emails(json_dao, tmp_path):
+    json_dao.save_user(make_user("jack", [make_city("东京")]))
+    json_dao.save_user(dict(make_user("kate"), email="shared@example.com"))
+    db_path = str(tmp_path / "import.db")
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    init_db(conn)  # 空库：尚未导入
+    conn.execute("INSERT INTO users (username, email) VALUES ('jack', 'jack@db.example.com')")
+    conn.execute("INSERT INTO users (username, email) VALUES ('nora', 'shared@example.com')")
+    conn.close()
+
+    sqlite_dao = SQLiteUserManagementDAO(db_path)
+    jack = sqlite_dao.find_user_by_username("jack")
+    assert jack["email"] == "jack@db.example.com"
+    assert sqlite_dao.list_city_columns("jack", ("city",)) == {"city": []}
+    kate = sqlite_dao.find_user_by_username("kate")
+    assert kate is not None and kate["email"] is None
+
+
+def test_multi_query_reads_use_one_snapshot(sqlite_dao):
+    sqlite_dao.save_user(make_user("mia", [make_city("东京")]))
+    conn = sqlite_dao._conn()
+    with sqlite_dao._read_transaction() as read_conn:
+        assert read_conn is conn and conn.in_transaction
+        # 嵌套读取复用同一个事务
+        assert sqlite_dao.find_user_by_username("mia")["travel_trails"][0]["cities"][0]["city"] == "东京"
+        assert conn.in_transaction
+    assert not conn.in_transaction
@@ -0,0 +1,109 @@
+# backend/tests/test_trail_aggregates.py
+# 增量维护的统计聚合值 (trail_aggregates)：增删城市、调整顺序后与从城市重新计算的结果一致；
+# SQLite 的统计读取不写入，聚合值缺失的旧数据在启动时补算；统计接口的 ETag
+
+import sqlite3
+
+from backend.business_logic_layer.trail_statistics import STATS_CITY_FIELDS, compute_trail_statistics, diff_trail_statistics
+from backend.data_access_layer.sqlite_user_dao import SQLiteUserManagementDAO
+from backend.data_access_layer.trail_aggregates import build_trail_aggregates, segment_km, summarize_trail_aggregates
+
+from .conftest import TRAIL_CITIES, make_city, make_user, register
+
+
+def assert_stats_match_cities(dao, username: str):
+    stored = dao.get_trail_stats(username)
+    computed = compute_trail_statistics(dao.list_city_columns(username, STATS_CITY_FIELDS))
+    assert diff_trail_statistics(stored, computed) == {}
+    return computed
+
+
+def test_aggregates_track_add_remove_and_reorder(dao):
+    dao.save_user(make_user("ivy", TRAIL_CITIES[:2]))
+    assert_stats_match_cities(dao, "ivy")
+
+    dao.add_city("ivy", TRAIL_CITIES[2])
+    dao.add_cities("ivy", TRAIL_CITIES[3:])
+    stats = assert_stats_match_cities(dao, "ivy")
+    assert stats["city_count"] == 5
+    assert stats["unique_city_count"] == 4
+    assert stats["countries"] == {"日本": 3, "法国": 2}
+    assert stats["by_month"] == {"2023-04": 2, "2023-05": 1, "2024-01": 1}
+    assert stats["transport_modes"]["unknown"]["cities"] == 1
+
+    # 删除中间的城市：前后两段路程被一段直连替代
+    dao.remove_city("ivy", 2)
+    assert_stats_match_cities(dao, "ivy")
+    dao.remove_city("ivy", 0)
+    dao.remove_city("ivy", dao.get_trail_stats("ivy")["city_count"] - 1)
+    assert assert_stats_match_cities(dao, "ivy")["city_count"] == 2
+
+    # 调整顺序 (整体替换轨迹)
+    reordered = list(reversed(TRAIL_CITIES))
+    dao.update_user("ivy", {"travel_trails": [{"cities": reordered}]})
+    stats = assert_stats_match_cities(dao, "ivy")
+    assert stats["total_distance_km"] == round(sum(
+        segment_km(previous, city) for previous, city in zip(reordered, reordered[1:])), 3)
+
+
+def test_removing_all_cities_leaves_empty_stats(dao):
+    dao.save_user(make_user("jack", TRAIL_CITIES[:3]))
+    for _ in range(3):
+        dao.remove_city("jack", 0)
+    stats = assert_stats_match_cities(dao, "jack")
+    assert stats["city_count"] == 0
+    assert stats["total_distance_km"] == 0
+    assert stats["transport_modes"] == {}
+
+
+def test_rebuild_from_cities_matches_vectorized_engine():
+    cities = TRAIL_CITIES + [make_city("未知地点", "", latitude=None, longitude=None)]
+    columns = {field: [city.get(field) for city in cities] for field in STATS_CITY_FIELDS}
+    assert diff_trail_statistics(summarize_trail_aggregates(build_trail_aggregates(cities)),
+                                 compute_trail_statistics(columns)) == {}
+
+
+def _trail_stats_column(db_path: str, username: str):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("SELECT trail_stats FROM users WHERE username = ?", (username,)).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_sqlite_stats_read_path_does_not_write(sqlite_dao):
+    sqlite_dao.save_user(make_user("kai", TRAIL_CITIES))
+    expected = sqlite_dao.get_trail_stats("kai")
+    # 模拟增加 trail_stats 列之前写入的旧数据
+    sqlite_dao._conn().execute("UPDATE users SET trail_stats = NULL WHERE username = 'kai'")
+    assert sqlite_dao.get_trail_stats("kai") == expected
+    assert _trail_stats_column(sqlite_dao.db_path, "kai") is None
+    assert not sqlite_dao._conn().in_transaction
+
+    # 重新启动时补算并保存
+    SQLiteUserManagementDAO(sqlite_dao.db_path)
+    assert _trail_stats_column(sqlite_dao.db_path, "kai") is not None
+    assert sqlite_dao.get_trail_stats("kai") == expected
+
+
+def test_replacing_the_trail_stores_fresh_aggregates(sqlite_dao):
+    sqlite_dao.save_user(make_user("lena", TRAIL_CITIES[:2]))
+    sqlite_dao.update_user("lena", {"travel_trails": [{"cities": TRAIL_CITIES[2:]}]})
+    assert _trail_stats_column(sqlite_dao.db_path, "lena") is not None
+    assert_stats_match_cities(sqlite_dao, "lena")
+
+
+def test_stats_route_etag(client):
+    register(client, "milo")
+    client.post("/users/milo/cities", json=TRAIL_CITIES[0])
+    response = client.get("/users/milo/stats")
+    assert response.status_code == 200 and response.json()["city_count"] == 1
+    etag = response.headers["etag"]
+    assert client.get("/users/milo/stats", headers={"If-None-Match": etag}).status_code == 304
+    client.post("/users/milo/cities", json=TRAIL_CITIES[1])
+    response = client.get("/users/milo/stats", headers={"If-None-Match": etag})
+    assert response.status_code == 200 and response.json()["city_count"] == 2
+
+    response = client.post("/users/milo/stats/rebuild")
+    assert response.status_code == 200 and response.headers["etag"] == client.get("/users/milo/stats").headers["etag"]
+    assert client.get("/users/nobody/stats").status_code == 404
@@ -0,0 +1,75 @@
+# backend/tests/test_trail_export.py
+# 轨迹存档导出接口：ZIP (GeoJSON + 博客 + 照片文件) 与 NDJSON，导出的 GeoJSON 可以再导入
+
+import base64
+import io
+import json
+import zipfile
+
+from backend.business_logic_layer import trail_export_service
+
+from .conftest import make_city, register
+
+PHOTO = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 400
+
+
+def _trail(client, username):
+    register(client, username)
+    tokyo = client.post(f"/users/{username}/cities", json=make_city("东京", transport_mode="plane")).json()
+    client.post(f"/users/{username}/cities", json=make_city("大阪", latitude=34.69, longitude=135.50))
+    client.put(f"/users/{username}/cities/id/{tokyo['id']}/blog", json={"blog": "第一天\n浅草寺"})
+    for city_index in (0, 1):  # 两个城市引用同一张照片，存档中只有一份
+        response = client.post(f"/users/{username}/cities/{city_index}/photos", files={"file": ("p.png", PHOTO, "image/png")})
+        assert response.status_code == 201, response.text
+    return response.json()["photos"][0]["ref"]
+
+
+def archive_geojson(content: bytes) -> bytes:
+    with zipfile.ZipFile(io.BytesIO(content)) as archive:
+        return archive.read("trail.geojson")
+
+
+def test_zip_export(client, monkeypatch):
+    monkeypatch.setattr(trail_export_service, "EXPORT_CHUNK_SIZE", 3 * 1024)  # 照片分多块写入
+    ref = _trail(client, "pia")
+    response = client.get("/users/pia/export")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/zip" and response.headers["cache-control"] == "no-store"
+    assert "pia-trail.zip" in response.headers["content-disposition"]
+
+    with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+        assert archive.testzip() is None
+        names = archive.namelist()
+        assert names == ["trail.geojson", "blogs/0001-东京.txt", f"photos/{ref}.png"]
+        trail = json.loads(archive.read("trail.geojson"))
+        assert archive.read(names[1]).decode("utf-8") == "第一天\n浅草寺"
+        assert archive.read(names[2]) == PHOTO
+    assert (trail["type"], trail["username"], trail["city_count"]) == ("FeatureCollection", "pia", 2)
+    tokyo, osaka = trail["features"]
+    assert tokyo["geometry"]["coordinates"] == [139.69, 35.68]
+    assert tokyo["properties"]["blog_file"] == "blogs/0001-东京.txt"
+    assert osaka["properties"]["photos"][0]["file"] == f"photos/{ref}.png"
+
+    # 导出的 GeoJSON 可以直接导入
+    register(client, "quin")
+    job = client.post("/users/quin/cities/import", content=archive_geojson(response.content)).json()
+    assert (job["format"], job["imported"]) == ("geojson", 2)
+
+
+def test_ndjson_export(client, monkeypatch):
+    monkeypatch.setattr(trail_export_service, "EXPORT_CHUNK_SIZE", 3 * 1024)
+    ref = _trail(client, "rae")
+    response = client.get("/users/rae/export", params={"format": "ndjson"})
+    assert response.status_code == 200 and response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["type"] for line in lines] == ["TrailExport", "Feature", "Feature", "Photo"]
+    assert lines[1]["properties"]["blog"] == "第一天\n浅草寺"
+    assert lines[3]["ref"] == ref and base64.b64decode(lines[3]["data"]) == PHOTO
+
+
+def test_export_errors(client):
+    assert client.get("/users/nobody/export").status_code == 404
+    register(client, "sam")
+    assert client.get("/users/sam/export", params={"format": "tar"}).status_code == 422
+    response = client.get("/users/sam/export", params={"format": "ndjson"})
+    assert [json.loads(line)["city_count"] for line in response.text.splitlines()] == [0]
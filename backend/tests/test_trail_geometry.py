@@ -0,0 +1,122 @@
+# backend/tests/test_trail_geometry.py
+# 球面 Douglas-Peucker 的重要度：按任意容差筛选的结果与直接按该容差递归简化一致；
+# 轨迹几何接口的两种格式、ETag 与 304、数据变化后缓存失效
+
+import numpy as np
+import pytest
+
+from backend.business_logic_layer.trail_geometry import (
+    _unit_vectors, douglas_peucker_importance, encode_float32, encode_polyline, segment_distance_km, zoom_tolerance_km,
+)
+
+from .conftest import TRAIL_CITIES, make_city, register
+
+
+def reference_simplify(latitudes: np.ndarray, longitudes: np.ndarray, tolerance_km: float) -> list:
+    """逐个区间递归的 Douglas-Peucker (对照实现)，返回保留的点的位置。"""
+    points = _unit_vectors(latitudes, longitudes)
+    keep = {0, len(points) - 1}
+
+    def simplify(first: int, last: int):
+        if last - first < 2:
+            return
+        distances = segment_distance_km(points[first + 1:last], points[first], points[last])
+        split = first + 1 + int(np.argmax(distances))
+        if distances[split - first - 1] > tolerance_km:
+            keep.add(split)
+            simplify(first, split)
+            simplify(split, last)
+
+    simplify(0, len(points) - 1)
+    return sorted(keep)
+
+
+def random_trail(count: int, seed: int):
+    rng = np.random.default_rng(seed)
+    # 随机游走，模拟相邻城市距离不等的轨迹
+    latitudes = np.clip(np.cumsum(rng.normal(0, 2, count)) + 30, -80, 80)
+    longitudes = (np.cumsum(rng.normal(0, 3, count)) + 180) % 360 - 180
+    return latitudes, longitudes
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+@pytest.mark.parametrize("tolerance_km", [0.0, 5.0, 50.0, 300.0, 2000.0])
+def test_importance_threshold_matches_direct_simplification(seed, tolerance_km):
+    latitudes, longitudes = random_trail(200, seed)
+    importance = douglas_peucker_importance(latitudes, longitudes)
+    assert np.flatnonzero(importance > tolerance_km).tolist() == reference_simplify(latitudes, longitudes, tolerance_km)
+
+
+def test_importance_edge_cases():
+    assert douglas_peucker_importance(np.array([]), np.array([])).tolist() == []
+    assert douglas_peucker_importance(np.array([10.0]), np.array([20.0])).tolist() == [np.inf]
+    assert douglas_peucker_importance(np.array([10.0, 11.0]), np.array([20.0, 21.0])).tolist() == [np.inf, np.inf]
+
+    # 赤道上的共线点不影响形状，重要度为 0；偏离的点重要度约等于偏离距离
+    straight = douglas_peucker_importance(np.zeros(5), np.arange(5.0))
+    assert straight[1:-1].tolist() == pytest.approx([0, 0, 0], abs=1e-6)
+    spike = douglas_peucker_importance(np.array([0.0, 1.0, 0.0]), np.array([0.0, 1.0, 2.0]))
+    assert spike[1] == pytest.approx(111.2, abs=0.5)
+
+    # 首尾重合的环线 (退化的弧) 按到端点的距离计算
+    loop = douglas_peucker_importance(np.array([0.0, 1.0, 0.0]), np.array([0.0, 0.0, 0.0]))
+    assert loop[1] == pytest.approx(111.2, abs=0.5)
+
+
+def test_child_importance_never_exceeds_parent():
+    latitudes, longitudes = random_trail(500, 7)
+    importance = douglas_peucker_importance(latitudes, longitudes)
+    # 更大的容差保留的点集一定是更小容差结果的子集
+    previous = None
+    for tolerance_km in (1000.0, 100.0, 10.0, 1.0):
+        kept = set(np.flatnonzero(importance > tolerance_km).tolist())
+        if previous is not None:
+            assert previous <= kept
+        previous = kept
+
+
+def test_encodings():
+    latitudes, longitudes = np.array([38.5, 40.7, 43.252]), np.array([-120.2, -120.95, -126.453])
+    # Google Encoded Polyline 文档中的示例
+    assert encode_polyline(latitudes, longitudes) == "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+    assert np.frombuffer(encode_float32(latitudes, longitudes), dtype="<f4").tolist() == pytest.approx(
+        [-120.2, 38.5, -120.95, 40.7, -126.453, 43.252], abs=1e-4)
+    assert zoom_tolerance_km(1) == pytest.approx(zoom_tolerance_km(0) / 2)
+
+
+def test_geometry_route_formats_and_etag(client):
+    register(client, "abe")
+    for city in TRAIL_CITIES:
+        assert client.post("/users/abe/cities", json=city).status_code == 201
+
+    response = client.get("/users/abe/trail/geometry")
+    assert response.status_code == 200
+    body = response.json()
+    assert (body["tolerance_km"], body["original_count"], body["point_count"]) == (0.0, 5, 5)
+    assert body["indices"] == [0, 1, 2, 3, 4]
+    latitudes = np.array([city["latitude"] for city in TRAIL_CITIES])
+    longitudes = np.array([city["longitude"] for city in TRAIL_CITIES])
+    assert body["polyline"] == encode_polyline(latitudes, longitudes)
+
+    # 容差大于东京-京都的偏离时只保留轨迹的主要拐点
+    simplified = client.get("/users/abe/trail/geometry", params={"tolerance_km": 2000}).json()
+    assert simplified["indices"][0] == 0 and simplified["indices"][-1] == 4
+    assert simplified["point_count"] < 5
+
+    binary = client.get("/users/abe/trail/geometry", params={"format": "f32", "zoom": 3})
+    assert binary.headers["content-type"] == "application/octet-stream"
+    points = np.frombuffer(binary.content, dtype="<f4")
+    assert len(points) == 2 * int(binary.headers["X-Point-Count"])
+    assert binary.headers["X-Original-Count"] == "5"
+
+    etag = response.headers["ETag"]
+    assert etag != binary.headers["ETag"]
+    cached = client.get("/users/abe/trail/geometry", headers={"If-None-Match": etag})
+    assert (cached.status_code, cached.content) == (304, b"")
+    # 新增城市后版本变化，旧 ETag 不再匹配
+    assert client.post("/users/abe/cities", json=make_city("大阪", latitude=34.69, longitude=135.50)).status_code == 201
+    refreshed = client.get("/users/abe/trail/geometry", headers={"If-None-Match": etag})
+    assert refreshed.status_code == 200 and refreshed.json()["original_count"] == 6
+
+    assert client.get("/users/nobody/trail/geometry").status_code == 404
+    assert client.get("/users/abe/trail/geometry", params={"format": "svg"}).status_code == 422
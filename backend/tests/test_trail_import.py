@@ -0,0 +1,171 @@
+# backend/tests/test_trail_import.py
+# 流式导入：三种格式的增量解析 (任意切块结果相同)、无效记录的拒绝、无法解析的输入中止导入、导入接口
+
+import asyncio
+import json
+
+import pytest
+
+from backend.business_logic_layer.trail_import_service import (
+    ImportFormatError, ImportJobRegistry, TrailImportService, _GeoJsonParser, _GpxParser, _NdjsonParser,
+    resolve_import_format, sniff_import_format,
+)
+from backend.data_access_layer.async_user_dao import AsyncUserDAO
+
+from .conftest import make_city, make_user, register
+
+GPX = """<?xml version="1.0" encoding="UTF-8"?>
+<gpx version="1.1" xmlns="http://www.topografix.com/GPX/1/1">
+  <wpt lat="35.68" lon="139.69"><name>东京</name><type>plane</type><time>2023-04-01T10:00:00</time></wpt>
+  <trk><trkseg>
+    <trkpt lat="35.01" lon="135.77"><desc>寺庙</desc></trkpt>
+    <trkpt lat="not-a-number" lon="135.50"><name>坏点</name></trkpt>
+  </trkseg></trk>
+</gpx>
+"""
+
+GEOJSON = json.dumps({
+    "type": "FeatureCollection",
+    "name": "trip",
+    "features": [
+        {"type": "Feature", "properties": {"city": "巴黎", "country": "法国", "transport_mode": "plane"},
+         "geometry": {"type": "Point", "coordinates": [2.35, 48.86]}},
+        {"type": "Feature", "properties": {"country": "法国"},
+         "geometry": {"type": "LineString", "coordinates": [[4.84, 45.76], [5.37, 43.30]]}},
+        {"type": "Feature", "properties": {"city": "多边形"}, "geometry": {"type": "Polygon", "coordinates": []}},
+    ],
+    "bbox": [2.35, 43.30, 5.37, 48.86],
+}, ensure_ascii=False)
+
+NDJSON = "\n".join([
+    json.dumps(make_city("大阪", latitude=34.69, longitude=135.50), ensure_ascii=False),
+    "{not json",
+    json.dumps({"city": "缺少坐标", "country": "日本"}, ensure_ascii=False),
+    json.dumps(make_city("越界", latitude=120, longitude=0), ensure_ascii=False),
+    json.dumps(make_city("日期错误", visit_date="yesterday"), ensure_ascii=False),
+    "[1, 2]",
+    "",
+    json.dumps({"type": "Feature", "properties": {"city": "京都", "country": "日本"},
+                "geometry": {"type": "Point", "coordinates": [135.77, 35.01]}}, ensure_ascii=False),
+])
+
+
+def parse_in_chunks(parser, data: bytes, chunk_size: int):
+    records = []
+    for start in range(0, len(data), chunk_size):
+        records.extend(parser.feed(data[start:start + chunk_size]))
+    records.extend(parser.close())
+    return records
+
+
+@pytest.mark.parametrize("parser_class, text", [(_GpxParser, GPX), (_GeoJsonParser, GEOJSON), (_NdjsonParser, NDJSON)])
+@pytest.mark.parametrize("chunk_size", [1, 7, 64, 1 << 20])
+def test_parsers_are_independent_of_chunking(parser_class, text, chunk_size):
+    data = text.encode("utf-8")  # 多字节字符会被切在块边界上
+    expected = parse_in_chunks(parser_class(), data, len(data))
+    records = parse_in_chunks(parser_class(), data, chunk_size)
+    assert [getattr(record, "message", record) for record in records] == \
+           [getattr(record, "message", record) for record in expected]
+
+
+def test_gpx_parser_reads_points():
+    records = parse_in_chunks(_GpxParser(), GPX.encode("utf-8"), 16)
+    assert [record["city"] for record in records] == ["东京", None, "坏点"]
+    assert records[0]["transport_mode"] == "plane"
+    assert records[1]["blog"] == "寺庙"
+
+
+@pytest.mark.parametrize("parser_class, text", [
+    (_GeoJsonParser, '{"type": "Feature", "geometry": null}'),
+    (_GeoJsonParser, '{"type": "FeatureCollection", "features": [{"type": "Feature"'),
+    (_GeoJsonParser, '[1, 2]'),
+    (_GpxParser, "<gpx><wpt></gpx>"),
+])
+def test_parsers_reject_malformed_input(parser_class, text):
+    with pytest.raises(ImportFormatError):
+        parse_in_chunks(parser_class(), text.encode("utf-8"), 8)
+
+
+def test_format_detection():
+    assert resolve_import_format("GPX", None) == "gpx"
+    assert resolve_import_format(None, "application/geo+json; charset=utf-8") == "geojson"
+    assert resolve_import_format(None, "application/octet-stream") is None
+    with pytest.raises(ImportFormatError):
+        resolve_import_format("kml", None)
+    assert sniff_import_format(b"\xef\xbb\xbf  <?xml") == "gpx"
+    assert sniff_import_format(GEOJSON.encode("utf-8")) == "geojson"
+    assert sniff_import_format(NDJSON.encode("utf-8")) == "ndjson"
+    with pytest.raises(ImportFormatError):
+        sniff_import_format(b"city,country")
+
+
+async def _chunks(data: bytes, chunk_size: int):
+    for start in range(0, len(data), chunk_size):
+        yield data[start:start + chunk_size]
+
+
+def run_import(dao, username: str, text: str, import_format=None):
+    """按 64 字节切块上传 (首块足够判断格式)，每 2 条写入一批。"""
+    service = TrailImportService(AsyncUserDAO(dao), ImportJobRegistry(), batch_size=2)
+    return asyncio.run(service.import_stream(username, _chunks(text.encode("utf-8"), 64), import_format))
+
+
+def test_import_rejects_malformed_records(dao):
+    dao.save_user(make_user("kate", [make_city("东京")]))
+    job = run_import(dao, "kate", NDJSON)
+    assert job["status"] == "completed"
+    assert (job["imported"], job["rejected"]) == (2, 5)
+    assert [error["record"] for error in job["errors"]] == [2, 3, 4, 5, 6]
+    assert "JSON" in job["errors"][0]["error"]
+    assert "经纬度超出范围" in job["errors"][2]["error"]
+    cities = dao.list_city_columns("kate", ("city", "latitude"))
+    assert cities["city"] == ["东京", "大阪", "京都"]
+
+
+def test_import_geojson_and_gpx(dao):
+    dao.save_user(make_user("liam"))
+    job = run_import(dao, "liam", GEOJSON)
+    assert (job["format"], job["imported"], job["rejected"]) == ("geojson", 3, 1)
+    job = run_import(dao, "liam", GPX)
+    assert (job["format"], job["imported"], job["rejected"]) == ("gpx", 2, 1)
+    # 线要素的顶点和没有名称的轨迹点用坐标作为名称
+    assert dao.list_city_columns("liam", ("city",))["city"] == [
+        "巴黎", "45.7600, 4.8400", "43.3000, 5.3700", "东京", "35.0100, 135.7700"]
+
+
+def test_import_aborts_on_unparsable_input_and_keeps_earlier_batches(dao):
+    dao.save_user(make_user("mia"))
+    broken = GEOJSON[:GEOJSON.index('"bbox"')] + "!!"
+    with pytest.raises(ImportFormatError):
+        run_import(dao, "mia", broken)
+    assert len(dao.list_city_columns("mia", ("city",))["city"]) == 2  # 第一批 (2 条) 已写入
+
+
+def test_import_for_missing_user_fails(dao):
+    with pytest.raises(LookupError):
+        run_import(dao, "nobody", NDJSON)
+
+
+def test_import_route_streams_body_and_reports_progress(client):
+    register(client, "nina")
+    response = client.post("/users/nina/cities/import", params={"job_id": "trip-1"},
+                           content=GEOJSON.encode("utf-8"), headers={"Content-Type": "application/geo+json"})
+    assert response.status_code == 200, response.text
+    job = response.json()
+    assert (job["job_id"], job["format"], job["status"]) == ("trip-1", "geojson", "completed")
+    assert (job["imported"], job["rejected"], job["bytes_received"]) == (3, 1, len(GEOJSON.encode("utf-8")))
+    assert client.get("/users/nina/cities/import/trip-1").json() == job
+    assert client.get("/users/nina/cities").headers["x-total-count"] == "3"
+    # 已结束的任务 id 可以复用，进度接口返回新的任务
+    response = client.post("/users/nina/cities/import", params={"job_id": "trip-1"}, content=NDJSON.encode("utf-8"))
+    assert response.status_code == 200 and response.json()["format"] == "ndjson"
+    assert client.get("/users/nina/cities/import/trip-1").json()["imported"] == 2
+
+
+def test_import_route_errors(client):
+    register(client, "omar")
+    response = client.post("/users/omar/cities/import", content=b"{broken", params={"format": "geojson"})
+    assert response.status_code == 400
+    assert client.post("/users/omar/cities/import", content=b"x", params={"format": "kml"}).status_code in (400, 422)
+    assert client.post("/users/nobody/cities/import", content=NDJSON.encode("utf-8")).status_code == 404
+    assert client.get("/users/omar/cities/import/missing").status_code == 404
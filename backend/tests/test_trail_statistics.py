@@ -0,0 +1,49 @@
+# backend/tests/test_trail_statistics.py
+# 向量化统计引擎：距离、国家、交通方式、年月分组，以及一致性检查接口
+
+from backend.business_logic_layer.trail_statistics import (
+    cities_to_columns, compute_trail_statistics, float_column, haversine_km,
+)
+from backend.data_access_layer.trail_aggregates import segment_km
+
+from .conftest import TRAIL_CITIES, make_city, register
+
+
+def test_haversine_matches_scalar_segment():
+    tokyo, paris = TRAIL_CITIES[0], TRAIL_CITIES[2]
+    distance = float(haversine_km(tokyo["latitude"], tokyo["longitude"], paris["latitude"], paris["longitude"]))
+    assert abs(distance - segment_km(tokyo, paris)) < 1e-6
+    assert 9700 < distance < 9750
+
+
+def test_engine_groups_by_arriving_transport_mode_country_and_month():
+    stats = compute_trail_statistics(cities_to_columns(TRAIL_CITIES))
+    assert (stats["city_count"], stats["unique_city_count"], stats["country_count"]) == (5, 4, 2)
+    assert stats["countries"] == {"日本": 3, "法国": 2}
+    # 第 i 段路程计入到达城市 i 的交通方式
+    tokyo_kyoto = float(haversine_km(35.68, 139.69, 35.01, 135.77))
+    assert stats["transport_modes"]["train"] == {"cities": 1, "segments": 1, "distance_km": round(tokyo_kyoto, 3)}
+    assert stats["transport_modes"]["plane"]["segments"] == 1  # 第一个城市没有到达的路程
+    assert stats["by_year"] == {"2023": 3, "2024": 1}
+    assert (stats["first_visit_month"], stats["last_visit_month"]) == ("2023-04", "2024-01")
+
+
+def test_engine_handles_empty_and_missing_coordinates():
+    empty = compute_trail_statistics(cities_to_columns([]))
+    assert (empty["city_count"], empty["total_distance_km"], empty["transport_modes"]) == (0, 0, {})
+    cities = [make_city("甲", latitude=None, longitude=None), make_city("乙"), make_city("丙", latitude=35.0, longitude=135.0)]
+    stats = compute_trail_statistics(cities_to_columns(cities))
+    # 缺少坐标的一段不计距离，也不计入路程数
+    assert stats["transport_modes"]["unknown"]["segments"] == 1
+    assert float_column([1, None, "x", "2.5"]).tolist()[::3] == [1.0, 2.5]
+
+
+def test_consistency_route_compares_stored_and_computed(client):
+    register(client, "tara")
+    for city in TRAIL_CITIES:
+        assert client.post("/users/tara/cities", json=city).status_code == 201
+    response = client.get("/users/tara/stats/consistency")
+    assert response.status_code == 200
+    body = response.json()
+    assert body["consistent"] is True and body["differences"] == {}
+    assert client.get("/users/nobody/stats/consistency").status_code == 404